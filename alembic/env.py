@@ -7,7 +7,7 @@ from alembic import context
 
 from app.core.config import settings
 from app.models.models import Base
-from app.models.models import User, Post, Like, Comment, Follow, Notification, Conversation, Message
+from app.models.models import User, Post, Like, Comment, Follow, Timeline, Suggestion, Upload, UserSession, Notification, Conversation, Message
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -0,0 +1,30 @@
+"""add feed keyset indexes on post
+
+Revision ID: 3f1c2a9d7b40
+Revises: 82e9d6fc5c96
+Create Date: 2026-10-18 09:12:31.204518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f1c2a9d7b40'
+down_revision: Union[str, Sequence[str], None] = '82e9d6fc5c96'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_post_feed', 'post', ['hidden_tag', 'created_at', 'id'], unique=False)
+    op.create_index('ix_post_user_feed', 'post', ['user_id', 'created_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_post_user_feed', table_name='post')
+    op.drop_index('ix_post_feed', table_name='post')
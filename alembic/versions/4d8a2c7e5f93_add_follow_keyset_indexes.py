@@ -0,0 +1,33 @@
+"""add keyset indexes of the follower and followed lists
+
+Revision ID: 4d8a2c7e5f93
+Revises: f0c83d2a6b19
+Create Date: 2026-10-18 21:08:44.392815
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4d8a2c7e5f93'
+down_revision: Union[str, Sequence[str], None] = 'f0c83d2a6b19'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_follow_followed_created', 'follow', ['followed_id', 'created_at', 'id'], unique=False)
+    op.create_index('ix_follow_follower_created', 'follow', ['follower_id', 'created_at', 'id'], unique=False)
+    # its column leads ix_follow_followed_created
+    op.drop_index('ix_follow_followed', table_name='follow')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_index('ix_follow_followed', 'follow', ['followed_id'], unique=False)
+    op.drop_index('ix_follow_follower_created', table_name='follow')
+    op.drop_index('ix_follow_followed_created', table_name='follow')
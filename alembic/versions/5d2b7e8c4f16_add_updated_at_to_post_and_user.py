@@ -0,0 +1,30 @@
+"""add updated_at column to post and utilisateur tables
+
+Revision ID: 5d2b7e8c4f16
+Revises: c81d5e0f9a37
+Create Date: 2026-10-18 14:02:47.318220
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d2b7e8c4f16'
+down_revision: Union[str, Sequence[str], None] = 'c81d5e0f9a37'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('post', sa.Column('updated_at', sa.DateTime(), nullable=True, server_default=sa.func.now()))
+    op.add_column('utilisateur', sa.Column('updated_at', sa.DateTime(), nullable=True, server_default=sa.func.now()))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('utilisateur', 'updated_at')
+    op.drop_column('post', 'updated_at')
@@ -0,0 +1,47 @@
+"""add timeline table for the fan-out on write home feed
+
+Revision ID: 7c4e91b2d5a8
+Revises: 3f1c2a9d7b40
+Create Date: 2026-10-18 10:02:47.518330
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c4e91b2d5a8'
+down_revision: Union[str, Sequence[str], None] = '3f1c2a9d7b40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'timeline',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('post_id', sa.Integer(), nullable=False),
+        sa.Column('author_id', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['utilisateur.id']),
+        sa.ForeignKeyConstraint(['post_id'], ['post.id']),
+        sa.ForeignKeyConstraint(['author_id'], ['utilisateur.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'post_id', name='unique_timeline_post'),
+    )
+    op.create_index('ix_timeline_user_feed', 'timeline', ['user_id', 'created_at', 'post_id'], unique=False)
+    op.create_index('ix_timeline_user_author', 'timeline', ['user_id', 'author_id'], unique=False)
+    op.create_index('ix_timeline_post', 'timeline', ['post_id'], unique=False)
+    # existing follows are backfilled with `make timeline-rebuild`
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_timeline_post', table_name='timeline')
+    op.drop_index('ix_timeline_user_author', table_name='timeline')
+    op.drop_index('ix_timeline_user_feed', table_name='timeline')
+    op.drop_table('timeline')
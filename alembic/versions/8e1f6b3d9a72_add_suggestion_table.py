@@ -0,0 +1,41 @@
+"""add suggestion table for the precomputed follow suggestions
+
+Revision ID: 8e1f6b3d9a72
+Revises: 4d8a2c7e5f93
+Create Date: 2026-10-18 21:47:19.604258
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8e1f6b3d9a72'
+down_revision: Union[str, Sequence[str], None] = '4d8a2c7e5f93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # filled by `python -m app.services.suggestions`
+    op.create_table(
+        'suggestion',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('suggested_id', sa.Integer(), nullable=False),
+        sa.Column('mutuals', sa.Integer(), nullable=False),
+        sa.Column('score', sa.Float(), nullable=False),
+        sa.Column('computed_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['utilisateur.id']),
+        sa.ForeignKeyConstraint(['suggested_id'], ['utilisateur.id']),
+        sa.PrimaryKeyConstraint('user_id', 'suggested_id')
+    )
+    op.create_index('ix_suggestion_user_score', 'suggestion', ['user_id', 'score'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_suggestion_user_score', table_name='suggestion')
+    op.drop_table('suggestion')
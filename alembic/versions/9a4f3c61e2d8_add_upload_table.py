@@ -0,0 +1,35 @@
+"""add upload table for content-addressed pictures
+
+Revision ID: 9a4f3c61e2d8
+Revises: 5d2b7e8c4f16
+Create Date: 2026-10-18 15:37:12.904611
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9a4f3c61e2d8'
+down_revision: Union[str, Sequence[str], None] = '5d2b7e8c4f16'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # pictures uploaded before have a flat uuid name and no row, they are never released
+    op.create_table(
+        'upload',
+        sa.Column('name', sa.String(length=255), nullable=False),
+        sa.Column('ref_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('upload')
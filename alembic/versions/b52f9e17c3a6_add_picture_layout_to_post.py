@@ -0,0 +1,33 @@
+"""add width, height and blurhash of the picture to post
+
+Revision ID: b52f9e17c3a6
+Revises: e3b7a0d94c21
+Create Date: 2026-10-18 19:12:36.540127
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b52f9e17c3a6'
+down_revision: Union[str, Sequence[str], None] = 'e3b7a0d94c21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # nullable: the existing posts are filled by `python -m app.services.placeholders`
+    op.add_column('post', sa.Column('width', sa.Integer(), nullable=True))
+    op.add_column('post', sa.Column('height', sa.Integer(), nullable=True))
+    op.add_column('post', sa.Column('blurhash', sa.String(length=64), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('post', 'blurhash')
+    op.drop_column('post', 'height')
+    op.drop_column('post', 'width')
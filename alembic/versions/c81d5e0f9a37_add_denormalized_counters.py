@@ -0,0 +1,48 @@
+"""add denormalized like, comment and follow counters
+
+Revision ID: c81d5e0f9a37
+Revises: 7c4e91b2d5a8
+Create Date: 2026-10-18 11:20:05.733914
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c81d5e0f9a37'
+down_revision: Union[str, Sequence[str], None] = '7c4e91b2d5a8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('post', sa.Column('like_count', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('post', sa.Column('comment_count', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('utilisateur', sa.Column('follower_count', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('utilisateur', sa.Column('following_count', sa.Integer(), nullable=False, server_default='0'))
+    op.create_index('ix_like_post', 'like', ['post_id'], unique=False)
+    op.create_index('ix_comment_post', 'comment', ['post_id', 'created_at'], unique=False)
+    op.create_index('ix_follow_followed', 'follow', ['followed_id'], unique=False)
+
+    # initial values, later drift is fixed by `make counters-repair`
+    op.execute('UPDATE post SET like_count = (SELECT count(*) FROM "like" WHERE "like".post_id = post.id)')
+    op.execute('UPDATE post SET comment_count = (SELECT count(*) FROM comment WHERE comment.post_id = post.id)')
+    op.execute('UPDATE utilisateur SET follower_count = '
+               '(SELECT count(*) FROM follow WHERE follow.followed_id = utilisateur.id)')
+    op.execute('UPDATE utilisateur SET following_count = '
+               '(SELECT count(*) FROM follow WHERE follow.follower_id = utilisateur.id)')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_follow_followed', table_name='follow')
+    op.drop_index('ix_comment_post', table_name='comment')
+    op.drop_index('ix_like_post', table_name='like')
+    op.drop_column('utilisateur', 'following_count')
+    op.drop_column('utilisateur', 'follower_count')
+    op.drop_column('post', 'comment_count')
+    op.drop_column('post', 'like_count')
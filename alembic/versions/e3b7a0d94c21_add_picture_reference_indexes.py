@@ -0,0 +1,30 @@
+"""add indexes on the picture references for the uploads sweeper
+
+Revision ID: e3b7a0d94c21
+Revises: 9a4f3c61e2d8
+Create Date: 2026-10-18 18:04:51.218734
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e3b7a0d94c21'
+down_revision: Union[str, Sequence[str], None] = '9a4f3c61e2d8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_post_image_url', 'post', ['image_url'], unique=False)
+    op.create_index('ix_utilisateur_profile_picture', 'utilisateur', ['profile_picture'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_utilisateur_profile_picture', table_name='utilisateur')
+    op.drop_index('ix_post_image_url', table_name='post')
@@ -0,0 +1,42 @@
+"""add user_session table for the refresh tokens
+
+Revision ID: f0c83d2a6b19
+Revises: b52f9e17c3a6
+Create Date: 2026-10-18 20:26:03.771592
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f0c83d2a6b19'
+down_revision: Union[str, Sequence[str], None] = 'b52f9e17c3a6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'user_session',
+        sa.Column('id', sa.String(length=32), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('refresh_hash', sa.String(length=64), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.Column('revoked_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['utilisateur.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_user_session_user', 'user_session', ['user_id'], unique=False)
+    op.create_index('ix_user_session_revoked', 'user_session', ['revoked_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_user_session_revoked', table_name='user_session')
+    op.drop_index('ix_user_session_user', table_name='user_session')
+    op.drop_table('user_session')
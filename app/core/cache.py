@@ -0,0 +1,269 @@
+"""Response cache: in-process LRU in front of an optional shared backend.
+
+Entries are keyed by the version stamps of the data they render ("feed", "likes:<post_id>",
+"profile:<username>"). A write bumps the stamps it touches once its transaction is committed,
+so the next read looks up a new key and the old entries age out of the LRU.
+
+The stamps live in the shared backend when CACHE_URL is set, every worker then sees a bump at
+once. Without it they are per worker: the other workers serve their copy until CACHE_TTL.
+
+The cached routes render their misses from get_read_db. The writer reads from the primary after
+its commit (app.core.replicas.recent_writers), so its own write is in the body cached under the
+stamps it bumped. A miss rendered by another user from a replica that has not replayed the write
+yet is cached under the new stamps: it is served until the next bump or CACHE_TTL, keep CACHE_TTL
+short when the replicas lag.
+
+The shared backend is a blocking client. The routes call the cache from their sync body, which
+DATABASE_ASYNC runs on the event loop: there the calls are sent to a thread (see _off_loop). A
+backend error is logged and the cache falls back to the worker: a miss for a body, the local
+stamps for the versions. A cache outage slows the API down, it does not fail requests.
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Iterable, Optional
+
+from pydantic import BaseModel
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.util import await_only
+from sqlalchemy.util.concurrency import in_greenlet
+from starlette.responses import Response
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _off_loop(fn, *args):
+    """Blocking backend I/O outside the event loop: in a thread when called from the greenlet of an
+        AsyncSession (the route bodies under DATABASE_ASYNC), inline from the threadpool otherwise"""
+    if in_greenlet():
+        return await_only(asyncio.to_thread(fn, *args))
+    return fn(*args)
+
+
+class LRUCache:
+    """Bounded mapping key -> (expires_at, value), the least recently read key is dropped first"""
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, value: bytes):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class LocalBackend:
+    """In-process stand-in of the shared backend (CACHE_URL=local), for tests and single worker setups"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values: dict[str, tuple[Optional[float], bytes]] = {}
+
+    def get(self, key: str) -> Optional[bytes]:
+        entry = self.values.get(key)
+        if entry is None or (entry[0] is not None and entry[0] < time.monotonic()):
+            return None
+        return entry[1]
+
+    def mget(self, keys: list[str]) -> list[Optional[bytes]]:
+        return [self.get(key) for key in keys]
+
+    def set(self, key: str, value: bytes, ttl: float):
+        with self.lock:
+            self.values[key] = (time.monotonic() + ttl, value)
+
+    def incr(self, key: str) -> int:
+        with self.lock:
+            value = int(self.get(key) or 0) + 1
+            self.values[key] = (None, str(value).encode())
+            return value
+
+    def clear(self):
+        with self.lock:
+            self.values.clear()
+
+
+class RedisBackend:
+    """Shared backend on redis (CACHE_URL=redis://...). Its keys are under PREFIX, the database may hold other data"""
+    PREFIX = "valapi:cache:"
+    # seconds before a call to an unreachable redis gives up, the request then goes on without it
+    TIMEOUT = 0.5
+
+    def __init__(self, url: str):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("CACHE_URL=redis://... needs the redis package") from e
+        self.client = redis.Redis.from_url(url, socket_timeout=self.TIMEOUT, socket_connect_timeout=self.TIMEOUT)
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.client.get(self.PREFIX + key)
+
+    def mget(self, keys: list[str]) -> list[Optional[bytes]]:
+        return self.client.mget([self.PREFIX + key for key in keys])
+
+    def set(self, key: str, value: bytes, ttl: float):
+        self.client.set(self.PREFIX + key, value, ex=max(1, int(ttl)))
+
+    def incr(self, key: str) -> int:
+        return self.client.incr(self.PREFIX + key)
+
+    def clear(self):
+        """Deletes the keys of the cache only"""
+        batch = []
+        for key in self.client.scan_iter(match=self.PREFIX + "*", count=1000):
+            batch.append(key)
+            if len(batch) == 1000:
+                self.client.delete(*batch)
+                batch = []
+        if batch:
+            self.client.delete(*batch)
+
+
+def shared_backend(url: str):
+    if not url:
+        return None
+    if url == "local":
+        return LocalBackend()
+    return RedisBackend(url)
+
+
+class ResponseCache:
+    def __init__(self, local: LRUCache, shared=None):
+        self.local = local
+        self.shared = shared
+        self.lock = threading.Lock()
+        self.versions: dict[str, int] = {}
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.bumps = 0
+        self.errors = 0
+
+    def _shared(self, method: str, *args, default=None):
+        """Call of the shared backend off the event loop, `default` when it fails"""
+        try:
+            return _off_loop(getattr(self.shared, method), *args)
+        except Exception as e:
+            self.errors += 1
+            logger.warning("shared cache %s failed: %s", method, e)
+            return default
+
+    def stamp(self, names: Iterable[str]) -> str:
+        """Current versions of the stamps, as a key suffix"""
+        names = list(names)
+        if self.shared is not None:
+            versions = self._shared("mget", [f"version:{n}" for n in names])
+            if versions is not None:
+                return ".".join(str(int(v or 0)) for v in versions)
+        # per worker stamps, or the shared backend is down: keys apart from the shared ones
+        return "local." + ".".join(str(self.versions.get(n, 0)) for n in names)
+
+    def bump(self, *names: str):
+        """Bumps the local stamps, which keep the cache right on this worker if the backend fails, then the shared ones"""
+        with self.lock:
+            self.bumps += len(names)
+            for name in names:
+                self.versions[name] = self.versions.get(name, 0) + 1
+        if self.shared is not None:
+            for name in names:
+                self._shared("incr", f"version:{name}")
+
+    def get(self, key: str) -> Optional[bytes]:
+        body = self.local.get(key)
+        if body is not None:
+            self.hits += 1
+            return body
+        if self.shared is not None:
+            body = self._shared("get", key)
+            if body is not None:
+                self.shared_hits += 1
+                self.local.set(key, body)
+                return body
+        self.misses += 1
+        return None
+
+    def peek(self, key: str) -> Optional[bytes]:
+        """Lookup that does not count in the hit/miss counters"""
+        body = self.local.get(key)
+        if body is None and self.shared is not None:
+            body = self._shared("get", key)
+        return body
+
+    def set(self, key: str, body: bytes):
+        self.local.set(key, body)
+        if self.shared is not None:
+            self._shared("set", key, body, self.local.ttl)
+
+    def response(self, key: str, stamps: Iterable[str], render: Callable[[], BaseModel]) -> Response:
+        """JSON response of `render()` cached under the key and the current versions of the stamps.
+            The versions are read before rendering, a write committed meanwhile bumps them past this entry"""
+        key = f"{key}@{self.stamp(stamps)}"
+        body = self.get(key)
+        if body is None:
+            body = render().model_dump_json().encode()
+            self.set(key, body)
+        return Response(content=body, media_type="application/json")
+
+    def clear(self):
+        self.local.clear()
+        if self.shared is not None:
+            self._shared("clear")
+        with self.lock:
+            self.versions.clear()
+
+    def metrics(self) -> dict:
+        lookups = self.hits + self.shared_hits + self.misses
+        return {
+            "backend": type(self.shared).__name__ if self.shared is not None else None,
+            "entries": len(self.local.entries),
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.hits + self.shared_hits) / lookups, 3) if lookups else 0.0,
+            "bumps": self.bumps,
+            "errors": self.errors,
+        }
+
+
+response_cache = ResponseCache(LRUCache(settings.CACHE_SIZE, settings.CACHE_TTL), shared_backend(settings.CACHE_URL))
+
+
+def invalidate(db: Session, *names: str):
+    """Bumps the stamps once the session commits, a rollback drops them"""
+    db.info.setdefault("cache_bumps", set()).update(names)
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_on_commit(session):
+    names = session.info.pop("cache_bumps", None)
+    if names:
+        response_cache.bump(*names)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_on_rollback(session):
+    session.info.pop("cache_bumps", None)
@@ -7,7 +7,37 @@ from fastapi_mqtt import MQTTConfig, FastMQTT
 class Settings(BaseSettings):
     DATABASE_URL: str = Field(..., alias="DATABASE_URL")
     DATABASE_URL_TEST: str = Field(..., alias="DATABASE_URL_TEST")
+    # async engine (asyncpg) and async sessions for the routes, the sync engine is kept for the jobs and alembic
+    DATABASE_ASYNC: bool = Field(False, alias="DATABASE_ASYNC")
+    # connection pool of each worker, see app.core.pool_metrics to size it
+    DB_POOL_SIZE: int = Field(5, alias="DB_POOL_SIZE")
+    DB_MAX_OVERFLOW: int = Field(10, alias="DB_MAX_OVERFLOW")
+    DB_POOL_TIMEOUT: float = Field(30, alias="DB_POOL_TIMEOUT")
+    DB_POOL_RECYCLE: int = Field(1800, alias="DB_POOL_RECYCLE")
+    DB_POOL_PRE_PING: bool = Field(True, alias="DB_POOL_PRE_PING")
+    # comma separated urls of read replicas used by the read-only routes
+    DATABASE_REPLICA_URLS: str = Field("", alias="DATABASE_REPLICA_URLS")
+    REPLICA_HEALTH_INTERVAL: float = Field(10, alias="REPLICA_HEALTH_INTERVAL")
+    READ_YOUR_WRITES_SECONDS: float = Field(5, alias="READ_YOUR_WRITES_SECONDS")
+    # response cache, see app.core.cache: empty CACHE_URL keeps it per worker, "local" or redis://... shares it
+    CACHE_URL: str = Field("", alias="CACHE_URL")
+    CACHE_SIZE: int = Field(1024, alias="CACHE_SIZE")
+    CACHE_TTL: float = Field(60, alias="CACHE_TTL")
     SECRET_KEY: str = Field(..., alias="SECRET_KEY")
+    # access tokens are refreshed with a refresh token (app.services.sessions), revocations reach the other workers after SESSION_SYNC_INTERVAL
+    ACCESS_TOKEN_MINUTES: int = Field(15, alias="ACCESS_TOKEN_MINUTES")
+    REFRESH_TOKEN_DAYS: int = Field(30, alias="REFRESH_TOKEN_DAYS")
+    SESSION_SYNC_INTERVAL: float = Field(5, alias="SESSION_SYNC_INTERVAL")
+    # verified tokens kept per worker, see app.core.tokens: JWT_CACHE_SIZE=0 verifies every request
+    JWT_CACHE_SIZE: int = Field(10000, alias="JWT_CACHE_SIZE")
+    JWT_CACHE_TTL: float = Field(300, alias="JWT_CACHE_TTL")
+    # password hashing, see app.core.passwords: changing the cost rehashes the accounts at their next login
+    ARGON2_TIME_COST: int = Field(3, alias="ARGON2_TIME_COST")
+    ARGON2_MEMORY_COST: int = Field(65536, alias="ARGON2_MEMORY_COST")
+    ARGON2_PARALLELISM: int = Field(4, alias="ARGON2_PARALLELISM")
+    PASSWORD_WORKERS: int = Field(2, alias="PASSWORD_WORKERS")
+    PASSWORD_QUEUE_MAX: int = Field(32, alias="PASSWORD_QUEUE_MAX")
+    PASSWORD_RETRY_AFTER: int = Field(1, alias="PASSWORD_RETRY_AFTER")
 
     POSTGRES_DB: Optional[str] = Field(None, alias="POSTGRES_DB")
     POSTGRES_USER: Optional[str] = Field(None, alias="POSTGRES_USER")
@@ -17,6 +47,30 @@ class Settings(BaseSettings):
     MQTT_USER: str = Field(..., alias="MQTT_USER")
     MQTT_PASSWORD: str = Field(..., alias="MQTT_PASSWORD")
 
+    # home timeline: authors above this follower count are pulled at read time instead of fanned out on write
+    TIMELINE_FANOUT_MAX_FOLLOWERS: int = Field(10000, alias="TIMELINE_FANOUT_MAX_FOLLOWERS")
+    TIMELINE_BACKFILL_SIZE: int = Field(100, alias="TIMELINE_BACKFILL_SIZE")
+    # follow graph index of each worker (app.services.graph), reloaded from the database every interval
+    FOLLOW_GRAPH_ENABLED: bool = Field(True, alias="FOLLOW_GRAPH_ENABLED")
+    FOLLOW_GRAPH_SYNC_INTERVAL: float = Field(300, alias="FOLLOW_GRAPH_SYNC_INTERVAL")
+    # follow suggestions kept per user by app.services.suggestions, which skips the accounts following
+    # more than SUGGESTION_MAX_FANOUT others when walking the graph
+    SUGGESTION_COUNT: int = Field(20, alias="SUGGESTION_COUNT")
+    SUGGESTION_MAX_FANOUT: int = Field(2000, alias="SUGGESTION_MAX_FANOUT")
+
+    # image transcoding process pool of each worker, see app.core.images
+    IMAGE_WORKERS: int = Field(2, alias="IMAGE_WORKERS")
+    IMAGE_QUEUE_MAX: int = Field(16, alias="IMAGE_QUEUE_MAX")
+    IMAGE_RETRY_AFTER: int = Field(2, alias="IMAGE_RETRY_AFTER")
+    # formats stored next to the jpg renditions, skipped when Pillow cannot encode them
+    IMAGE_FORMATS: str = Field("webp,avif", alias="IMAGE_FORMATS")
+    # uploads larger than this are cut while they are received, images above this many pixels are refused from their header
+    UPLOAD_MAX_BYTES: int = Field(20 * 1024 * 1024, alias="UPLOAD_MAX_BYTES")
+    IMAGE_MAX_PIXELS: int = Field(40_000_000, alias="IMAGE_MAX_PIXELS")
+    # pictures handed to the proxy instead of being streamed by the worker: "", "x-accel-redirect" or "x-sendfile"
+    STATIC_SENDFILE: str = Field("", alias="STATIC_SENDFILE")
+    STATIC_ACCEL_PREFIX: str = Field("/_uploads/", alias="STATIC_ACCEL_PREFIX")
+
     class Config:
         env_file = ".env"
         populate_by_name = True
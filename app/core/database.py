@@ -1,15 +1,160 @@
+import asyncio
+import functools
+import logging
+from typing import Optional
+
+from fastapi import Depends
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.orm import sessionmaker, Session
+from starlette.concurrency import run_in_threadpool
+
 from app.core.config import settings
+from app.core.pool_metrics import pool_options, instrument
+from app.core.replicas import ReplicaSet, recent_writers
+from app.core.utils import optional_user_id
+
+logger = logging.getLogger(__name__)
 
 DATABASE_URL = settings.DATABASE_URL
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# responses are serialized once the session work is done, committed objects must stay readable
+engine = create_engine(DATABASE_URL, **pool_options())
+instrument("primary", engine)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+
+
+def async_database_url(url: str) -> str:
+    """Same database through an async driver (asyncpg, aiosqlite for local sqlite files)"""
+    url = make_url(url)
+    if url.get_backend_name() == "postgresql":
+        url = url.set(drivername="postgresql+asyncpg")
+    elif url.get_backend_name() == "sqlite":
+        url = url.set(drivername="sqlite+aiosqlite")
+    return url.render_as_string(hide_password=False)
+
 
-def get_db():
-    db = SessionLocal()
+async_engine = None
+AsyncSessionLocal = None
+if settings.DATABASE_ASYNC:
+    async_engine = create_async_engine(async_database_url(DATABASE_URL), **pool_options(is_async=True))
+    instrument("primary_async", async_engine.sync_engine)
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+REPLICA_URLS = [url.strip() for url in settings.DATABASE_REPLICA_URLS.split(",") if url.strip()]
+if settings.DATABASE_ASYNC:
+    replica_engines = [create_async_engine(async_database_url(url), **pool_options(is_async=True))
+                       for url in REPLICA_URLS]
+    replica_sessions = [async_sessionmaker(e, autoflush=False, expire_on_commit=False) for e in replica_engines]
+    replicas = ReplicaSet([e.sync_engine for e in replica_engines])
+else:
+    replica_engines = [create_engine(url, **pool_options()) for url in REPLICA_URLS]
+    replica_sessions = [sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=e)
+                        for e in replica_engines]
+    replicas = ReplicaSet(replica_engines)
+for index, sync_engine in enumerate(replicas.engines):
+    instrument(f"replica_{index}", sync_engine)
+
+
+def _get_sync_db(user_id: Optional[int] = Depends(optional_user_id)):
+    # the user_id lets the commit of a write keep this user's next reads on the primary
+    db = SessionLocal(info={"user_id": user_id})
     try:
         yield db
     finally:
         db.close()
+
+
+async def _get_async_db(user_id: Optional[int] = Depends(optional_user_id)):
+    async with AsyncSessionLocal(info={"user_id": user_id}) as db:
+        yield db
+
+
+# DATABASE_ASYNC picks the session handed to the routes, the route code is the same for both
+get_db = _get_async_db if settings.DATABASE_ASYNC else _get_sync_db
+
+
+def _replica_index(user_id: Optional[int]) -> Optional[int]:
+    """Replica serving this read, None for the primary (no healthy replica or a user who just wrote)"""
+    if not replica_sessions or recent_writers.sticky(user_id):
+        return None
+    return replicas.pick()
+
+
+def _get_sync_read_db(primary: Session = Depends(get_db), user_id: Optional[int] = Depends(optional_user_id)):
+    index = _replica_index(user_id)
+    if index is None:
+        yield primary
+        return
+    db = replica_sessions[index]()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def _get_async_read_db(primary: AsyncSession = Depends(get_db),
+                             user_id: Optional[int] = Depends(optional_user_id)):
+    index = _replica_index(user_id)
+    if index is None:
+        yield primary
+        return
+    async with replica_sessions[index]() as db:
+        yield db
+
+
+# session of the read-only routes: a replica when one is configured and healthy, the primary otherwise
+get_read_db = _get_async_read_db if settings.DATABASE_ASYNC else _get_sync_read_db
+
+
+def _check_replica(index: int):
+    with replicas.engines[index].connect() as connection:
+        replicas.check(index, connection)
+
+
+async def _check_async_replica(index: int):
+    async with replica_engines[index].connect() as connection:
+        await connection.run_sync(lambda sync_connection: replicas.check(index, sync_connection))
+
+
+async def check_replicas():
+    """Health check of every replica, brings back the ones marked down once they answer again.
+        A replica that does not answer within REPLICA_HEALTH_INTERVAL is marked down"""
+    for index in range(len(replica_engines)):
+        check = _check_async_replica(index) if settings.DATABASE_ASYNC else run_in_threadpool(_check_replica, index)
+        try:
+            await asyncio.wait_for(check, settings.REPLICA_HEALTH_INTERVAL)
+        except Exception as e:
+            replicas.mark_down(index, e)
+
+
+async def replica_health_loop():
+    while True:
+        await check_replicas()
+        await asyncio.sleep(settings.REPLICA_HEALTH_INTERVAL)
+
+
+def upsert(db: Session, table):
+    """INSERT supporting ON CONFLICT for the dialect of the session"""
+    dialect = db.get_bind().dialect.name
+    return (postgresql.insert if dialect == "postgresql" else sqlite.insert)(table)
+
+
+async def run_db(db, fn, *args, **kwargs):
+    """Runs sync ORM code `fn(session, *args, **kwargs)` with the request session:
+        on the event loop through the greenlet bridge of an AsyncSession, in the threadpool for a sync Session"""
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args, **kwargs)
+    return await run_in_threadpool(fn, db, *args, **kwargs)
+
+
+def db_route(endpoint):
+    """Turns a sync endpoint taking a `db` session into a coroutine that runs its body with run_db.
+        FastAPI still reads the parameters of the wrapped endpoint"""
+    @functools.wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        db = kwargs.pop("db")
+        return await run_db(db, lambda session: endpoint(*args, db=session, **kwargs))
+    return wrapper
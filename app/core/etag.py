@@ -0,0 +1,36 @@
+"""Weak ETags computed from version columns (updated_at, counters) before a response is rendered.
+
+A client polling with If-None-Match gets a 304 without the body being built nor serialized.
+"""
+import hashlib
+from typing import Callable, Union
+
+from fastapi import Request
+from pydantic import BaseModel
+from starlette.responses import Response
+
+
+def weak_etag(*versions) -> str:
+    digest = hashlib.blake2b(repr(versions).encode(), digest_size=12).hexdigest()
+    return f'W/"{digest}"'
+
+
+def not_modified(request: Request, etag: str) -> bool:
+    """Weak comparison of the ETag with the If-None-Match header"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in tags
+
+
+def etag_response(request: Request, etag: str, render: Callable[[], Union[BaseModel, Response]]) -> Response:
+    """304 when the client already has this version, the rendered JSON with its ETag otherwise"""
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    result = render()
+    if not isinstance(result, Response):
+        result = Response(content=result.model_dump_json(), media_type="application/json")
+    result.headers.update(headers)
+    return result
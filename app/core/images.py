@@ -0,0 +1,218 @@
+"""Image transcoding off the event loop.
+
+Decoding, resizing and encoding an upload takes hundreds of milliseconds of CPU, so it runs in a
+process pool of IMAGE_WORKERS processes per API worker. At most IMAGE_QUEUE_MAX uploads wait or
+run at once, the next ones get a 503 with Retry-After instead of piling up behind them.
+
+Each upload is encoded as renditions (thumb, medium, full) in JPEG and in the modern formats of
+IMAGE_FORMATS that Pillow can encode. The full JPEG is the name of the picture, the others are
+named `<stem>.<rendition>.<ext>`, and pictures uploaded before the renditions only have the former.
+The files are stored by app.services.storage.
+
+Before anything is decoded, the dimensions are read from the header of the upload and images above
+IMAGE_MAX_PIXELS are refused. A JPEG is then decoded in draft mode, the decoder scaling it by 1/2,
+1/4 or 1/8 down to the smallest size still covering the full rendition.
+"""
+import hashlib
+import io
+import math
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple, Optional
+
+from fastapi import HTTPException
+from PIL import Image, UnidentifiedImageError, features
+
+from app.core.config import settings
+from app.core.pool import BoundedPool
+
+# rendition -> bounding box, from the largest: each one is resized from the previous
+RENDITIONS = {"full": (1920, 1080), "medium": (1080, 1080), "thumb": (320, 320)}
+
+# format -> (Pillow format, extension, media type, encoder options)
+FORMATS = {
+    "jpeg": ("JPEG", "jpg", "image/jpeg", {"quality": 50, "optimize": True}),
+    "webp": ("WEBP", "webp", "image/webp", {"quality": 60, "method": 4}),
+    "avif": ("AVIF", "avif", "image/avif", {"quality": 50, "speed": 8}),
+}
+
+
+def output_formats() -> tuple[str, ...]:
+    """JPEG, and the formats of IMAGE_FORMATS this Pillow build can encode"""
+    wanted = [f.strip() for f in settings.IMAGE_FORMATS.split(",") if f.strip() in FORMATS]
+    return ("jpeg", *(f for f in wanted if f != "jpeg" and features.check(f)))
+
+
+def rendition_name(filename: str, rendition: str = "full", fmt: str = "jpeg") -> str:
+    if rendition == "full" and fmt == "jpeg":
+        return filename
+    return f"{filename.rsplit('.', 1)[0]}.{rendition}.{FORMATS[fmt][1]}"
+
+
+def rendition_urls(filename: str) -> dict[str, str]:
+    """URL of each rendition of a picture, the client picks the size it displays"""
+    return {
+        rendition: f"/user/picture/{filename}" + ("" if rendition == "full" else f"?size={rendition}")
+        for rendition in RENDITIONS
+    }
+
+
+def pick_rendition(folder: str, filename: str, rendition: str, accept: Optional[str]) -> tuple[str, str]:
+    """Path and media type of the most compact format the client accepts for this rendition,
+        the original upload when the rendition does not exist"""
+    accept = accept or ""
+    for fmt in ("avif", "webp", "jpeg"):
+        if fmt != "jpeg" and FORMATS[fmt][2] not in accept:
+            continue
+        path = os.path.join(folder, rendition_name(filename, rendition, fmt))
+        if os.path.exists(path):
+            return path, FORMATS[fmt][2]
+    return os.path.join(folder, filename), FORMATS["jpeg"][2]
+
+
+class Picture(NamedTuple):
+    """Encoded upload: name of its full JPEG, relative path -> bytes of every rendition,
+        and what a client needs to lay it out before downloading it: size of the full rendition and blurhash"""
+    name: str
+    files: dict[str, bytes]
+    width: Optional[int] = None
+    height: Optional[int] = None
+    blurhash: Optional[str] = None
+
+
+CONTENT_NAME = re.compile(r"^[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$")
+
+
+def content_name(data: bytes) -> str:
+    """Sharded content address of the normalized full JPEG: ab/cd/abcd...jpg"""
+    digest = hashlib.sha256(data).hexdigest()
+    return f"{digest[:2]}/{digest[2:4]}/{digest}.jpg"
+
+
+def is_content_name(filename: str) -> bool:
+    """Whether the picture is named after its content, its files then never change"""
+    return CONTENT_NAME.match(filename) is not None
+
+
+def check_header(data: bytes, max_pixels: int):
+    """Refuses an upload that is not an image, or is too large once decoded, from its header alone"""
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            width, height = image.size
+    except Image.DecompressionBombError:
+        raise HTTPException(status_code=413, detail="Image too large")
+    except (UnidentifiedImageError, OSError):
+        raise HTTPException(status_code=400, detail="Invalid image")
+    if width * height > max_pixels:
+        raise HTTPException(status_code=413, detail=f"Image too large: {width}x{height}, the limit is {max_pixels} pixels")
+
+
+def draft_size(size: tuple[int, int], box: tuple[int, int]) -> tuple[int, int]:
+    """Size of `size` scaled down to fit in `box`, the least the decoder has to produce"""
+    scale = min(box[0] / size[0], box[1] / size[1], 1)
+    return max(1, math.ceil(size[0] * scale)), max(1, math.ceil(size[1] * scale))
+
+
+BASE83 = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~"
+# sRGB byte -> linear intensity
+SRGB_TO_LINEAR = [v / 12.92 if v <= 0.04045 else ((v + 0.055) / 1.055) ** 2.4 for v in (i / 255 for i in range(256))]
+
+
+def _base83(value: int, length: int) -> str:
+    return "".join(BASE83[value // 83 ** (length - i - 1) % 83] for i in range(length))
+
+
+def _linear_to_srgb(value: float) -> int:
+    value = max(0.0, min(1.0, value))
+    if value <= 0.0031308:
+        return int(value * 12.92 * 255 + 0.5)
+    return int((1.055 * value ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def blurhash(image: Image.Image, components: tuple[int, int] = (4, 3)) -> str:
+    """Blurhash (https://blurha.sh) of an RGB image, computed on a 32 px copy: ~28 characters a client
+        decodes into a placeholder while the picture downloads"""
+    small = image.copy()
+    small.thumbnail((32, 32), Image.Resampling.BILINEAR)
+    width, height = small.size
+    pixels = [tuple(SRGB_TO_LINEAR[c] for c in pixel) for pixel in small.getdata()]
+    cx, cy = components
+
+    factors = []
+    for j in range(cy):
+        cos_y = [math.cos(math.pi * j * y / height) for y in range(height)]
+        for i in range(cx):
+            cos_x = [math.cos(math.pi * i * x / width) for x in range(width)]
+            r = g = b = 0.0
+            for y in range(height):
+                row = pixels[y * width:(y + 1) * width]
+                for x, (pr, pg, pb) in enumerate(row):
+                    basis = cos_x[x] * cos_y[y]
+                    r += basis * pr
+                    g += basis * pg
+                    b += basis * pb
+            scale = (1 if i == j == 0 else 2) / (width * height)
+            factors.append((r * scale, g * scale, b * scale))
+
+    dc, ac = factors[0], factors[1:]
+    result = _base83(cx - 1 + (cy - 1) * 9, 1)
+    if ac:
+        quantized_max = max(0, min(82, int(max(abs(v) for f in ac for v in f) * 166 - 0.5)))
+        max_value = (quantized_max + 1) / 166
+    else:
+        quantized_max, max_value = 0, 1
+    result += _base83(quantized_max, 1)
+    result += _base83((_linear_to_srgb(dc[0]) << 16) + (_linear_to_srgb(dc[1]) << 8) + _linear_to_srgb(dc[2]), 4)
+
+    def quantize(v: float) -> int:
+        return max(0, min(18, int(math.copysign(abs(v / max_value) ** 0.5, v) * 9 + 9.5)))
+
+    for r, g, b in ac:
+        result += _base83(quantize(r) * 19 * 19 + quantize(g) * 19 + quantize(b), 2)
+    return result
+
+
+def transcode(data: bytes, formats: tuple[str, ...] = ("jpeg",)) -> Picture:
+    """Reduced size, reduced quality renditions of an uploaded image, named after their content. Runs in the pool processes"""
+    image = Image.open(io.BytesIO(data))
+    # JPEG only, a no-op for the other formats
+    image.draft("RGB", draft_size(image.size, RENDITIONS["full"]))
+    if image.mode in ('RGBA', 'LA', 'P'):
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        if image.mode == 'P':
+            image = image.convert('RGBA')
+        background.paste(image, mask=image.split()[-1] if image.mode == 'RGBA' else None)
+        image = background
+    elif image.mode != 'RGB':
+        image = image.convert("RGB")
+
+    encoded = {}
+    for rendition, box in RENDITIONS.items():
+        image.thumbnail(box, Image.Resampling.LANCZOS)
+        if rendition == "full":
+            width, height = image.size
+        for fmt in formats:
+            pillow_format, _, _, options = FORMATS[fmt]
+            output = io.BytesIO()
+            image.save(output, pillow_format, **options)
+            encoded[rendition, fmt] = output.getvalue()
+
+    name = content_name(encoded["full", "jpeg"])
+    files = {rendition_name(name, rendition, fmt): data for (rendition, fmt), data in encoded.items()}
+    return Picture(name, files, width, height, blurhash(image))
+
+
+class ImagePool(BoundedPool):
+    """Bounded pool of processes: transcoding holds the GIL"""
+    busy_detail = "Too many uploads in progress, retry later"
+
+    def _executor(self) -> ProcessPoolExecutor:
+        # created on first use, spawned: the API worker has threads that a fork would copy mid-flight
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self.executor
+
+
+image_pool = ImagePool(settings.IMAGE_WORKERS, settings.IMAGE_QUEUE_MAX, settings.IMAGE_RETRY_AFTER)
@@ -0,0 +1,49 @@
+"""Size limit of the upload bodies, enforced while they are received.
+
+A request announcing a larger Content-Length is answered 413 before its body is read. A chunked
+one, or one lying about its length, is cut once UPLOAD_MAX_BYTES have been received: the form
+parser stops there and nothing beyond the limit is spooled to disk or kept in memory.
+"""
+from fastapi import HTTPException
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+
+
+class BodySizeLimit:
+    """ASGI middleware limiting the body of the requests to `paths` to UPLOAD_MAX_BYTES"""
+    def __init__(self, app: ASGIApp, paths: tuple[str, ...]):
+        self.app = app
+        self.paths = paths
+        self.rejected = 0
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            return await self.app(scope, receive, send)
+
+        limit = settings.UPLOAD_MAX_BYTES
+        length = dict(scope["headers"]).get(b"content-length")
+        if length is not None and length.isdigit() and int(length) > limit:
+            self.rejected += 1
+            response = JSONResponse({"detail": _too_large(limit)}, status_code=413, headers={"Connection": "close"})
+            return await response(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    self.rejected += 1
+                    # raised inside the body parsing of the route, answered as a 413 by FastAPI
+                    raise HTTPException(status_code=413, detail=_too_large(limit))
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+def _too_large(limit: int) -> str:
+    return f"Upload too large, the limit is {limit} bytes"
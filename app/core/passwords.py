@@ -0,0 +1,52 @@
+"""Argon2 password hashing off the request threadpool.
+
+A hash or a verification takes tens of milliseconds of CPU and ARGON2_MEMORY_COST KiB of memory.
+Run inline, a burst of logins would hold the threads every other sync route waits for, so they run
+in a dedicated pool of PASSWORD_WORKERS threads (argon2 releases the GIL) per API worker. At most
+PASSWORD_QUEUE_MAX of them wait or run at once, the next ones get a 503 with Retry-After. Keep
+PASSWORD_WORKERS below the number of cores, the rest of the API needs CPU to answer meanwhile.
+
+The cost parameters are settings. A login whose stored hash was made with other parameters is
+rehashed with the current ones, so raising the cost upgrades the accounts as their users log in.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from passlib.hash import argon2
+
+from app.core.config import settings
+from app.core.pool import BoundedPool
+
+hasher = argon2.using(
+    rounds=settings.ARGON2_TIME_COST,
+    memory_cost=settings.ARGON2_MEMORY_COST,
+    parallelism=settings.ARGON2_PARALLELISM,
+)
+
+
+class PasswordPool(BoundedPool):
+    """Bounded pool of threads: argon2 does not hold the GIL while hashing"""
+    busy_detail = "Too many logins in progress, retry later"
+
+    def _executor(self) -> ThreadPoolExecutor:
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix="argon2")
+        return self.executor
+
+
+password_pool = PasswordPool(settings.PASSWORD_WORKERS, settings.PASSWORD_QUEUE_MAX, settings.PASSWORD_RETRY_AFTER)
+
+
+def _verify(password: str, password_hash: str) -> tuple[bool, Optional[str]]:
+    if not hasher.verify(password, password_hash):
+        return False, None
+    return True, hasher.hash(password) if hasher.needs_update(password_hash) else None
+
+
+async def hash_password(password: str) -> str:
+    return await password_pool.run(hasher.hash, password)
+
+
+async def verify_password(password: str, password_hash: str) -> tuple[bool, Optional[str]]:
+    """Whether the password matches, and its hash with the current parameters when the stored one is outdated"""
+    return await password_pool.run(_verify, password, password_hash)
@@ -0,0 +1,46 @@
+"""Executor with a bound on the jobs waiting or running in it.
+
+CPU-heavy work (image transcoding, password hashing) runs off the event loop in a pool of its
+own. Past max_pending jobs in flight, the next ones get a 503 with Retry-After instead of piling
+up behind them.
+"""
+import asyncio
+from abc import ABC, abstractmethod
+from concurrent.futures import Executor
+from typing import Optional
+
+from fastapi import HTTPException
+
+
+class BoundedPool(ABC):
+    """Executor created on first use by `_executor`, jobs refused with a 503 `busy_detail` once max_pending are in flight"""
+    busy_detail = "Too many jobs in progress, retry later"
+
+    def __init__(self, workers: int, max_pending: int, retry_after: int, busy_detail: Optional[str] = None):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.retry_after = retry_after
+        self.busy_detail = busy_detail or self.busy_detail
+        self.pending = 0
+        self.rejected = 0
+        self.executor: Optional[Executor] = None
+
+    @abstractmethod
+    def _executor(self) -> Executor:
+        """The executor of the jobs, created on the first call"""
+
+    async def run(self, fn, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail=self.busy_detail,
+                                headers={"Retry-After": str(self.retry_after)})
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor(), fn, *args)
+        finally:
+            self.pending -= 1
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
@@ -0,0 +1,129 @@
+"""Connection pool statistics of this worker.
+
+Each uvicorn worker has its own pools, so the numbers are per process: size the pools so that
+workers x (DB_POOL_SIZE + DB_MAX_OVERFLOW) stays below Postgres `max_connections`, and grow
+them when `wait_max_ms` / `timeouts` show requests queuing on connections.
+"""
+import os
+import threading
+import time
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+
+from app.core.config import settings
+
+SLOW_WAIT_SECONDS = 0.1
+
+
+class PoolStats:
+    """Counters fed by the pool events and by the timed checkouts of the instrumented pools"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.invalidated = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.slow_waits = 0
+
+    def record_wait(self, seconds: float):
+        with self.lock:
+            self.checkouts += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            if seconds >= SLOW_WAIT_SECONDS:
+                self.slow_waits += 1
+
+    def as_dict(self) -> dict:
+        return {
+            "connects": self.connects,
+            "checkouts": self.checkouts,
+            "invalidated": self.invalidated,
+            "timeouts": self.timeouts,
+            "wait_avg_ms": round(self.wait_total / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+            "wait_max_ms": round(self.wait_max * 1000, 3),
+            f"waits_over_{int(SLOW_WAIT_SECONDS * 1000)}ms": self.slow_waits,
+        }
+
+
+class _TimedCheckout:
+    """Measures how long a request waits for a connection (queue wait, new connection and pre-ping)"""
+    stats = None
+
+    def connect(self):
+        if self.stats is None:
+            return super().connect()
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            self.stats.timeouts += 1
+            raise
+        finally:
+            self.stats.record_wait(time.perf_counter() - start)
+
+
+class InstrumentedQueuePool(_TimedCheckout, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    pass
+
+
+# engine name -> (engine, stats), one entry per engine of this worker
+POOLS: dict[str, tuple[Engine, PoolStats]] = {}
+
+
+def pool_options(is_async: bool = False) -> dict:
+    """create_engine / create_async_engine arguments from the DB_POOL_* settings"""
+    return {
+        "poolclass": InstrumentedAsyncQueuePool if is_async else InstrumentedQueuePool,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
+
+def instrument(name: str, engine: Engine):
+    """Registers the engine and attaches the pool event listeners. Takes the sync engine of an AsyncEngine"""
+    stats = PoolStats()
+    engine.pool.stats = stats
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        stats.connects += 1
+
+    @event.listens_for(engine, "invalidate")
+    def _on_invalidate(dbapi_connection, connection_record, exception):
+        stats.invalidated += 1
+
+    @event.listens_for(engine, "engine_disposed")
+    def _on_dispose(disposed_engine):
+        # dispose() replaces the pool with a fresh one
+        disposed_engine.pool.stats = stats
+
+    POOLS[name] = (engine, stats)
+
+
+def pool_metrics() -> dict:
+    """Live state and counters of every pool of this worker"""
+    pools = {}
+    for name, (engine, stats) in POOLS.items():
+        pool = engine.pool
+        live = {}
+        if isinstance(pool, QueuePool):
+            live = {
+                "size": pool.size(),
+                "max_overflow": pool._max_overflow,
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                "overflow": pool.overflow(),
+            }
+        pools[name] = {**live, **stats.as_dict()}
+    return {"pid": os.getpid(), "pools": pools}
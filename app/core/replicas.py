@@ -0,0 +1,93 @@
+"""Read replicas: round-robin with health checks, and read-your-writes stickiness.
+
+A user who wrote through the primary keeps reading from the primary for
+READ_YOUR_WRITES_SECONDS, so a replica lagging behind cannot hide their own
+post, like or follow. The window is tracked per worker.
+"""
+import itertools
+import logging
+import threading
+import time
+from typing import Optional
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ReplicaSet:
+    """Replica engines picked in round-robin, a replica failing a query or a health check
+        is skipped until the next successful health check"""
+    def __init__(self, engines: list[Engine]):
+        self.engines = engines
+        self.healthy = [True] * len(engines)
+        self._next = itertools.count()
+        for index, engine in enumerate(engines):
+            self._watch(index, engine)
+
+    def _watch(self, index: int, engine: Engine):
+        @event.listens_for(engine, "handle_error")
+        def _on_error(context):
+            if context.is_disconnect or context.connection is None:
+                self.mark_down(index, context.original_exception)
+
+    def mark_down(self, index: int, reason):
+        if self.healthy[index]:
+            logger.warning("read replica %s marked down: %s", index, reason)
+        self.healthy[index] = False
+
+    def pick(self) -> Optional[int]:
+        """Index of the next healthy replica, None when none is available"""
+        for _ in range(len(self.engines)):
+            index = next(self._next) % len(self.engines)
+            if self.healthy[index]:
+                return index
+        return None
+
+    def check(self, index: int, connection) -> None:
+        connection.execute(text("SELECT 1"))
+        if not self.healthy[index]:
+            logger.info("read replica %s back up", index)
+        self.healthy[index] = True
+
+
+class RecentWriters:
+    """user_id -> end of the window during which their reads stay on the primary"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.until: dict[int, float] = {}
+
+    def mark(self, user_id: int):
+        now = time.monotonic()
+        with self.lock:
+            self.until[user_id] = now + settings.READ_YOUR_WRITES_SECONDS
+            if len(self.until) > 10000:
+                self.until = {u: t for u, t in self.until.items() if t > now}
+
+    def sticky(self, user_id: Optional[int]) -> bool:
+        return user_id is not None and self.until.get(user_id, 0) > time.monotonic()
+
+
+recent_writers = RecentWriters()
+
+
+@event.listens_for(Session, "after_flush")
+def _flagged_on_flush(session, flush_context):
+    session.info["wrote"] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _flagged_on_bulk_write(orm_execute_state):
+    # bulk UPDATE / DELETE and INSERT ... SELECT do not go through the flush
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info["wrote"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _stick_writer_to_primary(session):
+    if session.info.pop("wrote", False) and session.info.get("user_id") is not None:
+        recent_writers.mark(session.info["user_id"])
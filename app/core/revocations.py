@@ -0,0 +1,50 @@
+"""Sessions revoked while some of their access tokens are still alive.
+
+An access token lives ACCESS_TOKEN_MINUTES and a revoked session cannot refresh, so a revocation
+only has to be remembered for that long: the set is the sessions revoked during the last
+ACCESS_TOKEN_MINUTES, a few ids even on a busy API. It is checked in memory on every request.
+
+A logout adds its session at once on the worker that served it. The other workers learn it from
+app.services.sessions.revocation_sync_loop, which reloads the recent revocations every
+SESSION_SYNC_INTERVAL seconds: a token revoked elsewhere can be used that long at most.
+"""
+import threading
+import time
+from typing import Iterable, Optional
+
+from app.core.config import settings
+
+
+class RevokedSessions:
+    """session id -> wall clock time of its revocation, for the lifetime of an access token"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.revoked: dict[str, float] = {}
+        self.synced_at: Optional[float] = None
+
+    def window(self) -> float:
+        return settings.ACCESS_TOKEN_MINUTES * 60 + settings.SESSION_SYNC_INTERVAL
+
+    def add(self, session_id: str, revoked_at: Optional[float] = None):
+        with self.lock:
+            self.revoked[session_id] = revoked_at or time.time()
+
+    def is_revoked(self, session_id: Optional[str]) -> bool:
+        return session_id is not None and session_id in self.revoked
+
+    def replace(self, revocations: Iterable[tuple[str, float]]):
+        """Revocations read from the database, merged with the local ones younger than the window"""
+        horizon = time.time() - self.window()
+        with self.lock:
+            revoked = {sid: at for sid, at in self.revoked.items() if at > horizon}
+            revoked.update(revocations)
+            self.revoked = revoked
+            self.synced_at = time.time()
+
+    def clear(self):
+        with self.lock:
+            self.revoked.clear()
+            self.synced_at = None
+
+
+revoked_sessions = RevokedSessions()
@@ -0,0 +1,64 @@
+"""Serving of the uploaded pictures.
+
+Content-named pictures (app.services.storage) never change, so their files are sent with a
+one year immutable Cache-Control: browsers and CDNs stop asking for them. The others (default.jpg,
+uploads older than the content addressing) are revalidated on each use. Every file carries an
+ETag and a Last-Modified answered with 304, and Range requests are served by FileResponse.
+
+With STATIC_SENDFILE the worker only answers the headers and hands the file to the proxy in front:
+"x-accel-redirect" for nginx, with an internal location aliasing the upload folder, e.g.
+
+    location /_uploads/ { internal; alias /app/public/uploads/; }
+
+or "x-sendfile" for Apache mod_xsendfile / lighttpd, with the absolute path of the file.
+"""
+import os
+from email.utils import formatdate, parsedate_to_datetime
+
+from fastapi import Request
+from fastapi.responses import FileResponse
+from starlette.responses import Response
+
+from app.core.config import settings
+from app.core.etag import not_modified
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "public, no-cache"
+
+
+def _modified_since(request: Request, mtime: float) -> bool:
+    header = request.headers.get("if-modified-since")
+    if not header or "if-none-match" in request.headers:
+        return True
+    try:
+        return int(mtime) > parsedate_to_datetime(header).timestamp()
+    except (TypeError, ValueError):
+        return True
+
+
+def serve_file(request: Request, folder: str, path: str, media_type: str, immutable: bool,
+               headers: dict[str, str]) -> Response:
+    """The file at `path` inside `folder` with its validators, a 304 when the client has it already"""
+    stat_result = os.stat(path)
+    if immutable:
+        # the file name holds the hash of the picture, its rendition and its format
+        etag = f'"{os.path.basename(path)}"'
+    else:
+        etag = f'"{int(stat_result.st_mtime):x}-{stat_result.st_size:x}"'
+    headers = {
+        **headers,
+        "ETag": etag,
+        "Last-Modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "Cache-Control": IMMUTABLE if immutable else REVALIDATE,
+    }
+    if not_modified(request, etag) or not _modified_since(request, stat_result.st_mtime):
+        return Response(status_code=304, headers=headers)
+
+    if settings.STATIC_SENDFILE == "x-accel-redirect":
+        relative = os.path.relpath(path, folder).replace(os.sep, "/")
+        headers["X-Accel-Redirect"] = settings.STATIC_ACCEL_PREFIX.rstrip("/") + "/" + relative
+        return Response(media_type=media_type, headers=headers)
+    if settings.STATIC_SENDFILE == "x-sendfile":
+        headers["X-Sendfile"] = path
+        return Response(media_type=media_type, headers=headers)
+    return FileResponse(path, media_type=media_type, headers=headers, stat_result=stat_result)
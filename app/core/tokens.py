@@ -0,0 +1,91 @@
+"""Cache of the verified JWTs.
+
+Every authenticated request decodes its token, and a feed polled every few seconds re-verifies the
+same HMAC each time. A verified token is kept, keyed by its hash, until the earliest of its `exp`
+and JWT_CACHE_TTL, in an LRU bounded to JWT_CACHE_SIZE tokens per worker.
+
+A token can be revoked before its `exp`: revoke() drops it from the cache and refuses it until it
+expires, revoke_user() drops the cached tokens of a user so that they are verified again.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from app.core.config import settings
+
+
+def token_key(token: str) -> bytes:
+    return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+
+class VerifiedTokens:
+    """token hash -> (monotonic expiry, claims) of the tokens whose signature was checked"""
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries: OrderedDict[bytes, tuple[float, dict]] = OrderedDict()
+        # token hash -> wall clock `exp`, after which the signature check refuses it anyway
+        self.revoked: dict[bytes, float] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> Optional[dict]:
+        key = token_key(token)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, token: str, claims: dict):
+        if self.maxsize <= 0:
+            return
+        lifetime = self.ttl
+        if isinstance(claims.get("exp"), (int, float)):
+            lifetime = min(lifetime, claims["exp"] - time.time())
+        if lifetime <= 0:
+            return
+        key = token_key(token)
+        with self.lock:
+            if key in self.revoked:
+                return
+            self.entries[key] = (time.monotonic() + lifetime, claims)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def is_revoked(self, token: str) -> bool:
+        return bool(self.revoked) and token_key(token) in self.revoked
+
+    def revoke(self, token: str, exp: Optional[float] = None):
+        """Refuses the token from now on, until `exp` (its own when not given)"""
+        key = token_key(token)
+        now = time.time()
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if exp is None:
+                exp = entry[1].get("exp", now + 86400) if entry is not None else now + 86400
+            self.revoked = {k: until for k, until in self.revoked.items() if until > now}
+            self.revoked[key] = exp
+
+    def revoke_user(self, user_id: int):
+        """Drops the cached tokens of the user, their next use is verified again"""
+        with self.lock:
+            for key in [k for k, (_, claims) in self.entries.items() if claims.get("id") == user_id]:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.revoked.clear()
+
+
+verified_tokens = VerifiedTokens(settings.JWT_CACHE_SIZE, settings.JWT_CACHE_TTL)
@@ -1,14 +1,17 @@
-from typing import Dict
+import base64
+import binascii
+from typing import Dict, Optional, Tuple
 
 import jwt
 from fastapi import UploadFile, Request, HTTPException
-from PIL import Image
 import os
 from datetime import datetime
-from uuid import uuid4
 from fastapi import WebSocket
 
 from app.core.config import settings
+from app.core.images import image_pool, transcode, output_formats, check_header, Picture
+from app.core.revocations import revoked_sessions
+from app.core.tokens import verified_tokens
 
 UPLOAD_FOLDER = "public/uploads/"
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
@@ -18,15 +21,24 @@ if not os.path.exists(UPLOAD_FOLDER):
 
 
 def decode_jwt(token: str):
-    """Returns the decoded values of the JWT token"""
-    try:
-        return jwt.decode(token, settings.SECRET_KEY, algorithms=['HS256'])
-    except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
+    """Returns the decoded values of the JWT token, verified once then served from app.core.tokens.
+        The token of a revoked session is refused from the in-memory app.core.revocations"""
+    if verified_tokens.is_revoked(token):
+        return None
+    data = verified_tokens.get(token)
+    if data is None:
+        try:
+            data = jwt.decode(token, settings.SECRET_KEY, algorithms=['HS256'])
+        except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
+            return None
+        verified_tokens.put(token, data)
+    if revoked_sessions.is_revoked(data.get('sid')):
         return None
+    return data
 
 
-def jwt_user_id(request: Request) -> int:
-    """Decorator returning a user ID for a JWT token as a parameter"""
+def jwt_claims(request: Request) -> dict:
+    """Decoded values of the JWT token of the request, 401/400 without a valid one"""
     auth_header = request.headers.get('Authorization')
     if not auth_header or " " not in auth_header:
         raise HTTPException(status_code=401, detail="Not authorized")
@@ -34,37 +46,61 @@ def jwt_user_id(request: Request) -> int:
     data = decode_jwt(token)
     if data is None or 'id' not in data:
         raise HTTPException(status_code=400, detail="Invalid or missing token")
+    return data
+
+
+def jwt_user_id(request: Request) -> int:
+    """Decorator returning a user ID for a JWT token as a parameter"""
+    data = jwt_claims(request)
     if isinstance(data['id'], int):
         return data['id']
     raise HTTPException(status_code=400, detail="An error occurred with the token, please login to refresh it")
 
 
+def optional_user_id(request: Request) -> Optional[int]:
+    """User ID of the JWT token when the request carries a valid one, None otherwise (public routes)"""
+    auth_header = request.headers.get('Authorization')
+    if not auth_header or " " not in auth_header:
+        return None
+    data = decode_jwt(auth_header.split()[1])
+    if data is None or not isinstance(data.get('id'), int):
+        return None
+    return data['id']
+
+
+def encode_cursor(created_at: datetime, item_id: int) -> str:
+    """Opaque keyset cursor pointing after the (created_at, id) of the last item of a page"""
+    raw = f"{created_at.isoformat()}|{item_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[datetime, int]]:
+    """Returns the (created_at, id) encoded in a cursor, None for the first page"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, item_id = raw.split("|")
+        return datetime.fromisoformat(created_at), int(item_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
 def allowed_file(filename: str) -> bool:
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
-def upload_picture_util(file: UploadFile) -> str:
-    """Generic method that uploads a photo, reduced size, reduced quality, jpg format, secure name, and returns the name of the image."""
+async def upload_picture_util(file: UploadFile) -> Picture:
+    """Generic method that encodes an uploaded photo, reduced size, reduced quality, in thumb/medium/full renditions (jpg and modern formats),
+        named after its content. The transcoding runs in the image process pool, a saturated pool answers 503.
+        The size of the body is limited by app.core.limits, the dimensions are checked from the header before decoding.
+        The files are written by app.services.storage.store in the transaction that references the picture"""
     if not allowed_file(file.filename):
         raise ValueError("Unsupported file type")
 
-    filename = f"{uuid4().hex}_{datetime.now().strftime('%d%m%Y-%H%M%S')}.jpg"
-    filepath = os.path.join(UPLOAD_FOLDER, filename)
-
-    image = Image.open(file.file)
-    if image.mode in ('RGBA', 'LA', 'P'):
-        background = Image.new("RGB", image.size, (255, 255, 255))
-        if image.mode == 'P':
-            image = image.convert('RGBA')
-        background.paste(image, mask=image.split()[-1] if image.mode == 'RGBA' else None)
-        image = background
-    elif image.mode != 'RGB':
-        image = image.convert("RGB")
-
-    image.thumbnail((1920, 1080), Image.Resampling.LANCZOS)
-    image.save(filepath, "JPEG", quality=50, optimize=True)
-
-    return filename
+    data = await file.read()
+    check_header(data, settings.IMAGE_MAX_PIXELS)
+    return await image_pool.run(transcode, data, output_formats())
 
 
 def get_version():
@@ -1,13 +1,19 @@
+import asyncio
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.responses import JSONResponse
 
-from app.core.config import fast_mqtt
+from app.core.config import fast_mqtt, settings
 from app.core.utils import get_version
-from app.routes import auth, user, follow, post, like, comment, message
-from app.core.database import engine
+from app.routes import auth, user, follow, post, like, comment, message, internal
+from app.core.database import engine, replica_engines, replica_health_loop
+from app.core.images import image_pool
+from app.core.limits import BodySizeLimit
+from app.core.passwords import password_pool
+from app.services.graph import graph_sync_loop
+from app.services.sessions import revocation_sync_loop
 from app.models.models import Base
 
 # create DB
@@ -18,7 +24,17 @@ Base.metadata.create_all(bind=engine)
 @asynccontextmanager
 async def _lifespan(_app: FastAPI):
     await fast_mqtt.mqtt_startup()
+    health = asyncio.create_task(replica_health_loop()) if replica_engines else None
+    revocations = asyncio.create_task(revocation_sync_loop())
+    graph = asyncio.create_task(graph_sync_loop()) if settings.FOLLOW_GRAPH_ENABLED else None
     yield
+    if health:
+        health.cancel()
+    if graph:
+        graph.cancel()
+    revocations.cancel()
+    image_pool.shutdown()
+    password_pool.shutdown()
     await fast_mqtt.mqtt_shutdown()
 app = FastAPI(
     title="Valenstagram API v2",
@@ -27,6 +43,8 @@ app = FastAPI(
     lifespan=_lifespan
 )
 
+# inside the CORS middleware, so that a 413 carries its headers
+app.add_middleware(BodySizeLimit, paths=("/post/upload", "/user/upload-profile-picture"))
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -56,6 +74,7 @@ app.include_router(post.router)
 app.include_router(like.router)
 app.include_router(comment.router)
 app.include_router(message.router)
+app.include_router(internal.router)
 
 @app.get("/")
 def read_root():
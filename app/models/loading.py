@@ -0,0 +1,38 @@
+"""Loader option profiles.
+
+Relationships are lazy on the models, a route that renders related rows opts into
+one of these profiles: `joinedload` for many-to-one, `selectinload` for collections
+(one extra query per relationship instead of a cartesian JOIN) and `raiseload` for
+everything else, so an unplanned relationship access fails loudly in the tests
+instead of silently emitting one query per row.
+"""
+from sqlalchemy.orm import joinedload, selectinload, raiseload, configure_mappers
+
+from app.models.models import Post, Conversation, Message
+
+# backrefs (Post.author, ...) only exist once the mappers are configured
+configure_mappers()
+
+# the row only
+BARE = (raiseload('*'),)
+
+# a post and the user who published it (liked posts, feeds)
+POST_WITH_AUTHOR = (
+    joinedload(Post.author).raiseload('*'),
+    raiseload('*'),
+)
+
+# a conversation, its two participants and every message with its sender
+CONVERSATION_WITH_MESSAGES = (
+    joinedload(Conversation.user1).raiseload('*'),
+    joinedload(Conversation.user2).raiseload('*'),
+    selectinload(Conversation.messages).selectinload(Message.sender).raiseload('*'),
+    raiseload('*'),
+)
+
+# a conversation and its two participants (conversation list)
+CONVERSATION_PARTICIPANTS = (
+    joinedload(Conversation.user1).raiseload('*'),
+    joinedload(Conversation.user2).raiseload('*'),
+    raiseload('*'),
+)
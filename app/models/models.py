@@ -1,11 +1,13 @@
 from datetime import datetime, timezone
-from sqlalchemy import Column, String, Text, Boolean, DateTime, ForeignKey, UniqueConstraint, Integer
+from sqlalchemy import Column, String, Text, Boolean, DateTime, ForeignKey, UniqueConstraint, Integer, Index, Float
 from sqlalchemy.orm import relationship, declarative_base
 
 Base = declarative_base()
 
 def utc_now():
-    return datetime.now(timezone.utc)
+    """Current UTC time, naive like the DateTime columns (without time zone): asyncpg refuses to bind
+        an aware value to them"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
 
 class User(Base):
     __tablename__ = 'utilisateur'
@@ -20,21 +22,48 @@ class User(Base):
     profile_picture = Column(String(255), nullable=True, default='default.jpg')
     created_at = Column(DateTime, default=utc_now)
     is_admin = Column(Boolean, default=False)
+    # any change of the row, counters included: version of the profile for the ETags
+    updated_at = Column(DateTime, default=utc_now, onupdate=utc_now)
+    # denormalized counters, maintained in the same transaction as the follow writes (see app.services.counters)
+    follower_count = Column(Integer, nullable=False, default=0, server_default='0')
+    following_count = Column(Integer, nullable=False, default=0, server_default='0')
 
-    posts = relationship('Post', backref='author', lazy='joined')
+    # relationships are lazy: each route opts into what it renders with app.models.loading
+    posts = relationship('Post', backref='author')
+
+    # pictures still referenced, looked up by batches by app.services.sweeper
+    __table_args__ = (Index('ix_utilisateur_profile_picture', 'profile_picture'),)
 
 class Post(Base):
     __tablename__ = 'post'
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     image_url = Column(String(255), nullable=False)
+    # layout of the picture before it is downloaded: size of the full rendition and blurhash placeholder,
+    # set by the upload pipeline, filled for the older posts by app.services.placeholders
+    width = Column(Integer, nullable=True)
+    height = Column(Integer, nullable=True)
+    blurhash = Column(String(64), nullable=True)
     caption = Column(String(500), nullable=True)
     created_at = Column(DateTime, default=utc_now)
     hidden_tag = Column(Boolean, default=False)
+    # any change of the row, counters included, or of its comments: version of the post for the ETags
+    updated_at = Column(DateTime, default=utc_now, onupdate=utc_now)
+    # denormalized counters, maintained in the same transaction as the like/comment writes (see app.services.counters)
+    like_count = Column(Integer, nullable=False, default=0, server_default='0')
+    comment_count = Column(Integer, nullable=False, default=0, server_default='0')
 
     user_id = Column(Integer, ForeignKey('utilisateur.id'), nullable=False)
-    likes = relationship('Like', backref='post', lazy='joined')
-    comments = relationship('Comment', backref='post', lazy='joined')
+    # children are removed with bulk deletes by delete_post, never loaded just to be nullified
+    likes = relationship('Like', backref='post', passive_deletes=True)
+    comments = relationship('Comment', backref='post', passive_deletes=True)
+
+    # keyset pagination of the feeds: newest first, id as tie-breaker
+    __table_args__ = (
+        Index('ix_post_feed', 'hidden_tag', 'created_at', 'id'),
+        Index('ix_post_user_feed', 'user_id', 'created_at', 'id'),
+        Index('ix_post_image_url', 'image_url'),
+    )
 
 class Like(Base):
     __tablename__ = 'like'
@@ -44,7 +73,10 @@ class Like(Base):
     post_id = Column(Integer, ForeignKey('post.id'), nullable=False)
     created_at = Column(DateTime, default=utc_now)
 
-    __table_args__ = (UniqueConstraint('user_id', 'post_id', name='unique_like'),)
+    __table_args__ = (
+        UniqueConstraint('user_id', 'post_id', name='unique_like'),
+        Index('ix_like_post', 'post_id'),
+    )
 
 class Comment(Base):
     __tablename__ = 'comment'
@@ -56,6 +88,8 @@ class Comment(Base):
     user_id = Column(Integer, ForeignKey('utilisateur.id'), nullable=False)
     post_id = Column(Integer, ForeignKey('post.id'), nullable=False)
 
+    __table_args__ = (Index('ix_comment_post', 'post_id', 'created_at'),)
+
 class Follow(Base):
     __tablename__ = 'follow'
 
@@ -64,7 +98,68 @@ class Follow(Base):
     followed_id = Column(Integer, ForeignKey('utilisateur.id'), nullable=False)
     created_at = Column(DateTime, default=utc_now)
 
-    __table_args__ = (UniqueConstraint('follower_id', 'followed_id', name='unique_follow'),)
+    __table_args__ = (
+        UniqueConstraint('follower_id', 'followed_id', name='unique_follow'),
+        # keyset pages of the followers and of the followed users, newest first
+        Index('ix_follow_followed_created', 'followed_id', 'created_at', 'id'),
+        Index('ix_follow_follower_created', 'follower_id', 'created_at', 'id'),
+    )
+
+class Timeline(Base):
+    """Materialized home feed: one row per post pushed to a follower (fan-out on write)"""
+    __tablename__ = 'timeline'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey('utilisateur.id'), nullable=False)
+    post_id = Column(Integer, ForeignKey('post.id'), nullable=False)
+    author_id = Column(Integer, ForeignKey('utilisateur.id'), nullable=False)
+    created_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint('user_id', 'post_id', name='unique_timeline_post'),
+        Index('ix_timeline_user_feed', 'user_id', 'created_at', 'post_id'),
+        Index('ix_timeline_user_author', 'user_id', 'author_id'),
+        Index('ix_timeline_post', 'post_id'),
+    )
+
+class Suggestion(Base):
+    """Account to follow, precomputed for a user by app.services.suggestions: top SUGGESTION_COUNT per user"""
+    __tablename__ = 'suggestion'
+
+    user_id = Column(Integer, ForeignKey('utilisateur.id'), primary_key=True)
+    suggested_id = Column(Integer, ForeignKey('utilisateur.id'), primary_key=True)
+    # accounts followed by the user that follow the suggested one
+    mutuals = Column(Integer, nullable=False)
+    score = Column(Float, nullable=False)
+    computed_at = Column(DateTime, default=utc_now)
+
+    __table_args__ = (Index('ix_suggestion_user_score', 'user_id', 'score'),)
+
+class Upload(Base):
+    """Content-addressed picture (app.services.storage), shared by the posts and profiles with the same bytes"""
+    __tablename__ = 'upload'
+
+    name = Column(String(255), primary_key=True)
+    ref_count = Column(Integer, nullable=False, default=0, server_default='0')
+    created_at = Column(DateTime, default=utc_now)
+
+class UserSession(Base):
+    """Login of a user on a device (app.services.sessions): holds the hash of its current refresh token,
+        its short-lived access tokens carry its id"""
+    __tablename__ = 'user_session'
+
+    id = Column(String(32), primary_key=True)
+    user_id = Column(Integer, ForeignKey('utilisateur.id'), nullable=False)
+    refresh_hash = Column(String(64), nullable=False)
+    created_at = Column(DateTime, default=utc_now)
+    expires_at = Column(DateTime, nullable=False)
+    revoked_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index('ix_user_session_user', 'user_id'),
+        # recent revocations, read by every worker to refuse the access tokens still alive
+        Index('ix_user_session_revoked', 'revoked_at'),
+    )
 
 class Notification(Base):
     __tablename__ = 'notification'
@@ -87,7 +182,7 @@ class Conversation(Base):
     user1 = relationship('User', foreign_keys=[user1_id])
     user2 = relationship('User', foreign_keys=[user2_id])
 
-    messages = relationship('Message', backref='conversation', lazy='joined')
+    messages = relationship('Message', backref='conversation')
 
     __table_args__ = (UniqueConstraint('user1_id', 'user2_id', name='unique_conversation'),)
 
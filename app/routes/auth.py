@@ -1,30 +1,38 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from app.core.database import get_db
-from app.core.utils import decode_jwt
+from app.core.database import get_db, run_db, db_route
+from app.core.utils import decode_jwt, jwt_claims
 from app.models.models import User
-from app.core.config import settings
-from app.schemas.auth import RegisterRequest, LoginRequest, TokenRequest, AuthResponse, MessageResponse
-from passlib.hash import argon2
-import jwt
-import datetime
+from app.schemas.auth import RegisterRequest, LoginRequest, TokenRequest, AuthResponse, MessageResponse, \
+    RefreshRequest, TokenResponse
+from app.core.passwords import hash_password, verify_password
+from app.services import sessions
+from typing import Optional
 
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
 
 @router.post("/register", response_model=MessageResponse)
-def register(data: RegisterRequest, db: Session = Depends(get_db)):
-    username = data.username
-    email = data.email
-    password = data.password
-
-    if db.query(User).filter((User.username == username) | (User.email == email)).first():
+async def register(data: RegisterRequest, db: Session = Depends(get_db)):
+    """Creates an account, the password is hashed in the password pool"""
+    if await run_db(db, _taken, data.username, str(data.email)):
         raise HTTPException(status_code=400, detail="username or email already exists.")
 
+    hashed_password = await hash_password(data.password)
+    return await run_db(db, _create_user, data.username, str(data.email), hashed_password)
+
+
+def _taken(db: Session, username: str, email: str) -> bool:
+    taken = db.query(User.id).filter((User.username == username) | (User.email == email)).first() is not None
+    # the connection goes back to the pool while the password is hashed
+    db.rollback()
+    return taken
+
+
+def _create_user(db: Session, username: str, email: str, password_hash: str):
     try:
-        hashed_password = argon2.hash(password)
-        new_user = User(username=username, email=str(email), password_hash=hashed_password)
+        new_user = User(username=username, email=email, password_hash=password_hash)
         db.add(new_user)
         db.commit()
         return {"message": "account created successfully."}
@@ -33,22 +41,55 @@ def register(data: RegisterRequest, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"an error occurred: {str(e)}")
 
 @router.post("/login", response_model=AuthResponse)
-def login(data: LoginRequest, db: Session = Depends(get_db)):
-
-    user = db.query(User).filter_by(username=data.username).first()
-    if user and argon2.verify(data.password, user.password_hash):
-        token = jwt.encode({
-            "id": user.id,
-            "exp": datetime.datetime.now(datetime.UTC) + datetime.timedelta(days=1)
-        }, settings.SECRET_KEY, algorithm="HS256")
-
-        return {
-            "token": token,
-            "user_id": user.id,
-            "username": data.username,
-            "profile_picture": user.profile_picture
-        }
-    raise HTTPException(status_code=401, detail="Invalid credentials")
+async def login(data: LoginRequest, db: Session = Depends(get_db)):
+    """Checks the password in the password pool, and rehashes it when the argon2 parameters changed"""
+    user = await run_db(db, _credentials, data.username)
+    if user is None:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    valid, rehashed = await verify_password(data.password, user.password_hash)
+    if not valid:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    tokens = await run_db(db, _open_session, user.id, rehashed)
+
+    return {
+        **tokens,
+        "user_id": user.id,
+        "username": data.username,
+        "profile_picture": user.profile_picture
+    }
+
+
+def _credentials(db: Session, username: str):
+    user = db.query(User.id, User.password_hash, User.profile_picture).filter_by(username=username).first()
+    # the connection goes back to the pool while the password is verified
+    db.rollback()
+    return user
+
+
+def _open_session(db: Session, user_id: int, rehashed: Optional[str]) -> dict:
+    if rehashed:
+        db.query(User).filter(User.id == user_id).update({User.password_hash: rehashed}, synchronize_session=False)
+    return sessions.open_session(db, user_id)
+
+
+@router.post("/refresh", response_model=TokenResponse)
+@db_route
+def refresh(data: RefreshRequest, db: Session = Depends(get_db)):
+    """New access and refresh tokens for a refresh token, which cannot be used again"""
+    tokens = sessions.refresh_session(db, data.refresh_token)
+    if tokens is None:
+        raise HTTPException(status_code=401, detail="Invalid or expired refresh token")
+    return tokens
+
+
+@router.post("/logout", response_model=MessageResponse)
+@db_route
+def logout(claims: dict = Depends(jwt_claims), db: Session = Depends(get_db)):
+    """Revokes the session of the access token: its refresh token and access tokens stop working"""
+    if "sid" not in claims:
+        raise HTTPException(status_code=400, detail="Token without session, login again")
+    sessions.revoke_session(db, claims["sid"])
+    return {"message": "logged out."}
 
 @router.post("/token")
 def token(data: TokenRequest):
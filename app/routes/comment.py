@@ -1,16 +1,19 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 
-from app.core.database import get_db
+from app.core.cache import invalidate
+from app.core.database import get_db, get_read_db, db_route
 from app.core.utils import jwt_user_id
-from app.models.models import Post, Comment, User
+from app.models.models import Post, Comment, User, utc_now
 from app.schemas.comment import CommentDTO, CommentContent, ListCommentContent
 from app.schemas.user import UserLightDTO
+from app.services import counters
 
 router = APIRouter(prefix="/comment", tags=["Comments"])
 
 
 @router.post("/{post_id}", response_model=CommentDTO)
+@db_route
 def comment(
         post_id: int,
         payload: CommentContent,
@@ -36,6 +39,8 @@ def comment(
         user_id=user_id
     )
     db.add(new_comment)
+    counters.bump(db, Post.comment_count, post.id)
+    invalidate(db, "feed")
     db.commit()
     db.refresh(new_comment)
 
@@ -50,6 +55,7 @@ def comment(
     )
 
 @router.delete("/{comment_id}")
+@db_route
 def delete_comment(
         comment_id: int,
         db: Session = Depends(get_db),
@@ -64,6 +70,8 @@ def delete_comment(
     if comment.user_id != user_id:
         raise HTTPException(status_code=403, detail="Unauthorized to delete")
     db.delete(comment)
+    counters.bump(db, Post.comment_count, comment.post_id, -1)
+    invalidate(db, "feed")
     db.commit()
 
     return {
@@ -81,9 +89,10 @@ def delete_comment(
 
 
 @router.get("/{post_id}", response_model=ListCommentContent)
+@db_route
 def get_comment_post(
         post_id: int,
-        db: Session = Depends(get_db),
+        db: Session = Depends(get_read_db),
         user_id: int = Depends(jwt_user_id)
 ):
     """Get all comments in a post"""
@@ -111,6 +120,7 @@ def get_comment_post(
     )
 
 @router.patch("/{comment_id}", response_model=CommentDTO)
+@db_route
 def update_comment(
         payload: CommentContent,
         comment_id: int,
@@ -128,6 +138,9 @@ def update_comment(
     if len(payload.content) > 500:
         raise HTTPException(status_code=400, detail="Comment too long")
     commentary.content = payload.content
+    # the post page shows its comments, its version moves with them
+    db.query(Post).filter_by(id=commentary.post_id).update({Post.updated_at: utc_now()}, synchronize_session=False)
+    invalidate(db, "feed")
     db.commit()
     db.refresh(commentary)
     return CommentDTO(
@@ -142,9 +155,10 @@ def update_comment(
 
 
 @router.get("/current/all")
+@db_route
 def get_all_comments(
         user_id: int = Depends(jwt_user_id),
-        db: Session = Depends(get_db)
+        db: Session = Depends(get_read_db)
 ):
     """Get all comments of the current user"""
     if not user_id:
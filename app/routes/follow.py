@@ -1,62 +1,128 @@
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import delete, literal, select, tuple_
 from sqlalchemy.orm import Session
 
-from app.core.database import get_db
-from app.core.utils import jwt_user_id
-from app.models.models import User, Follow
-from app.schemas.follow import FollowResponse, FollowUserOut
+from app.core.cache import invalidate
+from app.core.database import get_db, get_read_db, db_route, upsert
+from app.core.utils import jwt_user_id, encode_cursor, decode_cursor
+from app.models.models import User, Follow, utc_now
+from app.schemas.follow import FollowResponse, FollowUserOut, FollowManyRequest, FollowManyResponse
+from app.services import timeline, counters, graph
 
 router = APIRouter(prefix="/follow", tags=["Follow"])
 
+FOLLOW_PAGE_SIZE = 50
+FOLLOW_MAX_PAGE_SIZE = 200
+
+
+def _invalidate_profiles(db: Session, *user_ids: int):
+    """The cached profiles show the follower and following counts"""
+    usernames = db.query(User.username).filter(User.id.in_(user_ids)).all()
+    invalidate(db, *(f"profile:{u.username}" for u in usernames))
+
+
+def _follow_insert(db: Session, user_id: int, *conditions):
+    """INSERT of the follows of user_id towards the users matching the conditions, skipping the existing
+        ones in the same statement: returns the rows actually created"""
+    return db.execute(
+        upsert(db, Follow)
+        .from_select(["follower_id", "followed_id", "created_at"],
+                     select(literal(user_id), User.id, literal(utc_now())).where(User.id != user_id, *conditions))
+        .on_conflict_do_nothing()
+        .returning(Follow.id, Follow.follower_id, Follow.followed_id, Follow.created_at)
+    ).all()
+
 
 @router.put("/{username}", response_model=FollowResponse)
+@db_route
 def follow_user(
         db: Session = Depends(get_db),
         user_id: int = Depends(jwt_user_id),
         username=str
 ):
-    """Follow an user"""
-    other_user = db.query(User).filter_by(username=username).first()
-
-    if not other_user:
-        raise HTTPException(status_code=404, detail="User not found")
-    if other_user.id == user_id:
-        raise HTTPException(status_code=400, detail="You can't follow yourself")
-
-    already_following = db.query(Follow).filter_by(follower_id=user_id, followed_id=other_user.id).first()
-    if already_following:
+    """Follow an user. A single INSERT ... ON CONFLICT DO NOTHING: a follow sent twice at once gets the 400 too"""
+    created = _follow_insert(db, user_id, User.username == username)
+    if not created:
+        other_user = db.query(User.id).filter_by(username=username).first()
+        if not other_user:
+            raise HTTPException(status_code=404, detail="User not found")
+        if other_user.id == user_id:
+            raise HTTPException(status_code=400, detail="You can't follow yourself")
         raise HTTPException(status_code=400, detail="Already following")
 
-    new_follow = Follow(follower_id=user_id, followed_id=other_user.id)
-    db.add(new_follow)
+    new_follow = created[0]
+    counters.follow_added(db, user_id, new_follow.followed_id)
+    graph.record(db, user_id, new_follow.followed_id)
+    _invalidate_profiles(db, user_id, new_follow.followed_id)
+    timeline.backfill_author(db, user_id, new_follow.followed_id)
     db.commit()
-    db.refresh(new_follow)
 
     return {
         "id": new_follow.id,
         "follow_id": new_follow.follower_id,
         "followed_id": new_follow.followed_id,
-        "created_at": new_follow.created_at.now()
+        "created_at": new_follow.created_at
     }
 
 
+@router.post("/many", response_model=FollowManyResponse)
+@db_route
+def follow_many(
+        payload: FollowManyRequest,
+        db: Session = Depends(get_db),
+        user_id: int = Depends(jwt_user_id)
+):
+    """Follow up to FOLLOW_MANY_MAX users at once (contact import), in a fixed number of statements.
+        Unknown usernames and users already followed are skipped: returns the users followed by this call"""
+    followed_ids = [row.followed_id for row in _follow_insert(db, user_id, User.username.in_(set(payload.usernames)))]
+    if followed_ids:
+        counters.follows_added(db, user_id, followed_ids)
+        for followed_id in followed_ids:
+            graph.record(db, user_id, followed_id)
+        _invalidate_profiles(db, user_id, *followed_ids)
+        timeline.backfill_authors(db, user_id, followed_ids)
+    db.commit()
+    return FollowManyResponse(followed=followed_ids, count=len(followed_ids))
+
+
+def _unfollow(db: Session, follower_id: int, followed_id):
+    """DELETE ... RETURNING of a follow: the removed row, None if there was none"""
+    return db.execute(
+        delete(Follow)
+        .where(Follow.follower_id == follower_id, Follow.followed_id == followed_id)
+        .returning(Follow.follower_id, Follow.followed_id)
+    ).first()
+
+
+def _user_id(username: str):
+    return select(User.id).where(User.username == username).scalar_subquery()
+
+
+def _after_unfollow(db: Session, follower_id: int, followed_id: int):
+    timeline.remove_author(db, follower_id, followed_id)
+    counters.follow_removed(db, follower_id, followed_id)
+    graph.record(db, follower_id, followed_id, added=False)
+    _invalidate_profiles(db, follower_id, followed_id)
+    db.commit()
+
+
 @router.put("/unfollow/{username}")
+@db_route
 def unfollow_user(
         db: Session = Depends(get_db),
         user_id: int = Depends(jwt_user_id),
         username=str
 ):
     """Unfollow an user"""
-    other_user = db.query(User).filter_by(username=username).first()
-    if not other_user:
-        raise HTTPException(status_code=404, detail="User not found")
-
-    follow_entry = db.query(Follow).filter_by(follower_id=user_id, followed_id=other_user.id).first()
+    follow_entry = _unfollow(db, user_id, _user_id(username))
     if not follow_entry:
+        if not db.query(User.id).filter_by(username=username).first():
+            raise HTTPException(status_code=404, detail="User not found")
         raise HTTPException(status_code=404, detail="Follow query not found")
 
-    db.delete(follow_entry)
-    db.commit()
+    _after_unfollow(db, follow_entry.follower_id, follow_entry.followed_id)
     return {
         "message": "Unfollowed successfully",
         "users": {
@@ -67,76 +133,78 @@ def unfollow_user(
 
 
 @router.get("/get-follow/{username}", response_model=dict)
+@db_route
 def get_user_followers(
         username: str,
-        db: Session = Depends(get_db)
+        cursor: Optional[str] = None,
+        limit: int = Query(FOLLOW_PAGE_SIZE, ge=1, le=FOLLOW_MAX_PAGE_SIZE),
+        db: Session = Depends(get_read_db)
 ):
-    """Fetch all the followers of someone"""
-    user = db.query(User).filter_by(username=username).first()
+    """Fetch the followers of someone, latest first, a page at a time: pass `next_cursor` back as `cursor`"""
+    user = db.query(User.id, User.follower_count).filter_by(username=username).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    followers = db.query(User.id, User.username, User.profile_picture, Follow.created_at) \
-        .join(Follow, User.id == Follow.follower_id) \
-        .filter(Follow.followed_id == user.id) \
-        .order_by(Follow.created_at.desc()) \
-        .all()
-
-    result = [
-        FollowUserOut(
-            id=f.id,
-            username=f.username,
-            profile_picture=f.profile_picture,
-            followed_at=f.created_at.isoformat()
-        )
-        for f in followers
-    ]
-
-    return {"followers": result, "count": len(result)}
+    result, next_cursor = _follow_page(db, Follow.followed_id, Follow.follower_id, user.id, cursor, limit)
+    return {"followers": result, "count": user.follower_count, "next_cursor": next_cursor}
 
 @router.get("/get-followed/{username}", response_model=dict)
+@db_route
 def get_user_followed(
         username: str,
-        db: Session = Depends(get_db)
+        cursor: Optional[str] = None,
+        limit: int = Query(FOLLOW_PAGE_SIZE, ge=1, le=FOLLOW_MAX_PAGE_SIZE),
+        db: Session = Depends(get_read_db)
 ):
-    """Fetch all the followed people of someone"""
-    user = db.query(User).filter_by(username=username).first()
+    """Fetch the followed people of someone, latest first, a page at a time: pass `next_cursor` back as `cursor`"""
+    user = db.query(User.id, User.following_count).filter_by(username=username).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    followed_users = (db.query(User.id, User.username, User.profile_picture, Follow.created_at)
-                      .join(Follow, User.id == Follow.followed_id)
-                      .filter(Follow.follower_id == user.id)
-                      .order_by(Follow.created_at.desc()).all())
-    result = [
+    result, next_cursor = _follow_page(db, Follow.follower_id, Follow.followed_id, user.id, cursor, limit)
+    return {"followed": result, "count": user.following_count, "next_cursor": next_cursor}
+
+
+def _follow_page(db: Session, own_side, other_side, user_id: int, cursor: Optional[str], limit: int):
+    """One page of the users on `other_side` of the follows of `user_id` on `own_side`, newest first.
+        A keyset scan of the (own_side, created_at, id) index, the count comes from the user counters"""
+    query = (db.query(User.id, User.username, User.profile_picture, Follow.created_at, Follow.id.label("follow_id"))
+             .join(Follow, User.id == other_side)
+             .filter(own_side == user_id))
+    after = decode_cursor(cursor)
+    if after:
+        query = query.filter(tuple_(Follow.created_at, Follow.id) < after)
+    rows = query.order_by(Follow.created_at.desc(), Follow.id.desc()).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].follow_id)
+    return [
         FollowUserOut(
             id=f.id,
             username=f.username,
             profile_picture=f.profile_picture,
             followed_at=f.created_at.isoformat()
         )
-        for f in followed_users
-    ]
-
-    return {"followed": result, "count": len(result)}
+        for f in rows
+    ], next_cursor
 
 @router.delete("/remove-follower/{username}")
+@db_route
 def remove_follower(
         username: str,
         db: Session = Depends(get_db),
         user_id: int = Depends(jwt_user_id)
 ):
     """Remove a person from his list of follower"""
-    other_user = db.query(User).filter_by(username=username).first()
-    if not other_user:
-        raise HTTPException(status_code=404, detail="User not found")
-
-    follow_entry = db.query(Follow).filter_by(follower_id=other_user.id, followed_id=user_id).first()
+    follow_entry = _unfollow(db, _user_id(username), user_id)
     if not follow_entry:
+        if not db.query(User.id).filter_by(username=username).first():
+            raise HTTPException(status_code=404, detail="User not found")
         raise HTTPException(status_code=404, detail="No relationship found")
 
-    db.delete(follow_entry)
-    db.commit()
+    _after_unfollow(db, follow_entry.follower_id, follow_entry.followed_id)
     return {
         "message": "Follower removed successfully",
         "users": {
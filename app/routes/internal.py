@@ -0,0 +1,50 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+
+from app.core.cache import response_cache
+from app.core.database import get_db, db_route
+from app.core.pool_metrics import pool_metrics
+from app.core.utils import jwt_user_id
+from app.models.models import User
+from app.services.graph import follow_graph
+
+router = APIRouter(prefix="/internal", tags=["internal"])
+
+
+def check_admin(db: Session, user_id: int):
+    """Internal endpoints are reserved to admin accounts"""
+    if not db.query(User.is_admin).filter_by(id=user_id).scalar():
+        raise HTTPException(status_code=403, detail="Admin only")
+
+
+@router.get("/pool")
+@db_route
+def get_pool_metrics(
+        db: Session = Depends(get_db),
+        user_id: int = Depends(jwt_user_id)
+):
+    """Connection pool statistics of the worker that serves the request"""
+    check_admin(db, user_id)
+    return pool_metrics()
+
+
+@router.get("/cache")
+@db_route
+def get_cache_metrics(
+        db: Session = Depends(get_db),
+        user_id: int = Depends(jwt_user_id)
+):
+    """Response cache hit/miss counters of the worker that serves the request"""
+    check_admin(db, user_id)
+    return response_cache.metrics()
+
+
+@router.get("/graph")
+@db_route
+def get_graph_metrics(
+        db: Session = Depends(get_db),
+        user_id: int = Depends(jwt_user_id)
+):
+    """Size and freshness of the follow graph index of the worker that serves the request"""
+    check_admin(db, user_id)
+    return follow_graph.metrics()
@@ -1,33 +1,42 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session, joinedload
-from app.core.database import get_db
+from sqlalchemy import delete, literal, select
+from sqlalchemy.orm import Session
+from app.core.cache import response_cache, invalidate
+from app.core.database import get_db, get_read_db, db_route, upsert
 from app.core.utils import jwt_user_id
-from app.models.models import Post, Like, User
+from app.models import loading
+from app.models.models import Post, Like, User, utc_now
 from app.schemas.like import LikeDTO, PostLikesResponse, LikedPostsByUser
 from app.schemas.post import PostLightDTO
 from app.schemas.user import UserLightDTO
+from app.services import counters
 
 router = APIRouter(prefix="/like", tags=["Likes"])
 
 
 @router.post("/{post_id}", response_model=LikeDTO)
+@db_route
 def like_post(
         post_id: int,
         db: Session = Depends(get_db),
         user_id: int = Depends(jwt_user_id)
 ):
-    """Like a post"""
-    post = db.query(Post).filter_by(id=post_id).first()
-    if not post:
-        raise HTTPException(status_code=404, detail="Post not found")
-
-    if db.query(Like).filter_by(post_id=post_id, user_id=user_id).first():
+    """Like a post. A single INSERT ... ON CONFLICT DO NOTHING: a like sent twice at once gets the 400 too"""
+    new_like = db.execute(
+        upsert(db, Like)
+        .from_select(["user_id", "post_id", "created_at"],
+                     select(literal(user_id), Post.id, literal(utc_now())).where(Post.id == post_id))
+        .on_conflict_do_nothing()
+        .returning(Like.id, Like.post_id, Like.user_id, Like.created_at)
+    ).first()
+    if not new_like:
+        if not db.query(Post.id).filter_by(id=post_id).first():
+            raise HTTPException(status_code=404, detail="Post not found")
         raise HTTPException(status_code=400, detail="You have already liked this post")
 
-    new_like = Like(post_id=post_id, user_id=user_id)
-    db.add(new_like)
+    counters.bump(db, Post.like_count, post_id)
+    invalidate(db, "feed", f"likes:{post_id}")
     db.commit()
-    db.refresh(new_like)
 
     return LikeDTO(
         id=new_like.id,
@@ -38,21 +47,25 @@ def like_post(
 
 
 @router.delete("/{post_id}", response_model=LikeDTO)
+@db_route
 def unlike_post(
         post_id: int,
         db: Session = Depends(get_db),
         user_id: int = Depends(jwt_user_id)
 ):
-    """Unlike a post"""
-    post = db.query(Post).filter_by(id=post_id).first()
-    if not post:
-        raise HTTPException(status_code=404, detail="Post not found")
-
-    like_to_dl = db.query(Like).filter_by(post_id=post_id, user_id=user_id).first()
+    """Unlike a post, in a single DELETE ... RETURNING"""
+    like_to_dl = db.execute(
+        delete(Like)
+        .where(Like.post_id == post_id, Like.user_id == user_id)
+        .returning(Like.id, Like.post_id, Like.user_id, Like.created_at)
+    ).first()
     if not like_to_dl:
+        if not db.query(Post.id).filter_by(id=post_id).first():
+            raise HTTPException(status_code=404, detail="Post not found")
         raise HTTPException(status_code=404, detail="Like not found")
 
-    db.delete(like_to_dl)
+    counters.bump(db, Post.like_count, post_id, -1)
+    invalidate(db, "feed", f"likes:{post_id}")
     db.commit()
 
     return LikeDTO(
@@ -64,9 +77,10 @@ def unlike_post(
 
 
 @router.get("/liked-posts/{user_id}", response_model=LikedPostsByUser)
+@db_route
 def get_liked_posts_by_user(
         user_id: int,
-        db: Session = Depends(get_db)
+        db: Session = Depends(get_read_db)
 ):
     """Fetch all the liked posts of an user"""
     user = db.query(User).filter_by(id=user_id).first()
@@ -77,7 +91,7 @@ def get_liked_posts_by_user(
         db.query(Post)
         .join(Like, Post.id == Like.post_id)
         .filter(Like.user_id == user_id)
-        .options(joinedload(Post.author)) # alternative to lazy='joined'
+        .options(*loading.POST_WITH_AUTHOR)
         .all()
     )
 
@@ -85,6 +99,7 @@ def get_liked_posts_by_user(
         user_id=user_id,
         liked_posts=[PostLightDTO(
             id=p.id, image_url=p.image_url,
+            width=p.width, height=p.height, blurhash=p.blurhash,
             caption=p.caption, user_id=p.user_id,
             username=p.author.username, user_profile=p.author.profile_picture,
             created_at=p.created_at, hidden_tag=p.hidden_tag
@@ -94,17 +109,20 @@ def get_liked_posts_by_user(
 
 
 @router.get("/get-likes/{post_id}", response_model=PostLikesResponse)
+@db_route
 def get_post_likes(
         post_id: int,
-        db: Session = Depends(get_db)
+        db: Session = Depends(get_read_db)
 ):
-    """Fetch all the likes and users of a post"""
+    """Fetch all the likes and users of a post, cached until the next like or unlike"""
+    return response_cache.response(f"likes:{post_id}", [f"likes:{post_id}"], lambda: _post_likes(db, post_id))
+
+
+def _post_likes(db: Session, post_id: int) -> PostLikesResponse:
     post = db.query(Post).filter_by(id=post_id).first()
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
 
-    likes_count = db.query(Like).filter(Like.post_id == post_id).count()
-
     users = (
         db.query(User.id, User.username, User.profile_picture)
         .join(Like, User.id == Like.user_id)
@@ -113,7 +131,7 @@ def get_post_likes(
     )
     return PostLikesResponse(
         post_id=post_id,
-        likes_count=likes_count,
+        likes_count=post.like_count,
         users=[
             UserLightDTO(
                 id=user.id,
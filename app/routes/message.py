@@ -1,14 +1,14 @@
-import datetime
 from typing import List
 
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.encoders import jsonable_encoder
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.orm import Session
 
 from app.core.config import fast_mqtt
-from app.core.database import get_db
+from app.core.database import get_db, get_read_db, db_route, run_db
 from app.core.utils import jwt_user_id
-from app.models.models import Conversation, User, Message
+from app.models import loading
+from app.models.models import Conversation, User, Message, utc_now
 from app.schemas.message import MessageSent, MessageOut, MessageUpdate, ConversationOut, ConversationDTO, MessageDTO
 from app.schemas.user import UserLightDTO
 
@@ -22,6 +22,14 @@ async def send_message(
         current_user: int = Depends(jwt_user_id)
 ):
     """send message to user and check if conv exist else create a new conversation"""
+    topic, message_dto = await run_db(db, _store_message, current_user, user_id, payload.content)
+    fast_mqtt.publish(topic, jsonable_encoder(message_dto))
+
+    return message_dto
+
+
+def _store_message(db: Session, current_user: int, user_id: int, content: str):
+    """Saves the message, returns the mqtt topic of the conversation and the message"""
     other_user = db.query(User).filter_by(id=user_id).first()
     if other_user.id == current_user:
         raise HTTPException(status_code=400, detail="You cannot talk to yourself")
@@ -39,7 +47,7 @@ async def send_message(
     new_message = Message(
         conversation_id=conversation.id,
         sender_id=current_user,
-        content=payload.content
+        content=content
     )
     db.add(new_message)
     db.commit()
@@ -59,14 +67,12 @@ async def send_message(
         is_read=new_message.is_read
     )
 
-    topic = f"chat/{conversation.id}/messages"
-    fast_mqtt.publish(topic, jsonable_encoder(message_dto))
-
-    return message_dto
+    return f"chat/{conversation.id}/messages", message_dto
 
 
 
 @router.delete("/{message_id}")
+@db_route
 def delete_message(
         message_id: int,
         db: Session = Depends(get_db),
@@ -86,6 +92,7 @@ def delete_message(
     }
 
 @router.patch("/{message_id}", response_model=MessageOut)
+@db_route
 def update_message(
         payload: MessageUpdate,
         message_id: int,
@@ -100,7 +107,7 @@ def update_message(
         raise HTTPException(status_code=403, detail="Not allowed")
 
     message.content = payload.content
-    message.updated_at = datetime.datetime.now(datetime.timezone.utc)
+    message.updated_at = utc_now()
     db.commit()
     db.refresh(message)
 
@@ -110,6 +117,7 @@ def update_message(
     )
 
 @router.get("/conversation/{conversation_id}/content", response_model=ConversationOut)
+@db_route
 def get_conversation_content(
         conversation_id: int,
         db: Session = Depends(get_db),
@@ -123,11 +131,17 @@ def get_conversation_content(
         raise HTTPException(status_code=403, detail="Not authorized to view this conversation")
 
     # display read message
-    for msg in conversation.messages:
-        if msg.sender != current_user and not msg.is_read:
-            msg.is_read = True
+    db.query(Message).filter(
+        Message.conversation_id == conversation.id,
+        Message.sender_id != current_user,
+        Message.is_read == False
+    ).update({Message.is_read: True}, synchronize_session=False)
     db.commit()
-    db.refresh(conversation)
+    conversation = (db.query(Conversation)
+                    .options(*loading.CONVERSATION_WITH_MESSAGES)
+                    .populate_existing()
+                    .filter_by(id=conversation_id)
+                    .first())
 
     message_sorted = sorted(conversation.messages, key=lambda m: m.created_at, reverse=False)
 
@@ -152,17 +166,15 @@ def get_conversation_content(
     )
 
 @router.get("/conversations", response_model=List[ConversationDTO])
+@db_route
 def get_user_conversations(
-        db: Session = Depends(get_db),
+        db: Session = Depends(get_read_db),
         current_user: int = Depends(jwt_user_id)
 ):
     """display all the conversations of the current user"""
     conversations = (
         db.query(Conversation)
-            .options(
-                joinedload(Conversation.user1),
-                joinedload(Conversation.user2)
-            )
+            .options(*loading.CONVERSATION_PARTICIPANTS)
             .filter(
                 (Conversation.user1_id == current_user) |
                 (Conversation.user2_id == current_user)
@@ -1,20 +1,25 @@
 from typing import Optional
 
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Form
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Form, Query, Request
 from sqlalchemy.orm import Session
 
+from app.core.cache import response_cache, invalidate
+from app.core.etag import etag_response
+from app.core.images import Picture
 from app.core.utils import jwt_user_id, upload_picture_util
-from app.models.models import Post, User, Follow, Like, Comment
-from app.core.database import get_db
-from app.schemas.comment import CommentDTO
-from app.schemas.like import LikeDTO
+from app.models import loading
+from app.models.models import Post, User, Like, Comment
+from app.core.database import get_db, get_read_db, db_route, run_db
 from app.schemas.post import PostDTO, PostDetailResponse, FeedResponse, EditPayload, FeedDetailResponse
-from sqlalchemy import func
-
-from app.schemas.user import UserLightDTO
+from app.services import feed, timeline, storage
 
 router = APIRouter(prefix="/post", tags=["post"])
 
+FEED_PAGE_SIZE = 8
+FEED_MAX_PAGE_SIZE = 50
+# pages of the global feed served from the response cache, the deeper ones are read from the database
+FEED_CACHED_PAGES = 3
+
 
 @router.post("/upload", response_model=PostDTO)
 async def upload_post(
@@ -26,15 +31,25 @@ async def upload_post(
     """Upload a post with picture and description"""
     if not user_id:
         raise HTTPException(status_code=403, detail="You are not allowed to post")
-    filename = upload_picture_util(file)
-    new_post = Post(image_url=filename, caption=caption, user_id=user_id)
+    picture = await upload_picture_util(file)
+    return await run_db(db, _create_post, user_id, picture, caption)
+
+
+def _create_post(db: Session, user_id: int, picture: Picture, caption: Optional[str]) -> PostDTO:
+    storage.store(db, picture)
+    new_post = Post(image_url=picture.name, width=picture.width, height=picture.height, blurhash=picture.blurhash,
+                    caption=caption, user_id=user_id)
     db.add(new_post)
+    db.flush()
+    timeline.push_post(db, new_post)
+    invalidate(db, "feed")
     db.commit()
     db.refresh(new_post)
 
     user = db.get(User, user_id)
     return PostDTO(
         id=new_post.id, image_url=new_post.image_url,
+        width=new_post.width, height=new_post.height, blurhash=new_post.blurhash,
         caption=new_post.caption, user_id=user_id,
         username=user.username, user_profile=user.profile_picture,
         created_at=new_post.created_at, hidden_tag=new_post.hidden_tag
@@ -43,46 +58,68 @@ async def upload_post(
 
 
 @router.get("/feed/global", response_model=FeedResponse)
+@db_route
 def global_feed(
-        db: Session = Depends(get_db),
+        cursor: Optional[str] = None,
+        limit: int = Query(FEED_PAGE_SIZE, ge=1, le=FEED_MAX_PAGE_SIZE),
+        viewer: bool = False,
+        db: Session = Depends(get_read_db),
         user_id: int = Depends(jwt_user_id)
 ):
     """ Feed post management. As a reminder, the feed is the page that gathers
-        all recent posts, so it's just a huge fetch of the all most recent
-        posts, and on the frontend if the person scrolls to the eighth one, it triggers another request"""
+        all recent posts, it is served page by page: the frontend sends back the
+        next_cursor of the previous page when the person scrolls to the last post.
+        The first pages are the same for everyone and come from the response cache.
+        ?viewer=true adds your flags (liked, following the author...) to each post, such pages
+        are built for you and skip the cache: /user/viewer-state gives the same flags apart"""
     if not user_id:
         raise HTTPException(status_code=403, detail="You are not allowed to post")
-    posts = db.query(Post).filter_by(hidden_tag=False).order_by(Post.created_at.desc()).all()
-    content = []
-    for p in posts:
-        u = db.get(User, p.user_id)
-        content.append(PostDTO(
-            id=p.id, image_url=p.image_url,
-            caption=p.caption, user_id=p.user_id,
-            username=u.username, user_profile=u.profile_picture,
-            created_at=p.created_at, hidden_tag=p.hidden_tag
-        ))
+    if viewer:
+        return _global_page(db, cursor, limit, viewer_id=user_id)
+    page = 1 if cursor is None else int(response_cache.peek(f"feed:global:page:{cursor}") or 0)
+    if not page:
+        return _global_page(db, cursor, limit)
+    return response_cache.response(
+        f"feed:global:{limit}:{cursor}", ["feed"], lambda: _global_page(db, cursor, limit, page))
+
+
+def _global_page(db: Session, cursor: Optional[str], limit: int, page: int = 0,
+                 viewer_id: Optional[int] = None) -> FeedResponse:
+    content, next_cursor = feed.feed_page(db, feed.post_query(db).filter(Post.hidden_tag == False), cursor, limit,
+                                          viewer_id)
+    if page and next_cursor and page < FEED_CACHED_PAGES:
+        # the page this cursor leads to is cached as well
+        response_cache.set(f"feed:global:page:{next_cursor}", str(page + 1).encode())
     return FeedResponse(
         message="Feed loaded",
-        content=content)
+        content=content,
+        next_cursor=next_cursor)
 
 @router.delete("/delete/{post_id}")
+@db_route
 def delete_post(
         post_id: int,
         db: Session = Depends(get_db),
         user_id: int = Depends(jwt_user_id)
 ):
-    """Delete a post that you own"""
-    p = db.get(Post, post_id)
+    """Delete a post that you own, with its likes and comments"""
+    p = db.get(Post, post_id, options=loading.BARE)
     if not p:
         raise HTTPException(404, "Post not found")
     if p.user_id != user_id:
         raise HTTPException(403, "Unauthorized to delete")
+    timeline.remove_post(db, p.id)
+    invalidate(db, "feed", f"likes:{p.id}")
+    storage.release(db, p.image_url)
+    db.query(Like).filter(Like.post_id == p.id).delete(synchronize_session=False)
+    db.query(Comment).filter(Comment.post_id == p.id).delete(synchronize_session=False)
     db.delete(p)
     db.commit()
+    storage.purge(db, [p.image_url])
     return {"message": "Post deleted successfully"}
 
 @router.post("/edit/{post_id}", response_model=PostDTO)
+@db_route
 def edit_post(
         post_id: int,
         payload: EditPayload,
@@ -103,11 +140,13 @@ def edit_post(
         p.caption = caption
     if hidden is not None:
         p.hidden_tag = hidden
+    invalidate(db, "feed")
     db.commit()
     db.refresh(p)
     user = db.get(User, p.user_id)
     return PostDTO(
         id=p.id, image_url=p.image_url,
+        width=p.width, height=p.height, blurhash=p.blurhash,
         caption=p.caption, user_id=p.user_id,
         username=user.username, user_profile=user.profile_picture,
         created_at=p.created_at, hidden_tag=p.hidden_tag
@@ -115,117 +154,62 @@ def edit_post(
 
 
 @router.get("/feed", response_model=FeedResponse)
+@db_route
 def personal_feed(
-        db: Session = Depends(get_db),
+        request: Request,
+        cursor: Optional[str] = None,
+        limit: int = Query(FEED_PAGE_SIZE, ge=1, le=FEED_MAX_PAGE_SIZE),
+        viewer: bool = False,
+        db: Session = Depends(get_read_db),
         user_id: int = Depends(jwt_user_id)
 ):
-    """Feed of the home page, fetch all content of followed users of the current user and do not display the content that are hidden"""
+    """Feed of the home page, read page by page from the timeline the posts of followed users are pushed to, and do not display the content that are hidden.
+        Answers 304 to an If-None-Match matching the posts of the page. ?viewer=true adds your flags to each post"""
     if not user_id:
         raise HTTPException(status_code=403, detail="You are not allowed to post")
-    followed = db.query(Follow.followed_id).filter(Follow.follower_id == user_id).subquery()
-    posts = db.query(Post).filter(Post.user_id.in_(followed.select()), Post.hidden_tag==False).order_by(Post.created_at.desc()).all()
-    content = []
-    for p in posts:
-        u = db.get(User, p.user_id)
-        content.append(PostDTO(
-            id=p.id, image_url=p.image_url,
-            caption=p.caption, user_id=p.user_id,
-            username=u.username, user_profile=u.profile_picture,
-            created_at=p.created_at, hidden_tag=p.hidden_tag
-        ))
-    return FeedResponse(message="Feed loaded", content=content)
+    rows, next_cursor = timeline.home_rows(db, user_id, cursor, limit)
+    state = feed.rows_viewer_state(db, user_id, rows) if viewer else None
+    etag = feed.page_etag(db, rows, next_cursor, state.version() if state else None)
+    return etag_response(request, etag, lambda: FeedResponse(
+        message="Feed loaded", content=feed.page_dtos(db, rows, state), next_cursor=next_cursor))
 
 
 @router.get("/feed/{username}", response_model=FeedDetailResponse)
+@db_route
 def user_feed(
         username: str,
-        db: Session = Depends(get_db),
+        db: Session = Depends(get_read_db),
         user_id: int = Depends(jwt_user_id)
 ):
     """ Retrieve posts from a specific user (e.g., user profile).
         Get all posts including hidden ones if it's the concerned
         user (token jwt = user_id), otherwise only display the user's public posts."""
-    target = db.query(User).filter_by(username=username).first()
+    target = db.query(User.id).filter_by(username=username).first()
     if not target:
         raise HTTPException(status_code=403, detail="You are not allowed to post")
-    posts = db.query(Post).filter(Post.user_id == target.id)
+    posts = feed.post_query(db).filter(Post.user_id == target.id)
     if target.id != user_id:
-        posts = posts.filter_by(hidden_tag=False)
-    posts = posts.order_by(Post.created_at.desc()).all()
-    content = []
-    for p in posts:
-        u = db.get(User, p.user_id)
-
-        content.append(PostDetailResponse(
-            post=PostDTO(
-                id=p.id, image_url=p.image_url,
-                caption=p.caption, user_id=p.user_id,
-                username=u.username, user_profile=u.profile_picture,
-                created_at=p.created_at, hidden_tag=p.hidden_tag,
-            ),
-            likes=[LikeDTO(
-                id=l.id,
-                post_id=l.post_id,
-                user_id=l.user_id,
-                created_at=l.created_at
-            ) for l in db.query(Like).filter_by(post_id=p.id) ],
-            comments=[CommentDTO(
-                id=c.id,
-                post_id=c.post_id,
-                user=UserLightDTO(
-                    id=c.user_id,
-                    username=db.get(User, c.user_id).username,
-                    profile_picture=db.get(User, c.user_id).profile_picture
-                ),
-                content=c.content,
-                created_at=c.created_at
-            ) for c in db.query(Comment).filter_by(post_id=p.id
-            )],
-        ))
+        posts = posts.filter(Post.hidden_tag == False)
+    posts = posts.order_by(Post.created_at.desc(), Post.id.desc()).all()
     return FeedDetailResponse(
         message="Posts found",
-        content=content
+        content=feed.post_details(db, posts)
     )
 
 
 
 @router.get("/{post_id}", response_model=PostDetailResponse)
+@db_route
 def show_post(
         post_id: int,
-        db: Session = Depends(get_db),
+        request: Request,
+        db: Session = Depends(get_read_db),
         user_id: int = Depends(jwt_user_id)
 ):
-    """Return all the post info with post_id in param"""
+    """Return all the post info with post_id in param, 304 to an If-None-Match of the current version"""
     if not user_id:
         raise HTTPException(status_code=403, detail="You are not allowed to see the post")
-    post = db.get(Post, post_id)
-    if not post:
+    row = feed.post_query(db).filter(Post.id == post_id).first()
+    if not row:
         raise HTTPException(404, "Post not found")
-    user = db.get(User, post.user_id)
-
-    return PostDetailResponse(
-        message="Post found",
-        post=PostDTO(
-            id=post.id, image_url=post.image_url,
-            caption=post.caption, user_id=post.user_id,
-            username=user.username, user_profile=user.profile_picture,
-            created_at=post.created_at, hidden_tag=post.hidden_tag,
-        ),
-        likes=[LikeDTO(
-            id=l.id,
-            post_id=l.post_id,
-            user_id=l.user_id,
-            created_at=l.created_at
-        ) for l in db.query(Like).filter_by(post_id=post_id)],
-        comments=[CommentDTO(
-            id=c.id,
-            post_id=c.post_id,
-            user=UserLightDTO(
-                id=c.user_id,
-                username=db.get(User, c.user_id).username,
-                profile_picture=db.get(User, c.user_id).profile_picture
-            ),
-            content=c.content,
-            created_at=c.created_at
-        ) for c in db.query(Comment).filter_by(post_id=post_id)]
-    )
+    return etag_response(request, feed.page_etag(db, [row]), lambda: feed.post_details(db, [row])[0])
@@ -1,20 +1,27 @@
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Request, Query
 from sqlalchemy.orm import Session
 
+from app.core.cache import response_cache, invalidate
+from app.core.etag import etag_response, weak_etag
+from app.core.images import pick_rendition, is_content_name, Picture
+from app.core.static import serve_file
 from app.core.utils import jwt_user_id, upload_picture_util, UPLOAD_FOLDER
-from app.models.models import User
-from app.core.database import get_db
+from app.core.config import settings
+from app.models.models import User, Suggestion
+from app.core.database import get_db, get_read_db, db_route, run_db
+from app.services import graph, storage
+from app.services.viewer import viewer_state
 from app.schemas.user import UserEditRequest, UserResponse, UserSearchResponse, UserSearchItem, SuggestionDTO, \
-    UserLightDTO
+    SuggestedUserDTO, PostViewerState, ViewerStateRequest, ViewerStateResponse
 import os
 
 router = APIRouter(prefix="/user", tags=["user"])
 
 @router.get("/profile", response_model=UserResponse)
+@db_route
 def get_own_profile(
         user_id: int = Depends(jwt_user_id),
-        db: Session = Depends(get_db)
+        db: Session = Depends(get_read_db)
 ):
     """displays the current user's information"""
     user = db.query(User).filter_by(id=user_id).first()
@@ -23,6 +30,7 @@ def get_own_profile(
     return user
 
 @router.post("/edit", response_model=UserResponse)
+@db_route
 def edit_profile(
         payload: UserEditRequest,
         db: Session = Depends(get_db),
@@ -33,10 +41,12 @@ def edit_profile(
     if not user:
         raise HTTPException(404, detail="User not found")
 
+    invalidate(db, "feed", f"profile:{user.username}")
     if payload.username and payload.username != user.username:
         if db.query(User).filter_by(username=payload.username).first():
             raise HTTPException(400, detail="Username already taken")
         user.username = payload.username
+        invalidate(db, f"profile:{user.username}")
 
     if payload.email and payload.email != user.email:
         if db.query(User).filter_by(email=payload.email).first():
@@ -64,52 +74,88 @@ async def upload_profile_picture(
         user_id: int = Depends(jwt_user_id)
 ):
     """Upload profile picture"""
-    user = db.query(User).filter_by(id=user_id).first()
-    if not user:
+    if not await run_db(db, _user_exists, user_id):
         raise HTTPException(404, detail="User not found")
 
-    picture = upload_picture_util(file)
-    user.profile_picture = picture
+    picture = await upload_picture_util(file)
+    return await run_db(db, _set_profile_picture, user_id, picture)
+
+
+def _user_exists(db: Session, user_id: int) -> bool:
+    return db.query(User.id).filter_by(id=user_id).first() is not None
+
+
+def _set_profile_picture(db: Session, user_id: int, picture: Picture):
+    user = db.query(User).filter_by(id=user_id).first()
+    previous = user.profile_picture
+    storage.store(db, picture)
+    storage.release(db, previous)
+    user.profile_picture = picture.name
+    invalidate(db, "feed", f"profile:{user.username}")
 
     try:
         db.commit()
-        return {
-            "message": "File uploaded successfully",
-            "file_url": f"/user/picture/{picture}"
-        }
     except Exception as e:
         db.rollback()
         raise HTTPException(500, detail=f"Error: {str(e)}")
+    storage.purge(db, [previous])
+    return {
+        "message": "File uploaded successfully",
+        "file_url": f"/user/picture/{picture.name}"
+    }
 
-@router.get("/picture/{filename}")
-def get_profile_picture(filename: str):
-    """displays the image based on the filename"""
+@router.get("/picture/{filename:path}")
+def get_profile_picture(
+        filename: str,
+        request: Request,
+        size: str = Query("full", pattern="^(thumb|medium|full)$")
+):
+    """displays the image based on the filename, in the rendition of `size` and the best format of the Accept header.
+        Content-named pictures are cached as immutable, see app.core.static"""
     abs_upload_folder = os.path.abspath(UPLOAD_FOLDER)
     path = os.path.abspath(os.path.join(UPLOAD_FOLDER, filename))
     if not path.startswith(abs_upload_folder + os.sep):
         raise HTTPException(400, detail=f"Invalid filename: {filename}")
     if not os.path.exists(path):
         raise HTTPException(404, detail="File not found")
-    return FileResponse(path)
+    path, media_type = pick_rendition(abs_upload_folder, filename, size, request.headers.get("accept"))
+    return serve_file(request, abs_upload_folder, path, media_type, is_content_name(filename), {"Vary": "Accept"})
 
 @router.get("/profile/{username}", response_model=UserResponse)
+@db_route
 def get_profile_by_username(
         username: str,
-        db: Session = Depends(get_db),
+        request: Request,
+        db: Session = Depends(get_read_db),
         user_id: int = Depends(jwt_user_id)
 ):
-    """displays a user's profile with their username as a parameter"""
+    """displays a user's profile with their username as a parameter, cached until the user changes.
+        Answers 304 to an If-None-Match of the current version"""
     if not user_id:
         raise HTTPException(403, detail="You must be logged in")
+    version = (db.query(User.id, User.updated_at, User.follower_count, User.following_count)
+               .filter_by(username=username).first())
+    if not version:
+        raise HTTPException(404, detail="User not found")
+    etag = weak_etag(*version)
+    # the version read above is part of the key: a write the stamps of this worker missed (another
+    # worker, counters.repair_counters) cannot pair the new ETag with an old body, and the body is
+    # rendered from the same session, a lagging replica pairs its old version with its old body
+    return etag_response(request, etag, lambda: response_cache.response(
+        f"profile:{username}:{etag}", [f"profile:{username}"], lambda: _profile(db, username)))
+
+
+def _profile(db: Session, username: str) -> UserResponse:
     user = db.query(User).filter_by(username=username).first()
     if not user:
         raise HTTPException(404, detail="User not found")
-    return user
+    return UserResponse.model_validate(user, from_attributes=True)
 
 @router.get("/search/{username}", response_model=UserSearchResponse)
+@db_route
 def search_users(
         username: str,
-        db: Session = Depends(get_db)
+        db: Session = Depends(get_read_db)
 ):
     """displays a user's profile research with their username as a parameter"""
     users = db.query(User).filter(User.username.ilike(f"%{username}%")).all()
@@ -127,14 +173,36 @@ def search_users(
     }
 
 @router.get("/suggestions", response_model=SuggestionDTO)
+@db_route
 def suggestion_users(
-        db: Session = Depends(get_db)
+        limit: int = Query(10, ge=1, le=settings.SUGGESTION_COUNT),
+        user_id: int = Depends(jwt_user_id),
+        db: Session = Depends(get_read_db)
+):
+    """accounts followed by the accounts you follow, by mutual count then recent activity (see app.services.suggestions)"""
+    rows = (db.query(User.id, User.username, User.profile_picture, Suggestion.mutuals)
+            .join(Suggestion, Suggestion.suggested_id == User.id)
+            .filter(Suggestion.user_id == user_id)
+            .order_by(Suggestion.score.desc())
+            .all())
+    # accounts followed since the last run of the job
+    followed = graph.follows_many(db, user_id, [row.id for row in rows])
+    return SuggestionDTO(user=[
+        SuggestedUserDTO(id=row.id, username=row.username, profile_picture=row.profile_picture, mutuals=row.mutuals)
+        for row in rows if row.id not in followed
+    ][:limit])
+
+@router.post("/viewer-state", response_model=ViewerStateResponse)
+@db_route
+def get_viewer_state(
+        payload: ViewerStateRequest,
+        user_id: int = Depends(jwt_user_id),
+        db: Session = Depends(get_read_db)
 ):
-    """only for test, to enhance later..."""
-    return SuggestionDTO(
-        user=[UserLightDTO(
-            id=1,
-            username="dev",
-            profile_picture="default.jpg"
-        )]
-    )
\ No newline at end of file
+    """your flags on the cards of a page: the posts you liked, and for each user whether you follow them,
+        they follow you, or both. At most three queries whatever the number of ids (see app.services.viewer)"""
+    state = viewer_state(db, user_id, payload.post_ids, payload.user_ids)
+    return ViewerStateResponse(
+        posts={post_id: PostViewerState(liked=post_id in state.liked) for post_id in payload.post_ids},
+        users={other: state.user(other) for other in payload.user_ids},
+    )
@@ -17,11 +17,23 @@ class TokenRequest(BaseModel):
     token: str
 
 
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+
 class AuthResponse(BaseModel):
     token: str
     user_id: int
     username: str
     profile_picture: Optional[str] = None
+    refresh_token: Optional[str] = None
+    expires_in: Optional[int] = None
+
+
+class TokenResponse(BaseModel):
+    token: str
+    refresh_token: str
+    expires_in: int
 
 
 class MessageResponse(BaseModel):
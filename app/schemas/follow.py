@@ -1,6 +1,6 @@
 from datetime import datetime
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 class FollowResponse(BaseModel):
     id: int
@@ -13,3 +13,14 @@ class FollowUserOut(BaseModel):
     username: str
     profile_picture: str | None
     followed_at: str
+
+# usernames followed by one /follow/many call
+FOLLOW_MANY_MAX = 500
+
+class FollowManyRequest(BaseModel):
+    usernames: list[str] = Field(max_length=FOLLOW_MANY_MAX)
+
+class FollowManyResponse(BaseModel):
+    # ids of the users followed by this call, the ones already followed are not repeated
+    followed: list[int]
+    count: int
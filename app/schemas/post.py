@@ -1,16 +1,34 @@
-from pydantic import BaseModel
-from typing import Optional, List
+from pydantic import BaseModel, computed_field
+from typing import Optional, List, Dict
 from datetime import datetime
 
+from app.core.images import rendition_urls
+from app.schemas.comment import CommentDTO
+from app.schemas.user import PostViewerState
+
 class PostDTO(BaseModel):
     id: int
     image_url: str
+    width: Optional[int] = None
+    height: Optional[int] = None
+    blurhash: Optional[str] = None
     caption: Optional[str]
     user_id: int
     username: str
     user_profile: Optional[str]
     created_at: datetime
     hidden_tag: bool
+    likes_count: Optional[int] = None
+    comments_count: Optional[int] = None
+    comments_preview: Optional[List[CommentDTO]] = None
+    # flags of the current user, on the feeds requested with ?viewer=true
+    viewer: Optional[PostViewerState] = None
+
+    @computed_field
+    @property
+    def images(self) -> Dict[str, str]:
+        """thumb / medium / full URLs of image_url, the feed grid only needs the thumb"""
+        return rendition_urls(self.image_url)
 
     class ConfigDict:
         from_attributes = True
@@ -35,6 +53,7 @@ class PostDetailResponse(BaseModel):
 class FeedResponse(BaseModel):
     message: str
     content: List[PostDTO]
+    next_cursor: Optional[str] = None
 
 class EditPayload(BaseModel):
     caption: str
@@ -47,11 +66,19 @@ class FeedDetailResponse(BaseModel):
 class PostLightDTO(BaseModel):
     id: int
     image_url: str
+    width: Optional[int] = None
+    height: Optional[int] = None
+    blurhash: Optional[str] = None
     caption: Optional[str]
     user_id: int
     username: str
     user_profile: Optional[str]
     created_at: datetime
 
+    @computed_field
+    @property
+    def images(self) -> Dict[str, str]:
+        return rendition_urls(self.image_url)
+
     class ConfigDict:
         from_attributes = True
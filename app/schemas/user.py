@@ -1,5 +1,5 @@
-from pydantic import BaseModel, EmailStr, constr
-from typing import Optional, List
+from pydantic import BaseModel, EmailStr, Field, constr
+from typing import Optional, List, Dict
 from datetime import datetime
 
 
@@ -19,6 +19,8 @@ class UserResponse(BaseModel):
     gender: Optional[str]
     profile_picture: Optional[str]
     created_at: datetime
+    follower_count: int = 0
+    following_count: int = 0
 
     class ConfigDict:
         from_attributes = True
@@ -39,5 +41,30 @@ class UserLightDTO(BaseModel):
     class ConfigDict:
         from_attributes = True
 
+class SuggestedUserDTO(UserLightDTO):
+    # accounts followed by the current user that follow this one
+    mutuals: int = 0
+
 class SuggestionDTO(BaseModel):
-    user: List[UserLightDTO]
\ No newline at end of file
+    user: List[SuggestedUserDTO]
+
+# ids of posts, and of users, answered by one /user/viewer-state call
+VIEWER_STATE_MAX_IDS = 100
+
+class UserViewerState(BaseModel):
+    following: bool
+    followed_by: bool
+    mutual: bool
+
+class PostViewerState(BaseModel):
+    liked: bool
+    # relationship with the author of the post
+    author: Optional[UserViewerState] = None
+
+class ViewerStateRequest(BaseModel):
+    post_ids: List[int] = Field(default_factory=list, max_length=VIEWER_STATE_MAX_IDS)
+    user_ids: List[int] = Field(default_factory=list, max_length=VIEWER_STATE_MAX_IDS)
+
+class ViewerStateResponse(BaseModel):
+    posts: Dict[int, PostViewerState]
+    users: Dict[int, UserViewerState]
@@ -0,0 +1,61 @@
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+from app.models.models import Post, User, Like, Comment, Follow
+
+
+def bump(db: Session, counter, row_id: int, delta: int = 1):
+    """Atomic `counter = counter + delta` in the database, part of the caller's transaction
+        so the counter is committed (or rolled back) with the write it counts"""
+    model = counter.class_
+    db.query(model).filter(model.id == row_id).update({counter: counter + delta}, synchronize_session=False)
+
+
+def follow_added(db: Session, follower_id: int, followed_id: int, delta: int = 1):
+    bump(db, User.following_count, follower_id, delta)
+    bump(db, User.follower_count, followed_id, delta)
+
+
+def follow_removed(db: Session, follower_id: int, followed_id: int):
+    follow_added(db, follower_id, followed_id, -1)
+
+
+def follows_added(db: Session, follower_id: int, followed_ids: list[int]):
+    """follow_added for many followed users in two statements"""
+    if not followed_ids:
+        return
+    bump(db, User.following_count, follower_id, len(followed_ids))
+    db.execute(update(User).where(User.id.in_(followed_ids)).values(follower_count=User.follower_count + 1))
+
+
+def repair_counters(db: Session) -> dict[str, int]:
+    """Recomputes every counter in bulk and rewrites only the rows that drifted.
+        Returns the number of repaired rows per counter"""
+    recounts = {
+        Post.like_count: select(func.count(Like.id)).where(Like.post_id == Post.id),
+        Post.comment_count: select(func.count(Comment.id)).where(Comment.post_id == Post.id),
+        User.follower_count: select(func.count(Follow.id)).where(Follow.followed_id == User.id),
+        User.following_count: select(func.count(Follow.id)).where(Follow.follower_id == User.id),
+    }
+    repaired = {}
+    for counter, recount in recounts.items():
+        recount = recount.scalar_subquery()
+        result = db.execute(
+            update(counter.class_)
+            .where(counter != recount)
+            .values({counter.key: recount})
+        )
+        repaired[f"{counter.class_.__tablename__}.{counter.key}"] = result.rowcount
+    db.commit()
+    return repaired
+
+
+if __name__ == "__main__":
+    from app.core.database import SessionLocal
+
+    session = SessionLocal()
+    try:
+        for name, count in repair_counters(session).items():
+            print(f"{name}: {count} rows repaired")
+    finally:
+        session.close()
@@ -0,0 +1,167 @@
+from collections import defaultdict
+from typing import Optional
+
+from sqlalchemy import func, tuple_
+from sqlalchemy.orm import Session
+
+from app.core.etag import weak_etag
+from app.core.utils import encode_cursor, decode_cursor
+from app.models import loading
+from app.models.models import Post, User, Like, Comment
+from app.schemas.comment import CommentDTO
+from app.schemas.like import LikeDTO
+from app.schemas.post import PostDTO, PostDetailResponse
+from app.schemas.user import UserLightDTO
+from app.services.viewer import ViewerState, viewer_state
+
+COMMENT_PREVIEW_SIZE = 2
+
+
+def post_query(db: Session):
+    """Posts with their author and counters in the same row: (Post, username, profile_picture, likes_count, comments_count)"""
+    return (
+        db.query(Post, User.username, User.profile_picture,
+                 Post.like_count.label("likes_count"), Post.comment_count.label("comments_count"))
+        .join(User, User.id == Post.user_id)
+        .options(*loading.BARE)
+    )
+
+
+def page_rows(query, after, limit: int, key=(Post.created_at, Post.id)):
+    """Up to limit + 1 rows after the (created_at, id) position, newest first.
+        `key` lets a source that copies the post key (e.g. the timeline) use its own index"""
+    if after:
+        query = query.filter(tuple_(*key) < after)
+    return query.order_by(*(column.desc() for column in key)).limit(limit + 1).all()
+
+
+def cut_page(rows, limit: int):
+    """Splits limit + 1 rows into the page and the cursor of the next one (None on the last page)"""
+    if len(rows) <= limit:
+        return rows, None
+    last = rows[limit - 1].Post
+    return rows[:limit], encode_cursor(last.created_at, last.id)
+
+
+def paginate(query, cursor: Optional[str], limit: int, key=(Post.created_at, Post.id)):
+    """Keyset pagination of a post query on (created_at, id), newest first.
+        Returns the rows of the page and the cursor of the next one (None on the last page)"""
+    return cut_page(page_rows(query, decode_cursor(cursor), limit, key), limit)
+
+
+def rows_etag(rows, *extra) -> str:
+    """Weak ETag of post rows from their version columns, before the comments are loaded and the page is rendered"""
+    return weak_etag(*extra, *(
+        (r.Post.id, r.Post.updated_at, r.likes_count, r.comments_count, r.username, r.profile_picture)
+        for r in rows
+    ))
+
+
+def commenters_version(db: Session, post_ids: list[int]):
+    """Latest change of the users who commented the posts, whose names and pictures the comments show"""
+    if not post_ids:
+        return None
+    return (db.query(func.max(User.updated_at))
+            .join(Comment, Comment.user_id == User.id)
+            .filter(Comment.post_id.in_(post_ids))
+            .scalar())
+
+
+def page_etag(db: Session, rows, *extra) -> str:
+    """rows_etag covering the commenters as well: a rename or a new picture of one of them changes the tag"""
+    return rows_etag(rows, commenters_version(db, [r.Post.id for r in rows]), *extra)
+
+
+def rows_viewer_state(db: Session, viewer_id: int, rows) -> ViewerState:
+    """Flags of the current user on the posts of the rows and their authors"""
+    return viewer_state(db, viewer_id, [r.Post.id for r in rows], [r.Post.user_id for r in rows])
+
+
+def page_dtos(db: Session, rows, viewer: Optional[ViewerState] = None) -> list[PostDTO]:
+    """PostDTOs of a page of rows, the comment previews being loaded in one query"""
+    previews = comments_preview(db, [r.Post.id for r in rows])
+    return [to_post_dto(r, previews.get(r.Post.id, []), viewer) for r in rows]
+
+
+def to_post_dto(row, comments_preview: Optional[list[CommentDTO]] = None,
+                viewer: Optional[ViewerState] = None) -> PostDTO:
+    p = row.Post
+    return PostDTO(
+        id=p.id, image_url=p.image_url,
+        width=p.width, height=p.height, blurhash=p.blurhash,
+        caption=p.caption, user_id=p.user_id,
+        username=row.username, user_profile=row.profile_picture,
+        created_at=p.created_at, hidden_tag=p.hidden_tag,
+        likes_count=row.likes_count, comments_count=row.comments_count,
+        comments_preview=comments_preview,
+        viewer=viewer.post(p.id, p.user_id) if viewer else None
+    )
+
+
+def _comment_dto(c) -> CommentDTO:
+    return CommentDTO(
+        id=c.id, content=c.content,
+        created_at=c.created_at, post_id=c.post_id,
+        user=UserLightDTO(
+            id=c.user_id,
+            username=c.username,
+            profile_picture=c.profile_picture
+        )
+    )
+
+
+def _comment_columns():
+    return (Comment.id, Comment.post_id, Comment.content, Comment.created_at,
+            Comment.user_id, User.username, User.profile_picture)
+
+
+def comments_preview(db: Session, post_ids: list[int], size: int = COMMENT_PREVIEW_SIZE) -> dict[int, list[CommentDTO]]:
+    """The `size` latest comments of every post in one query"""
+    if not post_ids:
+        return {}
+    position = func.row_number().over(
+        partition_by=Comment.post_id,
+        order_by=(Comment.created_at.desc(), Comment.id.desc())
+    ).label("position")
+    ranked = (db.query(*_comment_columns(), position)
+              .join(User, User.id == Comment.user_id)
+              .filter(Comment.post_id.in_(post_ids))
+              .subquery())
+    previews = defaultdict(list)
+    for c in db.query(ranked).filter(ranked.c.position <= size).order_by(ranked.c.post_id, ranked.c.position):
+        previews[c.post_id].append(_comment_dto(c))
+    return previews
+
+
+def feed_page(db: Session, query, cursor: Optional[str], limit: int,
+              viewer_id: Optional[int] = None) -> tuple[list[PostDTO], Optional[str]]:
+    """One page of a feed in two queries: posts with authors and counters, then the comment previews.
+        With a viewer_id, the flags of that user come with each post (see app.services.viewer)"""
+    rows, next_cursor = paginate(query, cursor, limit)
+    viewer = rows_viewer_state(db, viewer_id, rows) if viewer_id else None
+    return page_dtos(db, rows, viewer), next_cursor
+
+
+def post_details(db: Session, rows) -> list[PostDetailResponse]:
+    """Posts with all their likes and comments in three queries whatever the number of posts"""
+    post_ids = [r.Post.id for r in rows]
+    likes = defaultdict(list)
+    comments = defaultdict(list)
+    if post_ids:
+        for l in db.query(Like).filter(Like.post_id.in_(post_ids)).options(*loading.BARE):
+            likes[l.post_id].append(LikeDTO(
+                id=l.id,
+                post_id=l.post_id,
+                user_id=l.user_id,
+                created_at=l.created_at
+            ))
+        for c in (db.query(*_comment_columns())
+                  .join(User, User.id == Comment.user_id)
+                  .filter(Comment.post_id.in_(post_ids))
+                  .order_by(Comment.created_at)):
+            comments[c.post_id].append(_comment_dto(c))
+    return [PostDetailResponse(
+        post=to_post_dto(r),
+        likes=likes[r.Post.id],
+        comments=comments[r.Post.id]
+    ) for r in rows]
@@ -0,0 +1,202 @@
+"""Follow graph held in memory by each worker, for relationship checks over a whole page of users.
+
+Each user maps to the sorted array of the ids they follow (4 bytes per follow), so "does A follow
+B" is a binary search and a page of 50 users costs 50 of them instead of a query. The follows and
+unfollows committed by the worker are applied once their transaction commits, like the cache bumps
+of app.core.cache. graph_sync_loop reloads the whole table every FOLLOW_GRAPH_SYNC_INTERVAL
+seconds, bringing in the writes served by the other workers and repairing any drift.
+
+Until the first load completes, and with FOLLOW_GRAPH_ENABLED off, the checks query the database.
+The writes keep checking the database: the index may miss the follows of another worker for
+one interval, which is fine for display but not for a constraint.
+"""
+import asyncio
+import logging
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Iterable, Optional
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.models import Follow
+
+logger = logging.getLogger(__name__)
+
+
+def _contains(values: Optional[array], value: int) -> bool:
+    if not values:
+        return False
+    i = bisect_left(values, value)
+    return i < len(values) and values[i] == value
+
+
+def _insert(index: dict[int, array], follower_id: int, followed_id: int):
+    values = index.setdefault(follower_id, array('i'))
+    i = bisect_left(values, followed_id)
+    if i == len(values) or values[i] != followed_id:
+        values.insert(i, followed_id)
+
+
+def _remove(index: dict[int, array], follower_id: int, followed_id: int):
+    values = index.get(follower_id)
+    if values is None:
+        return
+    i = bisect_left(values, followed_id)
+    if i < len(values) and values[i] == followed_id:
+        del values[i]
+        if not values:
+            del index[follower_id]
+
+
+class FollowGraph:
+    """follower id -> sorted array of the followed ids"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.following: dict[int, array] = {}
+        self.ready = False
+        self.loaded_at: Optional[float] = None
+        # changes applied while a reload reads the table, replayed on the new index
+        self._pending: Optional[list[tuple[bool, int, int]]] = None
+
+    def apply(self, added: bool, follower_id: int, followed_id: int):
+        with self.lock:
+            (_insert if added else _remove)(self.following, follower_id, followed_id)
+            if self._pending is not None:
+                self._pending.append((added, follower_id, followed_id))
+
+    def follows(self, follower_id: int, followed_id: int) -> bool:
+        return _contains(self.following.get(follower_id), followed_id)
+
+    def following_of(self, follower_id: int) -> array:
+        return self.following.get(follower_id, array('i'))
+
+    def follows_many(self, follower_id: int, user_ids: Iterable[int]) -> set[int]:
+        """The users among `user_ids` that `follower_id` follows"""
+        values = self.following.get(follower_id)
+        return {u for u in user_ids if _contains(values, u)}
+
+    def followers_among(self, followed_id: int, user_ids: Iterable[int]) -> set[int]:
+        """The users among `user_ids` that follow `followed_id`"""
+        return {u for u in user_ids if self.follows(u, followed_id)}
+
+    def load(self, edges: Iterable[tuple[int, int]]):
+        """Replaces the index with the (follower_id, followed_id) edges, keeping the writes applied meanwhile"""
+        self.begin_load()
+        self.finish_load(edges)
+
+    def begin_load(self):
+        """Starts recording the writes to replay on the next index. Call it before the snapshot of the
+            edges is taken, a write committed in between would be lost otherwise"""
+        with self.lock:
+            self._pending = []
+
+    def cancel_load(self):
+        """Stops the recording of begin_load(), the current index stays"""
+        with self.lock:
+            self._pending = None
+
+    def finish_load(self, edges: Iterable[tuple[int, int]]):
+        """Builds the index from the edges read since begin_load() and swaps it in"""
+        try:
+            lists = defaultdict(list)
+            for follower_id, followed_id in edges:
+                lists[follower_id].append(followed_id)
+            index = {follower_id: array('i', sorted(ids)) for follower_id, ids in lists.items()}
+        except BaseException:
+            self.cancel_load()
+            raise
+        with self.lock:
+            for added, follower_id, followed_id in self._pending:
+                (_insert if added else _remove)(index, follower_id, followed_id)
+            self.following = index
+            self._pending = None
+            self.ready = True
+            self.loaded_at = time.time()
+
+    def clear(self):
+        with self.lock:
+            self.following = {}
+            self.ready = False
+            self.loaded_at = None
+
+    def metrics(self) -> dict:
+        return {
+            "ready": self.ready,
+            "loaded_at": self.loaded_at,
+            "users": len(self.following),
+            "follows": sum(len(v) for v in self.following.values()),
+            "bytes": sum(v.itemsize * len(v) for v in self.following.values()),
+        }
+
+
+follow_graph = FollowGraph()
+
+
+def record(db: Session, follower_id: int, followed_id: int, added: bool = True):
+    """Applies a follow (or an unfollow) to the index once the session commits, a rollback drops it"""
+    db.info.setdefault("graph_changes", []).append((added, follower_id, followed_id))
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_on_commit(session):
+    for change in session.info.pop("graph_changes", ()):
+        follow_graph.apply(*change)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_on_rollback(session):
+    session.info.pop("graph_changes", None)
+
+
+def _indexed() -> bool:
+    return settings.FOLLOW_GRAPH_ENABLED and follow_graph.ready
+
+
+def follows_many(db: Session, follower_id: int, user_ids: Iterable[int]) -> set[int]:
+    """The users among `user_ids` followed by `follower_id`"""
+    user_ids = set(user_ids)
+    if _indexed() or not user_ids:
+        return follow_graph.follows_many(follower_id, user_ids)
+    return set(db.scalars(select(Follow.followed_id)
+                          .where(Follow.follower_id == follower_id, Follow.followed_id.in_(user_ids))))
+
+
+def followers_among(db: Session, followed_id: int, user_ids: Iterable[int]) -> set[int]:
+    """The users among `user_ids` following `followed_id`"""
+    user_ids = set(user_ids)
+    if _indexed() or not user_ids:
+        return follow_graph.followers_among(followed_id, user_ids)
+    return set(db.scalars(select(Follow.follower_id)
+                          .where(Follow.followed_id == followed_id, Follow.follower_id.in_(user_ids))))
+
+
+def load_graph(db: Session):
+    """Loads the whole follow table into the index, streamed by chunks"""
+    follow_graph.begin_load()
+    try:
+        rows = db.execute(select(Follow.follower_id, Follow.followed_id).execution_options(yield_per=10000))
+    except BaseException:
+        follow_graph.cancel_load()
+        raise
+    follow_graph.finish_load((row.follower_id, row.followed_id) for row in rows)
+
+
+def reconcile():
+    from app.core.database import SessionLocal
+
+    with SessionLocal() as db:
+        load_graph(db)
+
+
+async def graph_sync_loop():
+    while True:
+        try:
+            await asyncio.to_thread(reconcile)
+        except Exception as e:
+            logger.warning("follow graph not reloaded: %s", e)
+        await asyncio.sleep(settings.FOLLOW_GRAPH_SYNC_INTERVAL)
@@ -0,0 +1,63 @@
+"""Backfill of the width, height and blurhash of the posts uploaded before they were stored.
+
+New posts get them from the upload pipeline (app.core.images.transcode). The older ones are read
+back from their full rendition, decoded in JPEG draft mode at the smallest scale the blurhash
+needs, by batches of posts committed one at a time:
+
+    python -m app.services.placeholders
+"""
+import os
+
+from PIL import Image, UnidentifiedImageError
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from app.core.cache import invalidate
+from app.core.images import blurhash
+from app.core.utils import UPLOAD_FOLDER
+from app.models.models import Post
+
+
+def layout(path: str) -> tuple[int, int, str]:
+    """Width, height and blurhash of a stored picture"""
+    with Image.open(path) as image:
+        width, height = image.size
+        image.draft("RGB", (32, 32))
+        return width, height, blurhash(image.convert("RGB"))
+
+
+def backfill_placeholders(db: Session, batch_size: int = 200) -> dict[str, int]:
+    """Fills the posts without dimensions, walking them by id. Returns the filled and missing counts"""
+    counts = {"filled": 0, "missing": 0}
+    last_id = 0
+    while True:
+        rows = db.execute(
+            select(Post.id, Post.image_url)
+            .where(Post.width.is_(None), Post.id > last_id)
+            .order_by(Post.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return counts
+        for post_id, image_url in rows:
+            try:
+                width, height, placeholder = layout(os.path.join(UPLOAD_FOLDER, image_url))
+            except (FileNotFoundError, UnidentifiedImageError, OSError, Image.DecompressionBombError):
+                counts["missing"] += 1
+                continue
+            db.execute(update(Post).where(Post.id == post_id).values(width=width, height=height, blurhash=placeholder))
+            counts["filled"] += 1
+        last_id = rows[-1].id
+        invalidate(db, "feed")
+        db.commit()
+
+
+if __name__ == "__main__":
+    from app.core.database import SessionLocal
+
+    session = SessionLocal()
+    try:
+        counts = backfill_placeholders(session)
+        print(f"{counts['filled']} posts filled, {counts['missing']} pictures missing, unreadable or too large")
+    finally:
+        session.close()
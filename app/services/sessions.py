@@ -0,0 +1,131 @@
+"""Login sessions: short-lived access tokens and rotating refresh tokens.
+
+A login opens a session row and returns an access token (JWT with the user and session ids,
+valid ACCESS_TOKEN_MINUTES) and a refresh token `<session id>.<secret>` whose hash is stored on
+the row. /auth/refresh trades a refresh token for a new pair, without the password and its argon2
+verification. The secret rotates on each refresh, so a refresh token presented twice was copied:
+the session is revoked.
+
+Revoked sessions are refused without a query by app.core.revocations, which the loop below keeps
+in sync with the database on every worker.
+"""
+import asyncio
+import datetime
+import hashlib
+import hmac
+import logging
+import secrets
+import uuid
+from typing import Optional
+
+import jwt
+from sqlalchemy import delete, or_, select, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.revocations import revoked_sessions
+from app.models.models import UserSession, utc_now
+
+logger = logging.getLogger(__name__)
+
+
+def _aware(value: datetime.datetime) -> datetime.datetime:
+    return value if value.tzinfo else value.replace(tzinfo=datetime.UTC)
+
+
+def _hash(secret: str) -> str:
+    return hashlib.sha256(secret.encode()).hexdigest()
+
+
+def access_token(user_id: int, session_id: str) -> str:
+    return jwt.encode({
+        "id": user_id,
+        "sid": session_id,
+        "exp": datetime.datetime.now(datetime.UTC) + datetime.timedelta(minutes=settings.ACCESS_TOKEN_MINUTES)
+    }, settings.SECRET_KEY, algorithm="HS256")
+
+
+def _tokens(session: UserSession) -> dict:
+    """New access token and new refresh token of the session, the hash of the latter goes on the row"""
+    secret = secrets.token_urlsafe(32)
+    session.refresh_hash = _hash(secret)
+    return {
+        "token": access_token(session.user_id, session.id),
+        "refresh_token": f"{session.id}.{secret}",
+        "expires_in": settings.ACCESS_TOKEN_MINUTES * 60,
+    }
+
+
+def open_session(db: Session, user_id: int) -> dict:
+    session = UserSession(id=uuid.uuid4().hex, user_id=user_id, refresh_hash="",
+                          expires_at=utc_now() + datetime.timedelta(days=settings.REFRESH_TOKEN_DAYS))
+    tokens = _tokens(session)
+    db.add(session)
+    db.commit()
+    return tokens
+
+
+def refresh_session(db: Session, refresh_token: str) -> Optional[dict]:
+    """New tokens for a valid refresh token, None otherwise. A refresh token already used revokes its session"""
+    session_id, _, secret = refresh_token.partition(".")
+    session = db.query(UserSession).filter(UserSession.id == session_id).with_for_update().first()
+    if session is None or session.revoked_at is not None or session.expires_at < utc_now():
+        return None
+    if not hmac.compare_digest(session.refresh_hash, _hash(secret)):
+        logger.warning("refresh token of session %s reused, session revoked", session_id)
+        revoke_session(db, session_id)
+        return None
+    tokens = _tokens(session)
+    db.commit()
+    return {**tokens, "user_id": session.user_id}
+
+
+def revoke_session(db: Session, session_id: str):
+    db.execute(update(UserSession)
+               .where(UserSession.id == session_id, UserSession.revoked_at.is_(None))
+               .values(revoked_at=utc_now()))
+    db.commit()
+    revoked_sessions.add(session_id)
+
+
+def recent_revocations(db: Session) -> list[tuple[str, float]]:
+    since = utc_now() - datetime.timedelta(seconds=revoked_sessions.window())
+    rows = db.execute(select(UserSession.id, UserSession.revoked_at).where(UserSession.revoked_at > since))
+    return [(session_id, _aware(revoked_at).timestamp()) for session_id, revoked_at in rows]
+
+
+def sync_revocations():
+    from app.core.database import SessionLocal
+
+    with SessionLocal() as db:
+        revoked_sessions.replace(recent_revocations(db))
+
+
+async def revocation_sync_loop():
+    while True:
+        try:
+            await asyncio.to_thread(sync_revocations)
+        except Exception as e:
+            logger.warning("revoked sessions not synced: %s", e)
+        await asyncio.sleep(settings.SESSION_SYNC_INTERVAL)
+
+
+def purge_sessions(db: Session) -> int:
+    """Deletes the expired sessions and the revoked ones no access token can use anymore"""
+    revoked_before = utc_now() - datetime.timedelta(seconds=revoked_sessions.window())
+    result = db.execute(delete(UserSession).where(or_(
+        UserSession.expires_at < utc_now(),
+        UserSession.revoked_at < revoked_before,
+    )))
+    db.commit()
+    return result.rowcount
+
+
+if __name__ == "__main__":
+    from app.core.database import SessionLocal
+
+    session = SessionLocal()
+    try:
+        print(f"{purge_sessions(session)} sessions purged")
+    finally:
+        session.close()
@@ -0,0 +1,79 @@
+"""Content-addressed storage of the uploaded pictures.
+
+A picture is named after the hash of its normalized full JPEG and stored in a sharded tree
+(public/uploads/ab/cd/abcd...jpg, with its renditions next to it), so reposting the same image
+stores it once. The `upload` table counts the posts and profiles referencing each picture.
+
+The files are written and removed while the row of the picture is locked by the same
+transaction: a purge and an upload of the same bytes cannot interleave.
+"""
+import os
+import uuid
+from typing import Iterable, Optional
+
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+
+from app.core.database import upsert
+from app.core.images import Picture, RENDITIONS, FORMATS, rendition_name
+from app.core.utils import UPLOAD_FOLDER
+from app.models.models import Upload
+
+
+def _write(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def store(db: Session, picture: Picture):
+    """Takes a reference on the picture and writes the files that are not on disk yet"""
+    stmt = upsert(db, Upload).values(name=picture.name, ref_count=1)
+    db.execute(stmt.on_conflict_do_update(index_elements=[Upload.name], set_={"ref_count": Upload.ref_count + 1}))
+    for relative, data in picture.files.items():
+        path = os.path.join(UPLOAD_FOLDER, relative)
+        if not os.path.exists(path):
+            _write(path, data)
+
+
+def release(db: Session, name: Optional[str]):
+    """Drops a reference, the files stay until purge(). Pictures without a row (default, older uploads) are left alone"""
+    if name:
+        db.query(Upload).filter(Upload.name == name).update(
+            {Upload.ref_count: Upload.ref_count - 1}, synchronize_session=False)
+
+
+def _remove(name: str):
+    for rendition in RENDITIONS:
+        for fmt in FORMATS:
+            try:
+                os.remove(os.path.join(UPLOAD_FOLDER, rendition_name(name, rendition, fmt)))
+            except FileNotFoundError:
+                pass
+
+
+def purge(db: Session, names: Optional[Iterable[str]] = None) -> int:
+    """Removes the pictures that are not referenced anymore (among `names` if given), one transaction each"""
+    query = select(Upload.name).where(Upload.ref_count <= 0)
+    if names is not None:
+        query = query.where(Upload.name.in_(list(names)))
+    removed = 0
+    for name in db.scalars(query).all():
+        # the delete locks the row: a concurrent store() of the same picture waits for the files to be gone
+        if db.execute(delete(Upload).where(Upload.name == name, Upload.ref_count <= 0)).rowcount:
+            _remove(name)
+            removed += 1
+        db.commit()
+    return removed
+
+
+if __name__ == "__main__":
+    from app.core.database import SessionLocal
+
+    session = SessionLocal()
+    try:
+        print(f"{purge(session)} unreferenced pictures removed")
+    finally:
+        session.close()
@@ -0,0 +1,127 @@
+"""Follow suggestions: accounts followed by the accounts a user follows, precomputed for every user.
+
+The job reads the whole follow table once into the arrays of app.services.graph and walks it: for
+each user, every account followed by an account they follow is a candidate, and its number of
+mutuals is the size of `following(user) ∩ followers(candidate)`, counted in a single pass over the
+two-hop neighbourhood. Accounts following more than SUGGESTION_MAX_FANOUT others are skipped as
+intermediates, they would make every one of their follows a candidate of all their followers.
+
+The score is the mutual count plus a recency bonus below 1, `1 / (1 + days since the last post)`,
+so mutuals rank first and recent activity breaks the ties. Users with fewer candidates than
+SUGGESTION_COUNT are topped up with the most followed accounts, ranked by the same bonus.
+
+The top SUGGESTION_COUNT of each user go to the suggestion table, replaced by chunks of users
+committed one at a time, and /user/suggestions reads them with one indexed query. Run it
+periodically (cron, a scheduled container):
+
+    python -m app.services.suggestions
+"""
+import heapq
+from collections import Counter
+from datetime import datetime
+from typing import Iterable, Iterator, Mapping, Optional, Sequence
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.models import Follow, Post, Suggestion, User, utc_now
+from app.services.graph import FollowGraph
+
+# users whose rows are replaced per transaction
+CHUNK_SIZE = 1000
+
+
+def _naive(value: datetime) -> datetime:
+    return value.replace(tzinfo=None) if value.tzinfo else value
+
+
+def activity(last_post: Optional[datetime], now: datetime) -> float:
+    """Bonus in [0, 1) of an account that posted at `last_post`, 0 without posts"""
+    if last_post is None:
+        return 0.0
+    days = max((_naive(now) - _naive(last_post)).total_seconds(), 0) / 86400
+    return 1 / (1 + days)
+
+
+def rank(user_id: int, following: Mapping[int, Sequence[int]], bonus: Mapping[int, float],
+         popular: Sequence[int], top_n: int, max_fanout: int) -> list[tuple[int, int, float]]:
+    """The top_n (suggested id, mutuals, score) of a user, best first"""
+    followed = following.get(user_id, ())
+    mutuals = Counter()
+    for friend in followed:
+        theirs = following.get(friend, ())
+        if len(theirs) <= max_fanout:
+            mutuals.update(theirs)
+    excluded = set(followed)
+    excluded.add(user_id)
+    for other in excluded:
+        mutuals.pop(other, None)
+
+    best = heapq.nlargest(top_n, ((count + bonus.get(candidate, 0.0), candidate, count)
+                                  for candidate, count in mutuals.items()))
+    if len(best) < top_n:
+        chosen = excluded.union(mutuals)
+        fill = heapq.nlargest(top_n - len(best), ((bonus.get(candidate, 0.0), candidate, 0)
+                                                  for candidate in popular if candidate not in chosen))
+        best.extend(fill)
+    return [(candidate, count, score) for score, candidate, count in best]
+
+
+def rank_all(user_ids: Iterable[int], following: Mapping[int, Sequence[int]], bonus: Mapping[int, float],
+             popular: Sequence[int], top_n: int, max_fanout: int) -> Iterator[tuple[int, list]]:
+    for user_id in user_ids:
+        yield user_id, rank(user_id, following, bonus, popular, top_n, max_fanout)
+
+
+def _store(db: Session, chunk: list[tuple[int, list]], computed_at: datetime):
+    db.execute(delete(Suggestion).where(Suggestion.user_id.in_([user_id for user_id, _ in chunk])))
+    rows = [{"user_id": user_id, "suggested_id": candidate, "mutuals": count, "score": score,
+             "computed_at": computed_at}
+            for user_id, ranked in chunk for candidate, count, score in ranked]
+    if rows:
+        db.execute(insert(Suggestion), rows)
+    db.commit()
+
+
+def build_suggestions(db: Session, top_n: Optional[int] = None, max_fanout: Optional[int] = None) -> dict[str, int]:
+    """Recomputes the suggestions of every user. Returns the user and stored suggestion counts"""
+    top_n = top_n or settings.SUGGESTION_COUNT
+    max_fanout = max_fanout or settings.SUGGESTION_MAX_FANOUT
+    now = utc_now()
+
+    graph = FollowGraph()
+    edges = db.execute(select(Follow.follower_id, Follow.followed_id).execution_options(yield_per=10000))
+    graph.load((row.follower_id, row.followed_id) for row in edges)
+
+    last_posts = dict(db.execute(select(Post.user_id, func.max(Post.created_at)).group_by(Post.user_id)).all())
+    users = db.execute(select(User.id, User.follower_count)).all()
+    bonus = {user_id: activity(last_posts.get(user_id), now) for user_id, _ in users}
+    # twice the count, to still top up the users who follow some of them
+    popular = [user_id for user_id, _ in heapq.nlargest(top_n * 2, users, key=lambda user: user.follower_count)]
+    db.rollback()
+
+    counts = {"users": 0, "suggestions": 0}
+    chunk = []
+    for user_id, ranked in rank_all((user_id for user_id, _ in users), graph.following, bonus, popular,
+                                    top_n, max_fanout):
+        chunk.append((user_id, ranked))
+        counts["users"] += 1
+        counts["suggestions"] += len(ranked)
+        if len(chunk) == CHUNK_SIZE:
+            _store(db, chunk, now)
+            chunk = []
+    if chunk:
+        _store(db, chunk, now)
+    return counts
+
+
+if __name__ == "__main__":
+    from app.core.database import SessionLocal
+
+    session = SessionLocal()
+    try:
+        counts = build_suggestions(session)
+        print(f"{counts['suggestions']} suggestions stored for {counts['users']} users")
+    finally:
+        session.close()
@@ -0,0 +1,145 @@
+"""Sweeper of the upload files no post, profile nor upload row references anymore.
+
+Posts deleted and profile pictures replaced before the reference counting of app.services.storage
+left their files behind, and so does an upload whose transaction failed after writing them. The
+sweeper walks the upload folder with scandir, never holding the whole listing, and checks the files
+by batches with three indexed IN lookups (post.image_url, utilisateur.profile_picture, upload.name).
+
+Files modified within the grace period are skipped: an upload writes its files before committing
+the row that references them. A content-named orphan gets an upload row with no reference and is
+removed by storage.purge(), under the row lock that orders it with a concurrent upload of the same
+bytes. The flat uuid names of the older uploads are never reused, their orphans are removed directly.
+
+Batches are separated by a pause to keep the load on the database and the disk low. Run it from
+cron, with --dry-run first to see what it would remove:
+
+    python -m app.services.sweeper --dry-run
+"""
+import argparse
+import os
+import time
+from typing import Iterator
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.core.database import upsert
+from app.core.images import RENDITIONS, is_content_name
+from app.core.utils import UPLOAD_FOLDER
+from app.models.models import Post, User, Upload
+from app.services import storage
+
+# never swept: the default profile picture is referenced by a column default, not by a row
+KEEP = {".gitignore", "default.jpg"}
+
+
+def walk(folder: str, relative: str = "") -> Iterator[tuple[str, os.stat_result]]:
+    """Relative path and stat of every file under `folder`, lazily"""
+    with os.scandir(os.path.join(folder, relative)) as entries:
+        for entry in entries:
+            path = f"{relative}{entry.name}"
+            if entry.is_dir(follow_symlinks=False):
+                yield from walk(folder, f"{path}/")
+            elif entry.is_file(follow_symlinks=False):
+                yield path, entry.stat(follow_symlinks=False)
+
+
+def picture_of(path: str) -> str:
+    """Name of the picture a file belongs to: its full JPEG for a rendition, the file itself otherwise"""
+    parts = path.rsplit(".", 2)
+    if len(parts) == 3 and parts[1] in RENDITIONS:
+        return f"{parts[0]}.jpg"
+    return path
+
+
+def referenced(db: Session, names: set[str]) -> set[str]:
+    """The names still used by a post, a profile or an upload row"""
+    found = set(db.scalars(select(Post.image_url).where(Post.image_url.in_(names))))
+    found.update(db.scalars(select(User.profile_picture).where(User.profile_picture.in_(names))))
+    found.update(db.scalars(select(Upload.name).where(Upload.name.in_(names))))
+    return found
+
+
+def _batches(files: Iterator[tuple[str, os.stat_result]], size: int) -> Iterator[list[tuple[str, os.stat_result]]]:
+    batch = []
+    for file in files:
+        batch.append(file)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def sweep(db: Session, folder: str = UPLOAD_FOLDER, grace: float = 86400, batch_size: int = 1000,
+          pause: float = 0.2, dry_run: bool = False, sample_size: int = 20) -> dict:
+    """Removes the orphan files older than `grace` seconds, or only reports them with `dry_run`"""
+    report = {"scanned": 0, "skipped_recent": 0, "orphan_files": 0, "orphan_bytes": 0, "removed_files": 0, "sample": []}
+    horizon = time.time() - grace
+    for index, batch in enumerate(_batches(walk(folder), batch_size)):
+        if index and pause:
+            time.sleep(pause)
+        report["scanned"] += len(batch)
+        candidates = []
+        for path, stat_result in batch:
+            if path in KEEP:
+                continue
+            if stat_result.st_mtime > horizon:
+                report["skipped_recent"] += 1
+                continue
+            candidates.append((path, stat_result))
+
+        # leftovers of interrupted writes are not pictures, the others are looked up by picture
+        names = {picture_of(path) for path, _ in candidates if not path.endswith(".tmp")}
+        used = referenced(db, names) if names else set()
+        db.commit()
+        orphans = [(path, stat_result) for path, stat_result in candidates if picture_of(path) not in used]
+
+        report["orphan_files"] += len(orphans)
+        report["orphan_bytes"] += sum(stat_result.st_size for _, stat_result in orphans)
+        report["sample"].extend(path for path, _ in orphans[:sample_size - len(report["sample"])])
+        if dry_run:
+            continue
+
+        adopted = {picture_of(path) for path, _ in orphans if is_content_name(picture_of(path))}
+        if adopted:
+            for name in adopted:
+                db.execute(upsert(db, Upload).values(name=name, ref_count=0).on_conflict_do_nothing())
+            db.commit()
+            storage.purge(db, adopted)
+        for path, _ in orphans:
+            full = os.path.join(folder, path)
+            if picture_of(path) not in adopted:
+                try:
+                    os.remove(full)
+                except FileNotFoundError:
+                    pass
+            if not os.path.exists(full):
+                report["removed_files"] += 1
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dry-run", action="store_true", help="only report the orphan files")
+    parser.add_argument("--grace", type=float, default=86400, help="seconds before a file can be swept")
+    parser.add_argument("--batch-size", type=int, default=1000, help="files checked per round of queries")
+    parser.add_argument("--pause", type=float, default=0.2, help="seconds between two batches")
+    args = parser.parse_args()
+
+    from app.core.database import SessionLocal
+
+    session = SessionLocal()
+    try:
+        report = sweep(session, grace=args.grace, batch_size=args.batch_size, pause=args.pause, dry_run=args.dry_run)
+    finally:
+        session.close()
+    print(f"{report['scanned']} files scanned, {report['skipped_recent']} within the grace period")
+    print(f"{report['orphan_files']} orphan files ({report['orphan_bytes'] / 1024 / 1024:.1f} MiB)")
+    print("would be removed, e.g.:" if args.dry_run else f"{report['removed_files']} removed, e.g.:")
+    for path in report["sample"]:
+        print(f"  {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+from typing import Optional
+
+from sqlalchemy import func, delete, insert, literal, select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.utils import decode_cursor
+from app.models.models import Post, User, Follow, Timeline
+from app.services import feed
+
+TIMELINE_COLUMNS = ['user_id', 'post_id', 'author_id', 'created_at']
+
+
+def fan_out_on_read_authors(db: Session, user_id: int) -> list[int]:
+    """Followed accounts with too many followers to be fanned out on write, their posts are pulled at read time"""
+    rows = (db.query(Follow.followed_id)
+            .join(User, User.id == Follow.followed_id)
+            .filter(Follow.follower_id == user_id,
+                    User.follower_count > settings.TIMELINE_FANOUT_MAX_FOLLOWERS)
+            .all())
+    return [r.followed_id for r in rows]
+
+
+def fans_out(db: Session, author_id: int) -> bool:
+    """True if the posts of the author are pushed into the timelines of their followers"""
+    followers = db.query(User.follower_count).filter(User.id == author_id).scalar()
+    return followers <= settings.TIMELINE_FANOUT_MAX_FOLLOWERS
+
+
+def push_post(db: Session, post: Post):
+    """Fan-out on write: copy a new post into the timeline of every follower of its author, in one statement"""
+    if not fans_out(db, post.user_id):
+        return
+    rows = (select(Follow.follower_id, Post.id, Post.user_id, Post.created_at)
+            .join(Post, Post.user_id == Follow.followed_id)
+            .where(Post.id == post.id))
+    db.execute(insert(Timeline).from_select(TIMELINE_COLUMNS, rows))
+
+
+def backfill_author(db: Session, user_id: int, author_id: int):
+    """After a follow: copy the latest posts of the followed author into the follower's timeline"""
+    if not fans_out(db, author_id):
+        return
+    latest = (select(Follow.follower_id, Post.id, Post.user_id, Post.created_at)
+              .join(Post, Post.user_id == Follow.followed_id)
+              .where(Follow.follower_id == user_id, Follow.followed_id == author_id)
+              .order_by(Post.created_at.desc(), Post.id.desc())
+              .limit(settings.TIMELINE_BACKFILL_SIZE))
+    db.execute(insert(Timeline).from_select(TIMELINE_COLUMNS, latest))
+
+
+def backfill_authors(db: Session, user_id: int, author_ids: list[int]):
+    """backfill_author for many followed authors in one statement, after a bulk follow"""
+    if not author_ids:
+        return
+    position = func.row_number().over(
+        partition_by=Post.user_id,
+        order_by=(Post.created_at.desc(), Post.id.desc())
+    ).label("position")
+    ranked = (select(Post.id, Post.user_id, Post.created_at, position)
+              .join(User, User.id == Post.user_id)
+              .where(Post.user_id.in_(author_ids), User.follower_count <= settings.TIMELINE_FANOUT_MAX_FOLLOWERS)
+              .subquery())
+    latest = (select(literal(user_id), ranked.c.id, ranked.c.user_id, ranked.c.created_at)
+              .where(ranked.c.position <= settings.TIMELINE_BACKFILL_SIZE))
+    db.execute(insert(Timeline).from_select(TIMELINE_COLUMNS, latest))
+
+
+def remove_author(db: Session, user_id: int, author_id: int):
+    """After an unfollow: drop the posts of the author from the ex-follower's timeline"""
+    db.execute(delete(Timeline).where(Timeline.user_id == user_id, Timeline.author_id == author_id))
+
+
+def remove_post(db: Session, post_id: int):
+    db.execute(delete(Timeline).where(Timeline.post_id == post_id))
+
+
+def home_rows(db: Session, user_id: int, cursor: Optional[str], limit: int):
+    """Post rows of one page of the home feed: an indexed range read of the materialized timeline,
+        merged with the posts pulled from the followed accounts that are not fanned out"""
+    after = decode_cursor(cursor)
+    materialized = (feed.post_query(db)
+                    .join(Timeline, Timeline.post_id == Post.id)
+                    .filter(Timeline.user_id == user_id, Post.hidden_tag == False))
+    rows = feed.page_rows(materialized, after, limit, key=(Timeline.created_at, Timeline.post_id))
+
+    pulled_authors = fan_out_on_read_authors(db, user_id)
+    if pulled_authors:
+        pulled = (feed.post_query(db)
+                  .filter(Post.user_id.in_(pulled_authors), Post.hidden_tag == False))
+        seen = {r.Post.id for r in rows}
+        rows += [r for r in feed.page_rows(pulled, after, limit) if r.Post.id not in seen]
+        rows.sort(key=lambda r: (r.Post.created_at, r.Post.id), reverse=True)
+
+    return feed.cut_page(rows[:limit + 1], limit)
+
+
+def rebuild_timelines(db: Session) -> int:
+    """Rebuilds every timeline from the follow graph with the latest posts of each fanned out author.
+        Used to backfill existing data and to repair timelines after a change of the fan-out threshold"""
+    followers = (select(Follow.followed_id, func.count(Follow.id).label("followers"))
+                 .group_by(Follow.followed_id)
+                 .subquery())
+    ranked = (select(Post.id, Post.user_id, Post.created_at,
+                     func.row_number().over(
+                         partition_by=Post.user_id,
+                         order_by=(Post.created_at.desc(), Post.id.desc())
+                     ).label("position"))
+              .join(followers, followers.c.followed_id == Post.user_id)
+              .where(followers.c.followers <= settings.TIMELINE_FANOUT_MAX_FOLLOWERS)
+              .subquery())
+    rows = (select(Follow.follower_id, ranked.c.id, ranked.c.user_id, ranked.c.created_at)
+            .join(ranked, ranked.c.user_id == Follow.followed_id)
+            .where(ranked.c.position <= settings.TIMELINE_BACKFILL_SIZE))
+    db.execute(delete(Timeline))
+    result = db.execute(insert(Timeline).from_select(TIMELINE_COLUMNS, rows))
+    db.commit()
+    return result.rowcount
+
+
+if __name__ == "__main__":
+    from app.core.database import SessionLocal
+
+    session = SessionLocal()
+    try:
+        print(f"{rebuild_timelines(session)} timeline entries written")
+    finally:
+        session.close()
@@ -0,0 +1,46 @@
+"""What the current user sees on the cards of a page: the posts they liked, the users they follow and the users following them.
+
+Whatever the size of the page, it takes three queries: one for the likes and one per direction of
+the follows. The follows are not read from the graph index of app.services.graph: it only sees the
+follows of the other workers at its next sync, and the viewer's own edges must be current.
+"""
+from typing import Iterable, NamedTuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.models.models import Follow, Like
+from app.schemas.user import PostViewerState, UserViewerState
+
+
+class ViewerState(NamedTuple):
+    liked: set[int]
+    # users followed by the viewer, and users following the viewer
+    following: set[int]
+    followers: set[int]
+
+    def user(self, user_id: int) -> UserViewerState:
+        following, followed_by = user_id in self.following, user_id in self.followers
+        return UserViewerState(following=following, followed_by=followed_by, mutual=following and followed_by)
+
+    def post(self, post_id: int, author_id: int) -> PostViewerState:
+        return PostViewerState(liked=post_id in self.liked, author=self.user(author_id))
+
+    def version(self) -> tuple:
+        """For the ETag of a page carrying the flags"""
+        return tuple(sorted(ids) for ids in self)
+
+
+def viewer_state(db: Session, viewer_id: int, post_ids: Iterable[int], user_ids: Iterable[int]) -> ViewerState:
+    post_ids, user_ids = set(post_ids), set(user_ids)
+    liked = set(db.scalars(select(Like.post_id).where(Like.user_id == viewer_id, Like.post_id.in_(post_ids)))) \
+        if post_ids else set()
+    if not user_ids:
+        return ViewerState(liked=liked, following=set(), followers=set())
+    return ViewerState(
+        liked=liked,
+        following=set(db.scalars(select(Follow.followed_id)
+                                 .where(Follow.follower_id == viewer_id, Follow.followed_id.in_(user_ids)))),
+        followers=set(db.scalars(select(Follow.follower_id)
+                                 .where(Follow.followed_id == viewer_id, Follow.follower_id.in_(user_ids)))),
+    )
@@ -0,0 +1,73 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import NullPool
+from starlette.testclient import TestClient
+
+from app.core.config import settings
+from app.core.database import async_database_url, get_db
+from app.main import app
+from app.models.models import User, Post
+
+
+@pytest.fixture(name="user_data")
+def user_data() -> dict[str, str]:
+    return {
+        "username": "testasync",
+        "email": "testasync@example.com",
+        "password": "supermegapasswordyipi"
+    }
+
+
+@pytest.fixture(name="aware_datetimes")
+def aware_datetimes(client: TestClient):
+    """The routes on AsyncSession (DATABASE_ASYNC) for the test, yields the aware datetimes they bind"""
+    # a new event loop per request in the test client: no connection kept across them
+    engine = create_async_engine(async_database_url(settings.DATABASE_URL_TEST), poolclass=NullPool)
+    aware = []
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def check_parameters(conn, cursor, statement, parameters, context, executemany):
+        for row in (parameters if executemany else [parameters]):
+            values = row.values() if isinstance(row, dict) else row
+            aware.extend(v for v in values if isinstance(v, datetime) and v.tzinfo is not None)
+
+    sessions = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+
+    async def get_async_db():
+        async with sessions() as db:
+            yield db
+
+    previous = app.dependency_overrides.get(get_db)
+    app.dependency_overrides[get_db] = get_async_db
+    yield aware
+    if previous is None:
+        app.dependency_overrides.pop(get_db, None)
+    else:
+        app.dependency_overrides[get_db] = previous
+
+
+def test_async_sessions_bind_naive_datetimes(client: TestClient, session_db, user_data: dict[str, str],
+                                             aware_datetimes: list):
+    """The writes of the routes through an AsyncSession, checked for the aware datetimes asyncpg
+        refuses to bind to the DateTime columns"""
+    client.post("/auth/register", json=user_data)
+    client.post("/auth/register", json={**user_data, "username": "other", "email": "other@example.com"})
+    login = client.post("/auth/login", json={"username": user_data["username"], "password": user_data["password"]})
+    assert login.status_code == 200
+    headers = {"Authorization": f"Bearer {login.json()['token']}"}
+
+    other = session_db.query(User).filter_by(username="other").first()
+    post = Post(user_id=other.id, image_url="o.jpg")
+    session_db.add(post)
+    session_db.commit()
+
+    assert client.put("/follow/other", headers=headers).status_code == 200
+    assert client.post(f"/like/{post.id}", headers=headers).status_code == 200
+    assert client.delete(f"/like/{post.id}", headers=headers).status_code == 200
+    assert client.put("/follow/unfollow/other", headers=headers).status_code == 200
+    assert client.post("/follow/many", json={"usernames": ["other"]}, headers=headers).json()["count"] == 1
+    assert client.post("/auth/refresh", json={"refresh_token": login.json()["refresh_token"]}).status_code == 200
+    assert not aware_datetimes
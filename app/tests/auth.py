@@ -1,7 +1,12 @@
 import pytest
 from starlette.testclient import TestClient
 
+from app.core import passwords
+from app.core.revocations import revoked_sessions
+from app.core.tokens import verified_tokens
+from app.models.models import User
 from app.schemas.auth import AuthResponse
+from app.services import sessions
 
 
 @pytest.fixture(name="user_data")
@@ -77,3 +82,68 @@ def test_token_validation(client: TestClient, auth_token: str):
     response = client.post("/auth/token", json={"token": auth_token})
     assert response.status_code == 200
     assert response.json() == {"valid": True}
+
+
+def test_verified_token_cache(client: TestClient, auth_token: str, monkeypatch):
+    assert client.post("/auth/token", json={"token": auth_token}).status_code == 200
+    # served from the cache: the signature is not checked again
+    monkeypatch.setattr("app.core.utils.jwt.decode", lambda *args, **kwargs: pytest.fail("token verified twice"))
+    assert client.post("/auth/token", json={"token": auth_token}).status_code == 200
+    assert verified_tokens.hits >= 1
+
+    verified_tokens.revoke(auth_token)
+    assert client.post("/auth/token", json={"token": auth_token}).status_code == 401
+    assert client.get("/user/profile", headers={"Authorization": f"Bearer {auth_token}"}).status_code == 400
+
+
+def test_login_rehashes_outdated_password(client: TestClient, registered_user: dict[str, str], session_db, monkeypatch):
+    user = session_db.query(User).filter_by(username=registered_user["username"]).first()
+    assert "m=65536,t=3,p=4" in user.password_hash
+
+    monkeypatch.setattr(passwords, "hasher", passwords.hasher.using(rounds=2, memory_cost=19456, parallelism=1))
+    response = client.post("/auth/login", json={"username": registered_user["username"],
+                                                "password": registered_user["password"]})
+    assert response.status_code == 200
+    session_db.expire_all()
+    assert "m=19456,t=2,p=1" in session_db.get(User, user.id).password_hash
+
+    response = client.post("/auth/login", json={"username": registered_user["username"], "password": "wrong"})
+    assert response.status_code == 401
+
+
+def test_login_password_pool_saturated(client: TestClient, registered_user: dict[str, str], monkeypatch):
+    monkeypatch.setattr(passwords.password_pool, "max_pending", 0)
+    response = client.post("/auth/login", json={
+        "username": registered_user["username"],
+        "password": registered_user["password"]
+    })
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(passwords.password_pool.retry_after)
+    assert response.json()["detail"] == "Too many logins in progress, retry later"
+
+
+def test_refresh_and_logout(client: TestClient, authenticated_user: AuthResponse, session_db):
+    assert authenticated_user.refresh_token and authenticated_user.expires_in == 15 * 60
+    response = client.post("/auth/refresh", json={"refresh_token": authenticated_user.refresh_token})
+    assert response.status_code == 200
+    tokens = response.json()
+    headers = {"Authorization": f"Bearer {tokens['token']}"}
+    assert client.get("/user/profile", headers=headers).status_code != 400
+
+    # rotated: the first refresh token is spent, presenting it again revokes the session
+    assert client.post("/auth/refresh", json={"refresh_token": authenticated_user.refresh_token}).status_code == 401
+    assert client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]}).status_code == 401
+    assert client.get("/user/profile", headers=headers).status_code == 400
+
+
+def test_logout_reaches_other_workers(client: TestClient, authenticated_user: AuthResponse, session_db):
+    headers = {"Authorization": f"Bearer {authenticated_user.token}"}
+    assert client.post("/auth/logout", headers=headers).status_code == 200
+    assert client.post("/auth/token", json={"token": authenticated_user.token}).status_code == 401
+    assert client.post("/auth/refresh", json={"refresh_token": authenticated_user.refresh_token}).status_code == 401
+
+    # a worker that did not serve the logout learns it at its next sync
+    revoked_sessions.clear()
+    assert client.post("/auth/token", json={"token": authenticated_user.token}).status_code == 200
+    revoked_sessions.replace(sessions.recent_revocations(session_db))
+    assert client.post("/auth/token", json={"token": authenticated_user.token}).status_code == 401
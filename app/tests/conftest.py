@@ -4,8 +4,12 @@ from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, Session
 from starlette.testclient import TestClient
 
+from app.core.cache import response_cache
 from app.core.config import settings
 from app.core.database import get_db
+from app.core.revocations import revoked_sessions
+from app.core.tokens import verified_tokens
+from app.services.graph import follow_graph
 from app.models.models import Base
 from app.main import app
 
@@ -28,6 +32,10 @@ def client_fixture(session_db: Session):
     def get_session_override():
         return session_db
     app.dependency_overrides[get_db] = get_session_override # Override de la FONCTION de dépendance pas d'une instance (oui)
+    response_cache.clear()
+    verified_tokens.clear()
+    revoked_sessions.clear()
+    follow_graph.clear()
     client = TestClient(app)
     yield client
     app.dependency_overrides.clear()
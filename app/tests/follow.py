@@ -1,7 +1,16 @@
+import io
+from datetime import datetime
+
 import pytest
+from PIL import Image
+from sqlalchemy import event
 from starlette.testclient import TestClient
 
+from app.models.models import User, Follow, Post
 from app.schemas.auth import AuthResponse
+from app.services import graph
+from app.services.counters import repair_counters
+from app.services.suggestions import build_suggestions
 
 
 @pytest.fixture(name="user_data")
@@ -169,3 +178,218 @@ def test_remove_follower(
     assert response.json()["message"] == "Follower removed successfully"
 
 
+
+
+def test_personal_feed_follows_the_timeline(
+        client: TestClient,
+        auth_headers: dict[str, str],
+        client_data: dict[str, str]
+):
+    # client_data publie deux posts
+    client.post("/auth/register", json=client_data)
+    login_response = client.post("/auth/login", json={
+        "username": client_data["username"],
+        "password": client_data["password"]
+    })
+    client_headers = {"Authorization": f"Bearer {login_response.json()['token']}"}
+    for caption in ["before follow", "after follow"]:
+        if caption == "after follow":
+            client.put(f"/follow/{client_data['username']}", headers=auth_headers)
+        image = io.BytesIO()
+        Image.new("RGB", (10, 10), color="white").save(image, "JPEG")
+        image.seek(0)
+        client.post("/post/upload", headers=client_headers, data={"caption": caption},
+                    files={"file": ("test.jpg", image, "image/jpeg")})
+
+    # le post d'avant le follow est backfill, celui d'apres est fan-out
+    feed = client.get("/post/feed", headers=auth_headers).json()
+    assert [p["caption"] for p in feed["content"]] == ["after follow", "before follow"]
+
+    client.put(f"/follow/unfollow/{client_data['username']}", headers=auth_headers)
+    assert client.get("/post/feed", headers=auth_headers).json()["content"] == []
+
+
+def test_follow_counters_and_repair(
+        client: TestClient,
+        session_db,
+        auth_headers: dict[str, str],
+        registered_user: dict[str, str],
+        client_data: dict[str, str]
+):
+    client.post("/auth/register", json=client_data)
+    client.put(f"/follow/{client_data['username']}", headers=auth_headers)
+
+    profile = client.get(f"/user/profile/{client_data['username']}", headers=auth_headers).json()
+    assert profile["follower_count"] == 1
+    assert client.get("/user/profile", headers=auth_headers).json()["following_count"] == 1
+
+    # on fausse le compteur puis le job de reparation le recalcule
+    session_db.query(User).filter_by(username=client_data["username"]).update({"follower_count": 42})
+    session_db.commit()
+    assert repair_counters(session_db)["utilisateur.follower_count"] == 1
+    assert client.get(f"/follow/get-follow/{client_data['username']}").json()["count"] == 1
+
+    client.put(f"/follow/unfollow/{client_data['username']}", headers=auth_headers)
+    assert client.get(f"/follow/get-follow/{client_data['username']}").json()["count"] == 0
+
+
+def test_followers_pages(client: TestClient, registered_user: dict[str, str], session_db):
+    celebrity = session_db.query(User).filter_by(username=registered_user["username"]).first()
+    fans = [User(username=f"fan{i}", email=f"fan{i}@example.com", password_hash="x") for i in range(5)]
+    session_db.add_all(fans)
+    session_db.flush()
+    # same created_at for every follow: the id breaks the tie
+    at = datetime(2026, 1, 1)
+    session_db.add_all([Follow(follower_id=fan.id, followed_id=celebrity.id, created_at=at) for fan in fans])
+    celebrity.follower_count = 5
+    session_db.commit()
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        data = client.get(f"/follow/get-follow/{celebrity.username}", params=params).json()
+        assert data["count"] == 5
+        seen += [f["username"] for f in data["followers"]]
+        cursor = data["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == [f"fan{i}" for i in reversed(range(5))]
+
+    data = client.get("/follow/get-followed/fan0").json()
+    assert [f["username"] for f in data["followed"]] == [celebrity.username]
+    assert data["next_cursor"] is None
+
+
+def test_follow_graph_index(client: TestClient, auth_headers: dict[str, str], registered_user, client_data, session_db):
+    client.post("/auth/register", json=client_data)
+    me = session_db.query(User).filter_by(username=registered_user["username"]).first().id
+    other = session_db.query(User).filter_by(username=client_data["username"]).first().id
+
+    # before the first load, the checks query the database
+    assert graph.follows_many(session_db, me, [other]) == set()
+    client.put(f"/follow/{client_data['username']}", headers=auth_headers)
+    assert graph.follows_many(session_db, me, [other, 999]) == {other}
+
+    graph.load_graph(session_db)
+    assert graph.follow_graph.ready and graph.follow_graph.follows(me, other)
+    assert graph.followers_among(session_db, other, [me, 999]) == {me}
+
+    # the writes committed by the worker are applied to the index
+    client.put(f"/follow/unfollow/{client_data['username']}", headers=auth_headers)
+    assert graph.follows_many(session_db, me, [other]) == set()
+    client.put(f"/follow/{client_data['username']}", headers=auth_headers)
+    assert graph.follow_graph.following_of(me).tolist() == [other]
+
+
+def test_follow_graph_load_keeps_writes_before_snapshot(session_db):
+    def commit_before_snapshot(conn, cursor, statement, *args):
+        # a follow committed by the worker as the snapshot query starts, the snapshot does not see it
+        if "FROM follow" in statement:
+            graph.follow_graph.apply(True, 1, 2)
+
+    engine = session_db.get_bind()
+    event.listen(engine, "before_cursor_execute", commit_before_snapshot)
+    try:
+        graph.load_graph(session_db)
+    finally:
+        event.remove(engine, "before_cursor_execute", commit_before_snapshot)
+    assert graph.follow_graph.follows(1, 2)
+
+
+def test_suggestions(client: TestClient, auth_headers: dict[str, str], registered_user, session_db):
+    me = session_db.query(User).filter_by(username=registered_user["username"]).first()
+    a, b, c, d, e, f = users = [User(username=name, email=f"{name}@example.com", password_hash="x")
+                                for name in ("a", "b", "c", "d", "e", "f")]
+    session_db.add_all(users)
+    session_db.flush()
+    session_db.add_all([Follow(follower_id=me.id, followed_id=a.id), Follow(follower_id=me.id, followed_id=b.id),
+                        Follow(follower_id=a.id, followed_id=c.id), Follow(follower_id=b.id, followed_id=c.id),
+                        Follow(follower_id=a.id, followed_id=d.id), Follow(follower_id=b.id, followed_id=e.id)])
+    # d and e have one mutual each, d posted recently
+    session_db.add(Post(user_id=d.id, image_url="d.jpg"))
+    # no mutual: a popular account topping up the list
+    f.follower_count = 100
+    session_db.commit()
+
+    counts = build_suggestions(session_db, top_n=4)
+    assert counts["users"] == 7
+    data = client.get("/user/suggestions", headers=auth_headers).json()
+    assert [(u["username"], u["mutuals"]) for u in data["user"]] == [("c", 2), ("d", 1), ("e", 1), ("f", 0)]
+
+    # accounts followed since the job ran are left out
+    client.put("/follow/d", headers=auth_headers)
+    data = client.get("/user/suggestions", params={"limit": 2}, headers=auth_headers).json()
+    assert [u["username"] for u in data["user"]] == ["c", "e"]
+    assert client.get("/user/suggestions").status_code == 401
+
+
+def test_viewer_state(client: TestClient, auth_headers: dict[str, str], registered_user, session_db):
+    me = session_db.query(User).filter_by(username=registered_user["username"]).first()
+    a, b, c = users = [User(username=name, email=f"{name}@example.com", password_hash="x") for name in ("a", "b", "c")]
+    session_db.add_all(users)
+    session_db.flush()
+    # a is mutual, b is only followed, c only follows me
+    session_db.add_all([Follow(follower_id=me.id, followed_id=a.id), Follow(follower_id=a.id, followed_id=me.id),
+                        Follow(follower_id=me.id, followed_id=b.id), Follow(follower_id=c.id, followed_id=me.id)])
+    posts = [Post(user_id=a.id, image_url="a.jpg"), Post(user_id=b.id, image_url="b.jpg")]
+    session_db.add_all(posts)
+    session_db.commit()
+    client.post(f"/like/{posts[0].id}", headers=auth_headers)
+
+    payload = {"post_ids": [p.id for p in posts], "user_ids": [a.id, b.id, c.id]}
+    data = client.post("/user/viewer-state", json=payload, headers=auth_headers).json()
+    assert data["posts"] == {str(posts[0].id): {"liked": True, "author": None},
+                             str(posts[1].id): {"liked": False, "author": None}}
+    assert data["users"] == {str(a.id): {"following": True, "followed_by": True, "mutual": True},
+                             str(b.id): {"following": True, "followed_by": False, "mutual": False},
+                             str(c.id): {"following": False, "followed_by": True, "mutual": False}}
+    too_many = {"user_ids": list(range(101))}
+    assert client.post("/user/viewer-state", json=too_many, headers=auth_headers).status_code == 422
+
+    content = client.get("/post/feed/global", params={"viewer": True}, headers=auth_headers).json()["content"]
+    flags = {p["id"]: p["viewer"] for p in content}
+    assert flags[posts[0].id] == {"liked": True, "author": {"following": True, "followed_by": True, "mutual": True}}
+    assert flags[posts[1].id]["liked"] is False and not flags[posts[1].id]["author"]["mutual"]
+    assert all(p["viewer"] is None for p in client.get("/post/feed/global", headers=auth_headers).json()["content"])
+    assert client.get("/post/feed", params={"viewer": True}, headers=auth_headers).status_code == 200
+
+
+def test_follow_many(client: TestClient, auth_headers: dict[str, str], registered_user, session_db):
+    me = session_db.query(User).filter_by(username=registered_user["username"]).first()
+    users = [User(username=f"contact{i}", email=f"contact{i}@example.com", password_hash="x") for i in range(3)]
+    session_db.add_all(users)
+    session_db.flush()
+    session_db.add(Post(user_id=users[1].id, image_url="c1.jpg"))
+    session_db.commit()
+    client.put("/follow/contact0", headers=auth_headers)
+
+    # already followed, unknown and own usernames are skipped
+    payload = {"usernames": ["contact0", "contact1", "contact2", "nobody", registered_user["username"]]}
+    data = client.post("/follow/many", json=payload, headers=auth_headers).json()
+    assert sorted(data["followed"]) == [users[1].id, users[2].id] and data["count"] == 2
+    assert client.post("/follow/many", json=payload, headers=auth_headers).json()["count"] == 0
+
+    session_db.expire_all()
+    assert me.following_count == 3 and [u.follower_count for u in users] == [1, 1, 1]
+    assert [p["user_id"] for p in client.get("/post/feed", headers=auth_headers).json()["content"]] == [users[1].id]
+
+    assert client.put("/follow/unfollow/contact1", headers=auth_headers).status_code == 200
+    assert client.put("/follow/unfollow/contact1", headers=auth_headers).json()["detail"] == "Follow query not found"
+    assert client.put("/follow/unfollow/nobody", headers=auth_headers).json()["detail"] == "User not found"
+    session_db.expire_all()
+    assert me.following_count == 2 and users[1].follower_count == 0
+
+
+def test_viewer_state_follows_from_other_workers(client: TestClient, auth_headers: dict[str, str], registered_user,
+                                                 session_db):
+    me = session_db.query(User).filter_by(username=registered_user["username"]).first()
+    other = User(username="a", email="a@example.com", password_hash="x")
+    session_db.add(other)
+    session_db.commit()
+    graph.load_graph(session_db)
+
+    # committed by another worker: this worker's index only sees it at its next sync
+    session_db.add_all([Follow(follower_id=me.id, followed_id=other.id), Follow(follower_id=other.id, followed_id=me.id)])
+    session_db.commit()
+    data = client.post("/user/viewer-state", json={"user_ids": [other.id]}, headers=auth_headers).json()
+    assert data["users"] == {str(other.id): {"following": True, "followed_by": True, "mutual": True}}
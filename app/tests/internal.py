@@ -0,0 +1,43 @@
+import pytest
+from starlette.testclient import TestClient
+
+from app.models.models import User
+
+
+@pytest.fixture(name="user_data")
+def user_data() -> dict[str, str]:
+    return {
+        "username": "testadmin",
+        "email": "testadmin@example.com",
+        "password": "supermegapasswordyipi"
+    }
+
+
+@pytest.fixture(name="auth_headers")
+def auth_headers(client: TestClient, user_data: dict[str, str]) -> dict[str, str]:
+    """Fixture qui retourne les headers d'authentification prets à utiliser."""
+    client.post("/auth/register", json=user_data)
+    response = client.post("/auth/login", json={
+        "username": user_data["username"],
+        "password": user_data["password"]
+    })
+    return {"Authorization": f"Bearer {response.json()['token']}"}
+
+
+def test_pool_metrics_admin_only(client: TestClient, auth_headers: dict[str, str]):
+    response = client.get("/internal/pool", headers=auth_headers)
+    assert response.status_code == 403
+
+
+def test_pool_metrics(client: TestClient, session_db, auth_headers: dict[str, str], user_data: dict[str, str]):
+    session_db.query(User).filter_by(username=user_data["username"]).update({"is_admin": True})
+    session_db.commit()
+
+    response = client.get("/internal/pool", headers=auth_headers)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["pid"]
+    primary = data["pools"]["primary"]
+    for key in ("size", "checked_out", "overflow", "checkouts", "wait_avg_ms", "wait_max_ms", "timeouts"):
+        assert key in primary
+
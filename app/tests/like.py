@@ -1,5 +1,6 @@
 import pytest
 from starlette.testclient import TestClient
+from app.models.models import Post, User
 from app.schemas.auth import AuthResponse
 
 
@@ -113,3 +114,22 @@ def test_get_post_likes(client: TestClient, auth_headers: dict, created_post: di
     assert isinstance(data["users"], list)
     assert len(data["users"]) == 1
     assert "username" in data["users"][0]
+
+
+def test_like_writes_are_single_statements(client: TestClient, auth_headers: dict, registered_user, session_db):
+    author = session_db.query(User).filter_by(username=registered_user["username"]).first()
+    post = Post(user_id=author.id, image_url="p.jpg")
+    session_db.add(post)
+    session_db.commit()
+
+    assert client.post(f"/like/{post.id}", headers=auth_headers).status_code == 200
+    response = client.post(f"/like/{post.id}", headers=auth_headers)
+    assert response.status_code == 400 and response.json()["detail"] == "You have already liked this post"
+    assert client.post("/like/999", headers=auth_headers).json()["detail"] == "Post not found"
+    session_db.refresh(post)
+    assert post.like_count == 1
+
+    assert client.delete(f"/like/{post.id}", headers=auth_headers).json()["post_id"] == post.id
+    assert client.delete(f"/like/{post.id}", headers=auth_headers).json()["detail"] == "Like not found"
+    session_db.refresh(post)
+    assert post.like_count == 0
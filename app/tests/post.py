@@ -1,9 +1,21 @@
 import io
+import os
+from fnmatch import fnmatch
 
 import pytest
 from PIL import Image
 from fastapi.testclient import TestClient
-
+from sqlalchemy import event, create_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.core import database
+from app.core.cache import RedisBackend, response_cache
+from app.core.config import settings
+from app.core.images import image_pool, transcode, draft_size, RENDITIONS
+from app.core.replicas import ReplicaSet, recent_writers
+from app.core.utils import UPLOAD_FOLDER
+from app.models.models import Base, User, Post, Upload, Comment
+from app.services import sweeper, placeholders
 from app.schemas.auth import AuthResponse
 from app.schemas.post import FeedResponse, PostDetailResponse, FeedDetailResponse
 
@@ -69,6 +81,8 @@ def test_upload_post(client: TestClient, auth_headers: dict[str, str], picture):
     data = response.json()
     assert "image_url" in data
     assert "caption" in data
+    assert (data["width"], data["height"]) == (10, 10)
+    assert len(data["blurhash"]) == 28
 
 
 def test_global_feed(client: TestClient, auth_headers: dict):
@@ -159,3 +173,360 @@ def test_post_details(client: TestClient, auth_headers: dict, picture):
     assert str(detail.post.id) == post_id
     assert isinstance(detail.likes, dict)
     assert isinstance(detail.comments, dict)
+
+
+def test_global_feed_cursor_pagination(client: TestClient, auth_headers: dict):
+    for i in range(3):
+        image = io.BytesIO()
+        Image.new("RGB", (10, 10), color="white").save(image, "JPEG")
+        image.seek(0)
+        client.post(
+            "/post/upload",
+            headers=auth_headers,
+            data={"caption": f"page {i}"},
+            files={"file": ("test.jpg", image, "image/jpeg")}
+        )
+
+    first = FeedResponse(**client.get("/post/feed/global?limit=2", headers=auth_headers).json())
+    assert [p.caption for p in first.content] == ["page 2", "page 1"]
+    assert first.next_cursor
+
+    second = FeedResponse(**client.get(
+        f"/post/feed/global?limit=2&cursor={first.next_cursor}", headers=auth_headers).json())
+    assert [p.caption for p in second.content] == ["page 0"]
+    assert second.next_cursor is None
+
+
+def test_global_feed_invalid_cursor(client: TestClient, auth_headers: dict):
+    response = client.get("/post/feed/global?cursor=not-a-cursor", headers=auth_headers)
+    assert response.status_code == 400
+
+
+@pytest.fixture(name="query_counter")
+def query_counter(session_db: Session):
+    """Fixture qui compte les requetes SQL envoyees a la db de test."""
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = session_db.get_bind()
+    event.listen(engine, "before_cursor_execute", count)
+    yield statements
+    event.remove(engine, "before_cursor_execute", count)
+
+
+def test_feeds_query_count_does_not_grow_with_page_size(
+        client: TestClient,
+        auth_headers: dict,
+        registered_user: dict,
+        query_counter: list
+):
+    post_ids = []
+    for i in range(10):
+        image = io.BytesIO()
+        Image.new("RGB", (10, 10), color="white").save(image, "JPEG")
+        image.seek(0)
+        response = client.post(
+            "/post/upload",
+            headers=auth_headers,
+            data={"caption": f"post {i}"},
+            files={"file": ("test.jpg", image, "image/jpeg")}
+        )
+        post_ids.append(response.json()["id"])
+    for post_id in post_ids:
+        client.post(f"/like/{post_id}", headers=auth_headers)
+        client.post(f"/comment/{post_id}", headers=auth_headers, json={"content": "first"})
+        client.post(f"/comment/{post_id}", headers=auth_headers, json={"content": "second"})
+        client.post(f"/comment/{post_id}", headers=auth_headers, json={"content": "third"})
+
+    query_counter.clear()
+    response = client.get("/post/feed/global?limit=50", headers=auth_headers)
+    assert response.status_code == 200
+    feed = FeedResponse(**response.json())
+    assert len(feed.content) == 10
+    assert all(p.likes_count == 1 and p.comments_count == 3 for p in feed.content)
+    assert [c.content for c in feed.content[0].comments_preview] == ["third", "second"]
+    assert len(query_counter) <= 2
+
+    query_counter.clear()
+    response = client.get(f"/post/feed/{registered_user['username']}", headers=auth_headers)
+    assert response.status_code == 200
+    detail = FeedDetailResponse(**response.json())
+    assert len(detail.content) == 10
+    assert all(len(p.likes) == 1 and len(p.comments) == 3 for p in detail.content)
+    assert len(query_counter) <= 4
+
+
+def test_delete_post_with_likes_and_comments(client: TestClient, auth_headers: dict, picture):
+    upload_response = client.post(
+        "/post/upload",
+        headers=auth_headers,
+        data={"caption": "To delete"},
+        files=picture
+    )
+    post_id = upload_response.json()["id"]
+    client.post(f"/like/{post_id}", headers=auth_headers)
+    client.post(f"/comment/{post_id}", headers=auth_headers, json={"content": "bye"})
+
+    delete_response = client.delete(f"/post/delete/{post_id}", headers=auth_headers)
+    assert delete_response.status_code == 200
+    assert client.get(f"/post/{post_id}", headers=auth_headers).status_code == 404
+
+
+@pytest.fixture(name="lagging_replica")
+def lagging_replica(monkeypatch, tmp_path):
+    """Replica that never receives the writes of the primary"""
+    replica = create_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    Base.metadata.create_all(bind=replica)
+    monkeypatch.setattr(database, "replicas", ReplicaSet([replica]))
+    monkeypatch.setattr(database, "replica_sessions", [sessionmaker(bind=replica)])
+    yield replica
+    replica.dispose()
+
+
+def test_reads_stay_on_primary_after_a_write(
+        client: TestClient,
+        auth_headers: dict,
+        registered_user: dict,
+        session_db: Session,
+        lagging_replica,
+        picture,
+        monkeypatch
+):
+    # get_db is overridden by the test session, give it the user like get_db does
+    session_db.info["user_id"] = session_db.query(User.id).filter_by(username=registered_user["username"]).scalar()
+    client.post("/post/upload", headers=auth_headers, data={"caption": "fresh"}, files=picture)
+
+    response = client.get(f"/post/feed/{registered_user['username']}", headers=auth_headers)
+    assert [p["post"]["caption"] for p in response.json()["content"]] == ["fresh"]
+
+    monkeypatch.setattr(recent_writers, "until", {})
+    response = client.get(f"/post/feed/{registered_user['username']}", headers=auth_headers)
+    assert response.status_code == 403
+
+
+def test_global_feed_cache_renders_on_replica(
+        client: TestClient,
+        auth_headers: dict,
+        registered_user: dict,
+        session_db: Session,
+        lagging_replica,
+        picture,
+        monkeypatch
+):
+    session_db.info["user_id"] = session_db.query(User.id).filter_by(username=registered_user["username"]).scalar()
+    client.post("/post/upload", headers=auth_headers, data={"caption": "fresh"}, files=picture)
+
+    # the writer renders the page from the primary, the others then get it from the cache
+    response = client.get("/post/feed/global", headers=auth_headers)
+    assert [p["caption"] for p in response.json()["content"]] == ["fresh"]
+    monkeypatch.setattr(recent_writers, "until", {})
+    response = client.get("/post/feed/global", headers=auth_headers)
+    assert [p["caption"] for p in response.json()["content"]] == ["fresh"]
+
+    # a miss renders from the replica
+    response_cache.clear()
+    assert client.get("/post/feed/global", headers=auth_headers).json()["content"] == []
+
+
+def test_global_feed_cache(client: TestClient, auth_headers: dict, picture):
+    upload_response = client.post("/post/upload", headers=auth_headers, data={"caption": "cached"}, files=picture)
+    post_id = upload_response.json()["id"]
+
+    first = client.get("/post/feed/global", headers=auth_headers)
+    hits = response_cache.hits
+    second = client.get("/post/feed/global", headers=auth_headers)
+    assert response_cache.hits == hits + 1
+    assert second.json() == first.json()
+
+    client.post(f"/like/{post_id}", headers=auth_headers)
+    response = client.get("/post/feed/global", headers=auth_headers)
+    assert response.json()["content"][0]["likes_count"] == 1
+
+
+class BrokenBackend:
+    """Shared cache backend that is down"""
+    def __getattr__(self, name):
+        def fail(*args):
+            raise ConnectionError("cache backend down")
+        return fail
+
+
+def test_global_feed_cache_backend_down(client: TestClient, auth_headers: dict, picture, monkeypatch):
+    monkeypatch.setattr(response_cache, "shared", BrokenBackend())
+    upload_response = client.post("/post/upload", headers=auth_headers, data={"caption": "cached"}, files=picture)
+    post_id = upload_response.json()["id"]
+
+    client.get("/post/feed/global", headers=auth_headers)
+    response = client.post(f"/like/{post_id}", headers=auth_headers)
+    assert response.status_code == 200
+    response = client.get("/post/feed/global", headers=auth_headers)
+    assert response.json()["content"][0]["likes_count"] == 1
+    assert response_cache.errors > 0
+
+
+class FakeRedis(dict):
+    def scan_iter(self, match, count):
+        return [key for key in list(self) if fnmatch(key, match)]
+
+    def delete(self, *keys):
+        for key in keys:
+            self.pop(key, None)
+
+
+def test_redis_cache_clear_keeps_other_keys():
+    backend = RedisBackend.__new__(RedisBackend)
+    backend.client = FakeRedis({f"{RedisBackend.PREFIX}version:feed": 3, f"{RedisBackend.PREFIX}feed@3": b"[]",
+                                "session:42": b"x"})
+    backend.clear()
+    assert backend.client == {"session:42": b"x"}
+
+
+def test_post_details_etag(client: TestClient, auth_headers: dict, picture):
+    upload_response = client.post("/post/upload", headers=auth_headers, data={"caption": "polled"}, files=picture)
+    post_id = upload_response.json()["id"]
+
+    etag = client.get(f"/post/{post_id}", headers=auth_headers).headers["ETag"]
+    response = client.get(f"/post/{post_id}", headers={**auth_headers, "If-None-Match": etag})
+    assert response.status_code == 304
+
+    comment_id = client.post(f"/comment/{post_id}", headers=auth_headers, json={"content": "first"}).json()["id"]
+    response = client.get(f"/post/{post_id}", headers={**auth_headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+
+    client.patch(f"/comment/{comment_id}", headers=auth_headers, json={"content": "edited"})
+    response = client.get(f"/post/{post_id}", headers={**auth_headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["comments"][0]["content"] == "edited"
+
+
+def test_post_etag_covers_commenters(client: TestClient, auth_headers: dict, session_db: Session):
+    author = User(username="author", email="author@example.com", password_hash="x")
+    commenter = User(username="commenter", email="commenter@example.com", password_hash="x")
+    session_db.add_all([author, commenter])
+    session_db.flush()
+    post = Post(user_id=author.id, image_url="c.jpg")
+    session_db.add(post)
+    session_db.flush()
+    session_db.add(Comment(user_id=commenter.id, post_id=post.id, content="hello"))
+    session_db.commit()
+
+    etag = client.get(f"/post/{post.id}", headers=auth_headers).headers["ETag"]
+    commenter.username = "renamed"
+    session_db.commit()
+    response = client.get(f"/post/{post.id}", headers={**auth_headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["comments"][0]["user"]["username"] == "renamed"
+
+
+def test_personal_feed_etag(client: TestClient, auth_headers: dict):
+    response = client.get("/post/feed", headers=auth_headers)
+    assert response.status_code == 200
+    response = client.get("/post/feed", headers={**auth_headers, "If-None-Match": response.headers["ETag"]})
+    assert response.status_code == 304
+
+
+def test_upload_post_image_pool_saturated(client: TestClient, auth_headers: dict, picture, monkeypatch):
+    monkeypatch.setattr(image_pool, "max_pending", 0)
+    response = client.post("/post/upload", headers=auth_headers, data={"caption": "later"}, files=picture)
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(image_pool.retry_after)
+    assert response.json()["detail"] == "Too many uploads in progress, retry later"
+
+
+def test_same_picture_stored_once(client: TestClient, auth_headers: dict, session_db: Session):
+    def upload():
+        image = io.BytesIO()
+        Image.new("RGB", (64, 48), color="blue").save(image, "JPEG")
+        image.seek(0)
+        return client.post("/post/upload", headers=auth_headers, data={"caption": "same"},
+                           files={"file": ("same.jpg", image, "image/jpeg")}).json()
+
+    first, second = upload(), upload()
+    assert first["image_url"] == second["image_url"]
+    name = first["image_url"]
+    assert name.split("/")[:2] == [name.split("/")[2][:2], name.split("/")[2][2:4]]
+    assert session_db.get(Upload, name).ref_count == 2
+
+    client.delete(f"/post/delete/{first['id']}", headers=auth_headers)
+    assert os.path.exists(os.path.join(UPLOAD_FOLDER, name))
+    client.delete(f"/post/delete/{second['id']}", headers=auth_headers)
+    session_db.expire_all()
+    assert session_db.get(Upload, name) is None
+    assert not os.path.exists(os.path.join(UPLOAD_FOLDER, name))
+
+
+def test_upload_too_large(client: TestClient, auth_headers: dict, picture, monkeypatch):
+    monkeypatch.setattr(settings, "UPLOAD_MAX_BYTES", 100)
+    response = client.post("/post/upload", headers=auth_headers, data={"caption": "big"}, files=picture)
+    assert response.status_code == 413
+
+    def chunks():
+        yield b"x" * 64
+        yield b"x" * 64
+    response = client.post("/post/upload", headers={**auth_headers, "Content-Type": "multipart/form-data; boundary=b"},
+                           content=chunks())
+    assert response.status_code == 413
+
+
+def test_upload_too_many_pixels(client: TestClient, auth_headers: dict, monkeypatch):
+    monkeypatch.setattr(settings, "IMAGE_MAX_PIXELS", 1000)
+    image = io.BytesIO()
+    Image.new("RGB", (64, 48), color="red").save(image, "JPEG")
+    image.seek(0)
+    response = client.post("/post/upload", headers=auth_headers, data={"caption": "wide"},
+                           files={"file": ("wide.jpg", image, "image/jpeg")})
+    assert response.status_code == 413
+
+
+def test_transcode_jpeg_in_draft_mode():
+    image = io.BytesIO()
+    Image.new("RGB", (4000, 3000), color="green").save(image, "JPEG")
+    assert draft_size((4000, 3000), RENDITIONS["full"]) == (1440, 1080)
+    picture = transcode(image.getvalue())
+    with Image.open(io.BytesIO(picture.files[picture.name])) as full:
+        assert full.size == (1440, 1080)
+
+
+def test_sweep_orphan_files(client: TestClient, auth_headers: dict, picture, session_db: Session, tmp_path):
+    used = client.post("/post/upload", headers=auth_headers, data={"caption": "kept"}, files=picture).json()["image_url"]
+    files = [used, "old.jpg", "old.thumb.jpg", "ab/cd/" + "0" * 64 + ".jpg.1f2e.tmp", "recent.jpg", "default.jpg"]
+    for name in files:
+        (tmp_path / name).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / name).write_bytes(b"jpeg")
+        if name != "recent.jpg":
+            os.utime(tmp_path / name, (0, 0))
+
+    report = sweeper.sweep(session_db, str(tmp_path), grace=3600, batch_size=2, pause=0, dry_run=True)
+    assert (report["scanned"], report["skipped_recent"], report["orphan_files"]) == (6, 1, 3)
+    assert all((tmp_path / name).exists() for name in files)
+
+    report = sweeper.sweep(session_db, str(tmp_path), grace=3600, batch_size=2, pause=0)
+    assert report["removed_files"] == 3
+    assert sorted(str(p.relative_to(tmp_path)) for p in tmp_path.rglob("*") if p.is_file()) == \
+        sorted([used, "recent.jpg", "default.jpg"])
+
+
+def test_backfill_placeholders(client: TestClient, auth_headers: dict, picture, session_db: Session):
+    post_id = client.post("/post/upload", headers=auth_headers, data={"caption": "old"}, files=picture).json()["id"]
+    expected = session_db.get(Post, post_id).blurhash
+    session_db.query(Post).update({Post.width: None, Post.height: None, Post.blurhash: None})
+    session_db.add(Post(image_url="gone.jpg", user_id=session_db.get(Post, post_id).user_id))
+    session_db.commit()
+
+    assert placeholders.backfill_placeholders(session_db, batch_size=1) == {"filled": 1, "missing": 1}
+    post = session_db.get(Post, post_id)
+    assert (post.width, post.height, post.blurhash) == (10, 10, expected)
+
+
+def test_backfill_placeholders_skips_decompression_bombs(client: TestClient, auth_headers: dict, picture,
+                                                         session_db: Session, monkeypatch):
+    client.post("/post/upload", headers=auth_headers, data={"caption": "old"}, files=picture)
+    session_db.query(Post).update({Post.width: None, Post.height: None, Post.blurhash: None})
+    session_db.commit()
+    # past twice MAX_IMAGE_PIXELS, PIL refuses to open the 10x10 picture
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 10)
+
+    assert placeholders.backfill_placeholders(session_db) == {"filled": 0, "missing": 1}
@@ -1,7 +1,11 @@
 import io
+from datetime import datetime
 from uuid import UUID
 from PIL import Image
 
+from app.core.config import settings
+from app.models.models import User
+
 # Helpers
 def register_and_login(client):
     client.post("/auth/register", json={
@@ -73,6 +77,60 @@ def test_upload_profile_picture(client):
     assert data["message"] == "File uploaded successfully"
 
 
+def test_profile_picture_renditions(client):
+    token, _ = register_and_login(client)
+
+    file = io.BytesIO()
+    Image.new("RGB", (800, 600), color="red").save(file, "JPEG")
+    file.seek(0)
+    response = client.post(
+        "/user/upload-profile-picture",
+        headers=auth_header(token),
+        files={"file": ("profile.jpg", file, "image/jpeg")}
+    )
+    url = response.json()["file_url"]
+
+    response = client.get(f"{url}?size=thumb")
+    assert response.headers["content-type"] == "image/jpeg"
+    assert Image.open(io.BytesIO(response.content)).size == (320, 240)
+
+    response = client.get(f"{url}?size=medium", headers={"Accept": "image/webp,image/*"})
+    assert response.headers["content-type"] == "image/webp"
+    assert Image.open(io.BytesIO(response.content)).size == (800, 600)
+
+    assert client.get(f"{url}?size=huge").status_code == 422
+
+
+def test_profile_picture_caching(client, monkeypatch):
+    token, _ = register_and_login(client)
+
+    file = io.BytesIO()
+    Image.new("RGB", (40, 30), color="green").save(file, "JPEG")
+    file.seek(0)
+    url = client.post(
+        "/user/upload-profile-picture",
+        headers=auth_header(token),
+        files={"file": ("profile.jpg", file, "image/jpeg")}
+    ).json()["file_url"]
+
+    response = client.get(url)
+    assert response.headers["cache-control"] == "public, max-age=31536000, immutable"
+    etag, size = response.headers["etag"], len(response.content)
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+    assert client.get(url, headers={"If-Modified-Since": response.headers["last-modified"]}).status_code == 304
+
+    response = client.get(url, headers={"Range": "bytes=0-9"})
+    assert response.status_code == 206
+    assert response.headers["content-range"] == f"bytes 0-9/{size}"
+
+    assert client.get("/user/picture/default.jpg").headers["cache-control"] == "public, no-cache"
+
+    monkeypatch.setattr(settings, "STATIC_SENDFILE", "x-accel-redirect")
+    response = client.get(url)
+    assert response.headers["x-accel-redirect"] == "/_uploads/" + url.removeprefix("/user/picture/")
+    assert response.content == b""
+
+
 def test_get_profile_by_username(client):
     token, _ = register_and_login(client)
 
@@ -82,6 +140,46 @@ def test_get_profile_by_username(client):
     assert data["username"] == "testuser"
 
 
+def test_get_profile_by_username_etag(client):
+    token, _ = register_and_login(client)
+
+    response = client.get("/user/profile/testuser", headers=auth_header(token))
+    etag = response.headers["ETag"]
+    assert etag.startswith('W/"')
+
+    response = client.get("/user/profile/testuser", headers={**auth_header(token), "If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+    client.post("/user/edit", headers=auth_header(token), json={
+        "username": None, "email": None, "bio": "changed", "website": None, "gender": None
+    })
+    response = client.get("/user/profile/testuser", headers={**auth_header(token), "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["bio"] == "changed"
+    assert response.headers["ETag"] != etag
+
+
+
+def test_profile_etag_follows_writes_of_other_workers(client, session_db):
+    token, user_id = register_and_login(client)
+    etag = client.get("/user/profile/testuser", headers=auth_header(token)).headers["ETag"]
+
+    # written behind the stamps of this worker, like another worker or the counter repair would
+    user = session_db.get(User, user_id)
+    user.follower_count = 7
+    user.updated_at = datetime(2030, 1, 1)
+    session_db.commit()
+
+    response = client.get("/user/profile/testuser", headers={**auth_header(token), "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["follower_count"] == 7
+    assert response.headers["ETag"] != etag
+    response = client.get("/user/profile/testuser",
+                          headers={**auth_header(token), "If-None-Match": response.headers["ETag"]})
+    assert response.status_code == 304
+
+
 def test_get_profile_by_username_not_found(client):
     token, _ = register_and_login(client)
 
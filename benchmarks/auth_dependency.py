@@ -0,0 +1,54 @@
+"""Cost of the jwt_user_id dependency per request, verifying every token vs the verified-token cache.
+
+Replays the Authorization header of a few sessions on a Starlette Request, without a server, so
+only the dependency is measured:
+
+    python -m benchmarks.auth_dependency --sessions 100 --requests 200000
+"""
+import argparse
+import datetime
+import time
+
+import jwt
+from starlette.requests import Request
+
+from app.core import utils
+from app.core.config import settings
+from app.core.tokens import VerifiedTokens
+
+
+def request_for(token: str) -> Request:
+    return Request({"type": "http", "headers": [(b"authorization", f"Bearer {token}".encode())]})
+
+
+def measure(requests: list[Request], count: int) -> float:
+    """Microseconds per call of the dependency"""
+    start = time.perf_counter()
+    for i in range(count):
+        utils.jwt_user_id(requests[i % len(requests)])
+    return (time.perf_counter() - start) / count * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=100, help="distinct tokens replayed")
+    parser.add_argument("--requests", type=int, default=200000)
+    args = parser.parse_args()
+
+    exp = datetime.datetime.now(datetime.UTC) + datetime.timedelta(days=1)
+    requests = [request_for(jwt.encode({"id": i, "exp": exp}, settings.SECRET_KEY, algorithm="HS256"))
+                for i in range(1, args.sessions + 1)]
+
+    utils.verified_tokens = VerifiedTokens(0, 0)
+    uncached = measure(requests, args.requests)
+    utils.verified_tokens = VerifiedTokens(settings.JWT_CACHE_SIZE, settings.JWT_CACHE_TTL)
+    cached = measure(requests, args.requests)
+
+    print(f"{args.requests} requests over {args.sessions} sessions")
+    print(f"verify every token: {uncached:.2f} us/request")
+    print(f"verified-token cache: {cached:.2f} us/request ({uncached / cached:.1f}x, "
+          f"{utils.verified_tokens.hits} hits, {utils.verified_tokens.misses} misses)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Requests/sec and latency of an endpoint at high concurrency against a running API.
+
+Start the API once per mode and compare the numbers, e.g. with 4 workers like the Dockerfile:
+
+    DATABASE_ASYNC=false uvicorn app.main:app --port 5000 --workers 4
+    python -m benchmarks.load_test --url http://127.0.0.1:5000 --concurrency 200 --duration 30
+
+    DATABASE_ASYNC=true uvicorn app.main:app --port 5000 --workers 4
+    python -m benchmarks.load_test --url http://127.0.0.1:5000 --concurrency 200 --duration 30
+
+The user is registered on first run, the requests are authenticated with its token.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+
+async def login(client: httpx.AsyncClient, username: str, password: str) -> str:
+    await client.post("/auth/register", json={
+        "username": username, "email": f"{username}@example.com", "password": password
+    })
+    response = await client.post("/auth/login", json={"username": username, "password": password})
+    response.raise_for_status()
+    return response.json()["token"]
+
+
+async def worker(client: httpx.AsyncClient, path: str, headers: dict, deadline: float,
+                 latencies: list[float], errors: list[int]):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            response = await client.get(path, headers=headers)
+            if response.status_code >= 400:
+                errors.append(response.status_code)
+        except httpx.HTTPError:
+            errors.append(0)
+        latencies.append(time.perf_counter() - start)
+
+
+async def run(args):
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=60) as client:
+        headers = {"Authorization": f"Bearer {await login(client, args.username, args.password)}"}
+        latencies, errors = [], []
+        deadline = time.perf_counter() + args.duration
+        await asyncio.gather(*(
+            worker(client, args.path, headers, deadline, latencies, errors)
+            for _ in range(args.concurrency)
+        ))
+
+    latencies.sort()
+    print(f"{args.path} concurrency={args.concurrency} duration={args.duration}s")
+    print(f"requests: {len(latencies)}  errors: {len(errors)}  req/s: {len(latencies) / args.duration:.1f}")
+    if latencies:
+        print(f"latency p50: {statistics.median(latencies) * 1000:.1f} ms  "
+              f"p99: {latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f} ms  "
+              f"max: {latencies[-1] * 1000:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--path", default="/post/feed/global")
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--duration", type=int, default=30, help="seconds")
+    parser.add_argument("--username", default="loadtest")
+    parser.add_argument("--password", default="loadtestpassword")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Bytes fetched from the database per request, blanket lazy='joined' vs per-route loader profiles.
+
+The "before" numbers replay the old mapping (User.posts, Post.likes, Post.comments and
+Conversation.messages all joined eagerly) with explicit joinedload options on the same data.
+Runs on an in-memory SQLite database, the byte count is the size of every value of every
+row the driver hands back to SQLAlchemy.
+
+    python -m benchmarks.loading_strategies --users 20 --posts 10 --likes 10 --comments 5
+"""
+import argparse
+import sqlite3
+
+from sqlalchemy import create_engine
+from sqlalchemy.pool import StaticPool
+from sqlalchemy.orm import sessionmaker, joinedload
+
+from app.models import loading
+from app.models.models import Base, User, Post, Like, Comment, Conversation, Message
+
+FETCHED = {"rows": 0, "bytes": 0}
+
+
+def _measure(rows):
+    for row in rows:
+        FETCHED["rows"] += 1
+        FETCHED["bytes"] += sum(len(str(v).encode()) for v in row if v is not None)
+    return rows
+
+
+class MeasuringCursor(sqlite3.Cursor):
+    def fetchone(self):
+        row = super().fetchone()
+        return _measure([row])[0] if row is not None else None
+
+    def fetchmany(self, size=None):
+        return _measure(super().fetchmany(self.arraysize if size is None else size))
+
+    def fetchall(self):
+        return _measure(super().fetchall())
+
+
+class MeasuringConnection(sqlite3.Connection):
+    def cursor(self, factory=MeasuringCursor):
+        return super().cursor(factory)
+
+
+OLD_USER = (
+    joinedload(User.posts).joinedload(Post.likes),
+    joinedload(User.posts).joinedload(Post.comments),
+)
+OLD_POST = (joinedload(Post.likes), joinedload(Post.comments))
+OLD_CONVERSATION = (joinedload(Conversation.messages),)
+
+
+def seed(db, users: int, posts: int, likes: int, comments: int):
+    db.add_all([User(username=f"user{u}", email=f"user{u}@example.com", password_hash="x" * 97)
+                for u in range(users)])
+    db.flush()
+    for u in range(1, users + 1):
+        for p in range(posts):
+            post = Post(image_url=f"{u}_{p}.jpg", caption="caption " * 10, user_id=u)
+            db.add(post)
+            db.flush()
+            db.add_all([Like(user_id=(u + i) % users + 1, post_id=post.id) for i in range(likes)])
+            db.add_all([Comment(content="nice picture " * 5, user_id=(u + i) % users + 1, post_id=post.id)
+                        for i in range(comments)])
+    conversation = Conversation(user1_id=1, user2_id=2)
+    db.add(conversation)
+    db.flush()
+    db.add_all([Message(conversation_id=conversation.id, sender_id=1 + i % 2, content="hello " * 10)
+                for i in range(200)])
+    db.commit()
+
+
+def render_conversation(conversation):
+    return [conversation.user1.username, conversation.user2.username] + [m.sender.username for m in conversation.messages]
+
+
+def scenarios():
+    """(route, before, after): each callable runs the loads the route does for one request"""
+    return [
+        ("GET /user/profile (db.get(User))",
+         lambda db: db.get(User, 1, options=OLD_USER),
+         lambda db: db.get(User, 1)),
+        ("DELETE /post/delete/{id} (db.get(Post))",
+         lambda db: db.get(Post, 1, options=OLD_POST),
+         lambda db: db.get(Post, 1, options=loading.BARE)),
+        ("GET /like/liked-posts/{id}",
+         lambda db: db.query(Post).join(Like, Post.id == Like.post_id).filter(Like.user_id == 1)
+            # the old mapping also joined every post of each author, left out here as it does not fit in memory
+            .options(joinedload(Post.author), *OLD_POST).all(),
+         lambda db: db.query(Post).join(Like, Post.id == Like.post_id).filter(Like.user_id == 1)
+            .options(*loading.POST_WITH_AUTHOR).all()),
+        ("GET /message/conversation/{id}/content",
+         lambda db: render_conversation(db.query(Conversation).options(*OLD_CONVERSATION).filter_by(id=1).first()),
+         lambda db: render_conversation(
+             db.query(Conversation).options(*loading.CONVERSATION_WITH_MESSAGES).filter_by(id=1).first())),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--posts", type=int, default=10, help="posts per user")
+    parser.add_argument("--likes", type=int, default=10, help="likes per post")
+    parser.add_argument("--comments", type=int, default=5, help="comments per post")
+    args = parser.parse_args()
+
+    engine = create_engine(
+        "sqlite://",
+        creator=lambda: sqlite3.connect(":memory:", factory=MeasuringConnection, check_same_thread=False),
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(engine)
+    session_local = sessionmaker(bind=engine)
+    with session_local() as db:
+        seed(db, args.users, args.posts, args.likes, args.comments)
+
+    print(f"{'route':45} {'before':>14} {'after':>14} {'ratio':>8}")
+    for name, before, after in scenarios():
+        measured = []
+        for run in (before, after):
+            with session_local() as db:
+                FETCHED.update(rows=0, bytes=0)
+                run(db)
+                measured.append(dict(FETCHED))
+        ratio = measured[0]["bytes"] / max(measured[1]["bytes"], 1)
+        print(f"{name:45} {measured[0]['bytes']:>12} B {measured[1]['bytes']:>12} B {ratio:>7.1f}x")
+        print(f"{'':45} {measured[0]['rows']:>9} rows {measured[1]['rows']:>9} rows")
+
+
+if __name__ == "__main__":
+    main()
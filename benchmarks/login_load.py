@@ -0,0 +1,76 @@
+"""Login throughput and latency of a feed read during a burst of logins, against a running API.
+
+Run it on the current tree and on a tree hashing inline in the sync routes to compare the feed
+p99, with one worker so that every login lands on the probed process:
+
+    uvicorn app.main:app --port 5000 --workers 1
+    python -m benchmarks.login_load --url http://127.0.0.1:5000 --loggers 32 --duration 30
+
+Logins rejected while PASSWORD_QUEUE_MAX of them are in flight (503) are counted apart.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+from benchmarks.load_test import login
+from benchmarks.upload_load import percentile
+
+
+async def logger(client: httpx.AsyncClient, username: str, password: str, deadline: float,
+                 latencies: list[float], statuses: dict[int, int]):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        response = await client.post("/auth/login", json={"username": username, "password": password})
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        if response.status_code == 200:
+            latencies.append(time.perf_counter() - start)
+        elif response.status_code == 503:
+            await asyncio.sleep(float(response.headers.get("Retry-After", 1)))
+
+
+async def prober(client: httpx.AsyncClient, path: str, headers: dict, deadline: float, latencies: list[float]):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        await client.get(path, headers=headers)
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(0.01)
+
+
+async def run(args):
+    async with httpx.AsyncClient(base_url=args.url, timeout=120) as client:
+        headers = {"Authorization": f"Bearer {await login(client, args.username, args.password)}"}
+        logins, probes, statuses = [], [], {}
+        deadline = time.perf_counter() + args.duration
+        await asyncio.gather(
+            *(logger(client, args.username, args.password, deadline, logins, statuses) for _ in range(args.loggers)),
+            *(prober(client, args.probe, headers, deadline, probes) for _ in range(args.probers)),
+        )
+
+    logins.sort()
+    probes.sort()
+    print(f"{args.loggers} concurrent logins, {args.probers} probers of {args.probe}, {args.duration}s")
+    print(f"logins: {len(logins)} ok ({len(logins) / args.duration:.1f}/s)  statuses: {statuses}")
+    if logins:
+        print(f"login latency p50: {statistics.median(logins) * 1000:.1f} ms  p99: {percentile(logins, 0.99):.1f} ms")
+    if probes:
+        print(f"probe latency p50: {statistics.median(probes) * 1000:.1f} ms  p99: {percentile(probes, 0.99):.1f} ms  "
+              f"max: {probes[-1] * 1000:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--probe", default="/post/feed", help="endpoint measured during the logins")
+    parser.add_argument("--loggers", type=int, default=32)
+    parser.add_argument("--probers", type=int, default=4)
+    parser.add_argument("--duration", type=int, default=30, help="seconds")
+    parser.add_argument("--username", default="loadtest")
+    parser.add_argument("--password", default="loadtestpassword")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Follow suggestions on a synthetic graph: batch job duration, then the request read vs computing them per request.
+
+Builds a power-law graph (few accounts follow many, few accounts are followed by many) of --users
+users, in an in-memory SQLite database, then times:
+
+- the walk of app.services.suggestions over every user, without the writes;
+- for --sample users, the friends-of-friends query a request would run without the table, against
+  the single indexed read of the precomputed rows served by /user/suggestions.
+
+    python -m benchmarks.suggestions --users 100000 --sample 200
+"""
+import argparse
+import random
+import statistics
+import time
+from datetime import timedelta
+from itertools import accumulate
+
+from sqlalchemy import create_engine, func, insert, select
+from sqlalchemy.orm import Session, aliased
+
+from app.models.models import Base, Follow, Suggestion, User, utc_now
+from app.services.graph import FollowGraph
+from app.services.suggestions import activity, rank, rank_all
+from benchmarks.upload_load import percentile
+
+
+def synthetic_edges(users: int, mean_follows: float, seed: int) -> list[tuple[int, int]]:
+    """Follow counts drawn from a Pareto law, followed accounts from a Zipf-like popularity"""
+    rng = random.Random(seed)
+    popularity = list(accumulate(1 / (i + 1) ** 0.8 for i in range(users)))
+    edges = []
+    for follower in range(1, users + 1):
+        count = min(int(rng.paretovariate(1.6) * mean_follows * 0.4), users - 1)
+        followed = set(rng.choices(range(1, users + 1), cum_weights=popularity, k=count))
+        followed.discard(follower)
+        edges.extend((follower, other) for other in followed)
+    return edges
+
+
+def on_request(db: Session, user_id: int, top_n: int) -> list:
+    """What a request would run without the suggestion table"""
+    mine, theirs = aliased(Follow), aliased(Follow)
+    already = select(Follow.followed_id).where(Follow.follower_id == user_id)
+    return db.execute(
+        select(theirs.followed_id, func.count().label("mutuals"))
+        .join(mine, mine.followed_id == theirs.follower_id)
+        .where(mine.follower_id == user_id, theirs.followed_id != user_id, theirs.followed_id.not_in(already))
+        .group_by(theirs.followed_id)
+        .order_by(func.count().desc())
+        .limit(top_n)
+    ).all()
+
+
+def precomputed(db: Session, user_id: int) -> list:
+    return db.execute(
+        select(User.id, User.username, Suggestion.mutuals)
+        .join(Suggestion, Suggestion.suggested_id == User.id)
+        .where(Suggestion.user_id == user_id)
+        .order_by(Suggestion.score.desc())
+    ).all()
+
+
+def timed(fn, *args) -> float:
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--mean-follows", type=float, default=20)
+    parser.add_argument("--top", type=int, default=20, help="suggestions kept per user")
+    parser.add_argument("--max-fanout", type=int, default=2000)
+    parser.add_argument("--sample", type=int, default=200, help="users whose request reads are timed")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    edges = synthetic_edges(args.users, args.mean_follows, args.seed)
+    followers = {}
+    for _, followed in edges:
+        followers[followed] = followers.get(followed, 0) + 1
+    rng = random.Random(args.seed)
+    now = utc_now()
+    # a third of the accounts never posted, the others posted within the last 60 days
+    bonus = {user_id: activity(now - timedelta(days=rng.uniform(0, 60)), now) if rng.random() > 1 / 3 else 0.0
+             for user_id in range(1, args.users + 1)}
+    popular = sorted(followers, key=followers.get, reverse=True)[:args.top * 2]
+    print(f"{args.users} users, {len(edges)} follows, most followed account: {followers[popular[0]]} followers")
+
+    start = time.perf_counter()
+    graph = FollowGraph()
+    graph.load(edges)
+    loaded = time.perf_counter() - start
+    results = list(rank_all(range(1, args.users + 1), graph.following, bonus, popular, args.top, args.max_fanout))
+    walked = time.perf_counter() - start - loaded
+    stored = sum(len(ranked) for _, ranked in results)
+    print(f"batch: graph load {loaded:.1f} s, walk {walked:.1f} s ({walked / args.users * 1e6:.0f} us/user), "
+          f"graph {graph.metrics()['bytes'] / 2 ** 20:.1f} MiB, {stored} suggestions")
+
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine, tables=[User.__table__, Follow.__table__, Suggestion.__table__])
+    with Session(engine) as db:
+        db.execute(insert(User), [{"id": i, "username": f"u{i}", "email": f"u{i}@example.com", "password_hash": "x"}
+                                  for i in range(1, args.users + 1)])
+        db.execute(insert(Follow), [{"follower_id": a, "followed_id": b} for a, b in edges])
+        sample = rng.sample(range(1, args.users + 1), args.sample)
+        db.execute(insert(Suggestion), [{"user_id": user_id, "suggested_id": candidate, "mutuals": count, "score": score}
+                                        for user_id in sample
+                                        for candidate, count, score in rank(user_id, graph.following, bonus, popular,
+                                                                            args.top, args.max_fanout)])
+        db.commit()
+
+        live = sorted(timed(on_request, db, user_id, args.top) for user_id in sample)
+        read = sorted(timed(precomputed, db, user_id) for user_id in sample)
+    for name, latencies in (("friends-of-friends query per request", live), ("precomputed read", read)):
+        print(f"{name}: p50 {statistics.median(latencies) * 1000:.2f} ms  p99 {percentile(latencies, 0.99):.2f} ms  "
+              f"max {latencies[-1] * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Latency of an unrelated endpoint while concurrent uploads are transcoded, against a running API.
+
+Run it on the current tree and on a tree where the transcoding blocks the event loop to compare
+the p99 of the probe, e.g. with one worker so that every upload lands on the probed process:
+
+    uvicorn app.main:app --port 5000 --workers 1
+    python -m benchmarks.upload_load --url http://127.0.0.1:5000 --uploaders 16 --duration 30
+
+Rejected uploads (503 once IMAGE_QUEUE_MAX uploads are in flight) are counted apart from errors.
+"""
+import argparse
+import asyncio
+import io
+import statistics
+import time
+
+import httpx
+from PIL import Image
+
+from benchmarks.load_test import login
+
+
+def photo(width: int, height: int) -> bytes:
+    """Noisy JPEG, close to a camera picture for the decoder and the encoder"""
+    file = io.BytesIO()
+    Image.effect_noise((width, height), 64).convert("RGB").save(file, "JPEG", quality=90)
+    return file.getvalue()
+
+
+def percentile(values: list[float], ratio: float) -> float:
+    return values[max(0, int(len(values) * ratio) - 1)] * 1000
+
+
+async def uploader(client: httpx.AsyncClient, headers: dict, image: bytes, deadline: float,
+                   latencies: list[float], statuses: dict[int, int]):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        response = await client.post("/post/upload", headers=headers, data={"caption": "benchmark"},
+                                     files={"file": ("bench.jpg", image, "image/jpeg")})
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        if response.status_code == 200:
+            latencies.append(time.perf_counter() - start)
+        elif response.status_code == 503:
+            await asyncio.sleep(float(response.headers.get("Retry-After", 1)))
+
+
+async def prober(client: httpx.AsyncClient, path: str, deadline: float, latencies: list[float]):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        await client.get(path)
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(0.01)
+
+
+async def run(args):
+    image = photo(args.width, args.height)
+    async with httpx.AsyncClient(base_url=args.url, timeout=120) as client:
+        headers = {"Authorization": f"Bearer {await login(client, args.username, args.password)}"}
+        uploads, probes, statuses = [], [], {}
+        deadline = time.perf_counter() + args.duration
+        await asyncio.gather(
+            *(uploader(client, headers, image, deadline, uploads, statuses) for _ in range(args.uploaders)),
+            *(prober(client, args.probe, deadline, probes) for _ in range(args.probers)),
+        )
+
+    uploads.sort()
+    probes.sort()
+    print(f"{args.uploaders} uploaders of a {args.width}x{args.height} jpeg ({len(image) // 1024} KiB), "
+          f"{args.probers} probers of {args.probe}, {args.duration}s")
+    print(f"uploads: {len(uploads)} ok ({len(uploads) / args.duration:.1f}/s)  statuses: {statuses}")
+    if uploads:
+        print(f"upload latency p50: {statistics.median(uploads) * 1000:.1f} ms  p99: {percentile(uploads, 0.99):.1f} ms")
+    if probes:
+        print(f"probe latency p50: {statistics.median(probes) * 1000:.1f} ms  p99: {percentile(probes, 0.99):.1f} ms  "
+              f"max: {probes[-1] * 1000:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--probe", default="/version", help="endpoint measured during the uploads")
+    parser.add_argument("--uploaders", type=int, default=16)
+    parser.add_argument("--probers", type=int, default=4)
+    parser.add_argument("--width", type=int, default=4000)
+    parser.add_argument("--height", type=int, default=3000)
+    parser.add_argument("--duration", type=int, default=30, help="seconds")
+    parser.add_argument("--username", default="loadtest")
+    parser.add_argument("--password", default="loadtestpassword")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()